@@ -0,0 +1,422 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bioinf_tools import *
+from find_domains import aggregate_where_ligand, analyze_structure, format_log_block, Statistics_accumulator
+
+
+BENCHMARKS = ['parse', 'contacts', 'domains', 'aggregation', 'deduplication', 'pipeline']
+RESIDUE_NAMES = ['ALA', 'ARG', 'ASN', 'ASP', 'GLU', 'GLY', 'LEU', 'LYS', 'PHE', 'SER', 'THR', 'TRP', 'TYR', 'VAL']
+ATOM_NAMES = ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'CE', 'NZ', 'OG', 'SD', 'CZ', 'NE', 'OH']
+LIGAND_NAME = 'CLR'
+LIGAND_ATOMS_NUMBER = 28
+OFFLINE_PFAM_URL = 'http://127.0.0.1:9'                         # Adres, pod którym nie działa żaden serwer - benchmark nie korzysta z sieci
+
+
+# Funkcja pomocnicza - budująca syntetyczną strukturę: łańcuch reszt ułożonych wzdłuż osi X, nakładające się domeny
+# oraz ligandy rozmieszczone wzdłuż łańcucha (każdy ligand kontaktuje się z kilkoma resztami).
+def build_synthetic_structure(ligands_number : int) -> Structure:
+    structure = Structure('SYNT')
+    chain = Chain('A')
+    residues_number = 4 * ligands_number + 10
+
+    for residue_sequence_number in range(1, residues_number + 1):
+        residue = Residue('ALA', residue_sequence_number)
+        residue.push_atom(Atom('CA', 'C', 1.5 * residue_sequence_number, 0.0, 0.0))
+        residue.push_atom(Atom('CB', 'C', 1.5 * residue_sequence_number, 1.0, 0.0))
+        residue.push_atom(Atom('HA', 'H', 1.5 * residue_sequence_number, 0.0, 1.0))
+        chain.push_residue(residue)
+
+    structure.CHAINS.append(chain)
+
+    for start in range(1, residues_number, 50):
+        structure.PFAM_DOMAINS.append(Pfam_domain('A', 'PF00001', 'Synthetic_A', start, start + 59))
+        structure.PFAM_DOMAINS.append(Pfam_domain('A', 'PF00002', 'Synthetic_B', start, start + 99))
+
+    for ligand_index in range(ligands_number):
+        ligand = Ligand('CLR', ligand_index + 1)
+        ligand.push_atom(Atom('C1', 'C', 1.5 * (4 * ligand_index + 5), 2.0, 0.0))
+        structure.LIGANDS.append(ligand)
+
+    return structure
+
+
+# -------------------------------------------------------------------------------------------------------------
+
+
+# Funkcja pomocnicza - numer dostępu UniProt łańcucha syntetycznej struktury (łańcuchy o tym samym numerze dzielą architekturę domenową).
+def get_synthetic_accession(chain_index : int) -> str:
+    return 'S{:05d}'.format(chain_index)
+
+
+# Generator syntetycznych plików PDB: chains_number łańcuchów po residues_number reszt (atoms_per_residue ciężkich atomów w każdej reszcie,
+# reszty ułożone wzdłuż helisy) oraz ligand_copies kopii liganda CLR umieszczonych przy losowo wybranych resztach. Zwraca liczbę atomów.
+def generate_synthetic_PDB(pdb_file_path : str, structure_PDB_ID : str, chains_number : int, residues_number : int, ligand_copies : int, atoms_per_residue : int = 8, seed : int = 0) -> int:
+    generator = random.Random(seed)
+    chain_names = [chr(ord('A') + chain_index % 26) for chain_index in range(chains_number)]
+    grid_size = math.ceil(math.sqrt(chains_number))
+    lines = [f'HEADER    SYNTHETIC                               01-JAN-20   {structure_PDB_ID}']
+    serial = 0
+
+    for (chain_index, chain_name) in enumerate(chain_names):
+        accession = get_synthetic_accession(chain_index)
+        lines.append('DBREF  {:<4} {}{:>5}{:>6}  UNP    {:<8} {:<12}{:>5}{:>7}'.format(structure_PDB_ID, chain_name, 1, residues_number, accession, accession + '_SYN', 1, residues_number))
+
+    def atom_line(record : str, atom_name : str, residue_name : str, chain_name : str, residue_sequence_number : int, x : float, y : float, z : float) -> str:
+        atom_name = atom_name if len(atom_name) == 4 else ' ' + atom_name
+        return '{:<6}{:>5} {:<4} {:>3} {}{:>4}    {:>8.3f}{:>8.3f}{:>8.3f}  1.00 20.00          {:>2}'.format(
+            record, serial % 100000, atom_name, residue_name, chain_name, residue_sequence_number, x, y, z, atom_name.strip()[0])
+
+    CA_POSITIONS : list[list[tuple[float, float, float]]] = []
+    for (chain_index, chain_name) in enumerate(chain_names):
+        # Oś helisy łańcucha - łańcuchy rozmieszczone w siatce co 20 A.
+        (axis_x, axis_y) = (20.0 * (chain_index % grid_size), 20.0 * (chain_index // grid_size))
+        CA_POSITIONS.append([])
+
+        for residue_sequence_number in range(1, residues_number + 1):
+            angle = math.radians(100.0 * residue_sequence_number)
+            (ca_x, ca_y, ca_z) = (axis_x + 2.3 * math.cos(angle), axis_y + 2.3 * math.sin(angle), 1.5 * residue_sequence_number)
+            CA_POSITIONS[-1].append( (ca_x, ca_y, ca_z) )
+            residue_name = RESIDUE_NAMES[generator.randrange(len(RESIDUE_NAMES))]
+
+            for atom_index in range(atoms_per_residue):
+                serial += 1
+                if atom_index == 1:
+                    (x, y, z) = (ca_x, ca_y, ca_z)
+                else:
+                    (x, y, z) = (ca_x + generator.uniform(-2.5, 2.5), ca_y + generator.uniform(-2.5, 2.5), ca_z + generator.uniform(-1.0, 1.0))
+                lines.append(atom_line('ATOM', ATOM_NAMES[atom_index % len(ATOM_NAMES)], residue_name, chain_name, residue_sequence_number, x, y, z))
+
+        serial += 1
+        lines.append('TER   {:>5}      {:>3} {}{:>4}'.format(serial % 100000, residue_name, chain_name, residues_number))
+
+    for ligand_index in range(ligand_copies):
+        chain_index = generator.randrange(chains_number)
+        (ca_x, ca_y, ca_z) = CA_POSITIONS[chain_index][generator.randrange(residues_number)]
+        (center_x, center_y, center_z) = (ca_x + 6.0, ca_y, ca_z)
+
+        for atom_index in range(LIGAND_ATOMS_NUMBER):
+            serial += 1
+            lines.append(atom_line('HETATM', f'C{atom_index + 1}', LIGAND_NAME, chain_names[chain_index], 900 + ligand_index,
+                center_x + generator.uniform(-3.0, 3.0), center_y + generator.uniform(-3.0, 3.0), center_z + generator.uniform(-3.0, 3.0)))
+
+    lines.append('END')
+    save_text_file(pdb_file_path, '\n'.join(lines) + '\n')
+
+    return chains_number * residues_number * atoms_per_residue + ligand_copies * LIGAND_ATOMS_NUMBER
+
+
+# Generator plików XML w formacie bazy danych Pfam: domeny o długości 60 reszt rozpoczynające się co 40 reszt (sąsiednie domeny nakładają się).
+def generate_Pfam_xml(unp_accession : str, residues_number : int) -> str:
+    matches = ''
+    for (domain_index, start) in enumerate(range(1, residues_number + 1, 40)):
+        matches += (
+            f'      <match accession="PF{domain_index + 1:05d}" id="Synthetic_{domain_index + 1}" type="Pfam-A">\n'
+            f'        <location start="{start}" end="{min(start + 59, residues_number)}" ali_start="{start}" ali_end="{min(start + 59, residues_number)}" hmm_start="1" hmm_end="60" evalue="1e-20" bitscore="50"/>\n'
+            f'      </match>\n')
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<pfam xmlns="https://pfam.xfam.org/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" release="33.1">\n'
+        f'  <entry entry_type="sequence" db="uniprot" accession="{unp_accession}" id="{unp_accession}_SYN">\n'
+        '    <description><![CDATA[synthetic]]></description>\n'
+        f'    <sequence length="{residues_number}" version="1">MKV</sequence>\n'
+        '    <matches>\n'
+        f'{matches}'
+        '    </matches>\n'
+        '  </entry>\n'
+        '</pfam>\n')
+
+
+# Funkcja pomocnicza - zestaw syntetycznych struktur (katalog pdb) wraz z gotowymi plikami XML architektur domenowych (katalog xml).
+def generate_workload(directory : str, structures_number : int, chains_number : int, residues_number : int, ligand_copies : int, atoms_per_residue : int) -> tuple[list[str], str]:
+    (pdb_directory, xml_directory) = (os.path.join(directory, 'pdb'), os.path.join(directory, 'xml'))
+    os.makedirs(pdb_directory, exist_ok=True)
+    os.makedirs(xml_directory, exist_ok=True)
+
+    pdb_files_paths = []
+    for structure_index in range(structures_number):
+        structure_PDB_ID = '{}S{:02d}'.format(structure_index // 100 + 1, structure_index % 100)
+        pdb_files_paths.append(os.path.join(pdb_directory, f'{structure_PDB_ID}.pdb'))
+        generate_synthetic_PDB(pdb_files_paths[-1], structure_PDB_ID, chains_number, residues_number, ligand_copies, atoms_per_residue, seed=structure_index)
+
+    for chain_index in range(chains_number):
+        save_text_file(os.path.join(xml_directory, get_synthetic_accession(chain_index) + '.xml'), generate_Pfam_xml(get_synthetic_accession(chain_index), residues_number))
+
+    return (pdb_files_paths, xml_directory)
+
+
+# Funkcja pomocnicza - najkrótszy z repeat pomiarów czasu wykonania funkcji (setup wykonywany przed każdym pomiarem, poza mierzonym czasem).
+def measure(function, repeat : int, setup = None) -> float:
+    best = math.inf
+    for _ in range(max(repeat, 1)):
+        argument = setup() if setup != None else None
+        start = time.perf_counter()
+        function(argument) if setup != None else function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+# Funkcja pomocnicza - wykładnik skalowania wyznaczony z pierwszego i ostatniego pomiaru (1.0 - skalowanie liniowe, 2.0 - kwadratowe).
+def get_scaling_exponent(sizes : list[float], times : list[float]) -> float:
+    if len(sizes) < 2 or sizes[0] == sizes[-1] or times[0] <= 0.0:
+        return None
+
+    return math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+
+
+# -------------------------------------------------------------------------------------------------------------
+
+
+# Pomiar przepustowości parsowania plików PDB [atomy/s] - bez pamięci podręcznej rekordów oraz z pamięcią podręczną ({plik PDB}.records).
+def benchmark_parse(directory : str, args) -> list[dict]:
+    results = []
+
+    for atoms_number in args.atoms:
+        residues_number = max(atoms_number // (args.chains * args.atoms_per_residue), 1)
+        pdb_file_path = os.path.join(directory, f'parse_{atoms_number}.pdb')
+        atoms_number = generate_synthetic_PDB(pdb_file_path, 'PARS', args.chains, residues_number, args.ligand_copies, args.atoms_per_residue)
+
+        parse_time = measure(lambda: parse_PDB_file(pdb_file_path, [LIGAND_NAME], records_cache=False), args.repeat)
+        parse_PDB_file(pdb_file_path, [LIGAND_NAME])
+        cached_parse_time = measure(lambda: parse_PDB_file(pdb_file_path, [LIGAND_NAME]), args.repeat)
+
+        results.append({'case': f'text {atoms_number}', 'atoms': atoms_number, 'seconds': parse_time, 'atoms_per_second': atoms_number / parse_time})
+        results.append({'case': f'records cache {atoms_number}', 'atoms': atoms_number, 'seconds': cached_parse_time, 'atoms_per_second': atoms_number / cached_parse_time})
+
+    return results
+
+
+# Pomiar czasu wyszukiwania kontaktów ligand - białko w zależności od liczby atomów (każdy pomiar na nowo wczytanej strukturze).
+def benchmark_contacts(directory : str, args) -> list[dict]:
+    results = []
+
+    for atoms_number in args.atoms:
+        residues_number = max(atoms_number // (args.chains * args.atoms_per_residue), 1)
+        pdb_file_path = os.path.join(directory, f'contacts_{atoms_number}.pdb')
+        atoms_number = generate_synthetic_PDB(pdb_file_path, 'CONT', args.chains, residues_number, args.ligand_copies, args.atoms_per_residue)
+
+        structure = parse_PDB_file(pdb_file_path, [LIGAND_NAME])
+        contacts_number = len(structure.get_ligands_environment(args.cutoff))
+        search_time = measure(lambda structure: structure.get_ligands_environment(args.cutoff), args.repeat, lambda: parse_PDB_file(pdb_file_path, [LIGAND_NAME]))
+
+        results.append({'case': f'search {atoms_number}', 'atoms': atoms_number, 'contacts': contacts_number, 'seconds': search_time})
+
+    exponent = get_scaling_exponent([result['atoms'] for result in results], [result['seconds'] for result in results])
+    if exponent != None:
+        results.append({'case': 'scaling exponent', 'exponent': exponent})
+
+    return results
+
+
+# Pomiar pobierania architektur domenowych z gotowych plików XML (indeks JSON na dysku oraz pamięć LRU) i wyszukiwania domen reszt.
+def benchmark_domains(directory : str, args) -> list[dict]:
+    residues_number = max(args.atoms[-1] // (args.chains * args.atoms_per_residue), 1)
+    (pdb_files_paths, xml_directory) = generate_workload(os.path.join(directory, 'domains'), 1, args.chains, residues_number, args.ligand_copies, args.atoms_per_residue)
+    structure = parse_PDB_file(pdb_files_paths[0], [LIGAND_NAME])
+
+    def collect(pfam_cache : Pfam_cache):
+        structure.PFAM_DOMAINS = []
+        structure.collect_data_from_Pfam(xml_directory, pfam_cache=pfam_cache)
+
+    # Pierwsze wywołanie zapisuje indeksy JSON - kolejne pomiary odczytują je z dysku lub z pamięci LRU.
+    collect(Pfam_cache(xml_directory, OFFLINE_PFAM_URL))
+    disk_time = measure(collect, args.repeat, lambda: Pfam_cache(xml_directory, OFFLINE_PFAM_URL))
+    pfam_cache = Pfam_cache(xml_directory, OFFLINE_PFAM_URL)
+    collect(pfam_cache)
+    memory_time = measure(lambda: collect(pfam_cache), args.repeat)
+
+    queries = [(chain.chain_name, residue.residue_sequence_number) for chain in structure.CHAINS for residue in chain.RESIDUES]
+    structure.get_domain_index()
+    lookup_time = measure(lambda: [structure.get_residue_domains(chain_name, residue_sequence_number) for (chain_name, residue_sequence_number) in queries], args.repeat)
+
+    return [
+        {'case': f'collect disk {len(structure.PFAM_DOMAINS)}', 'chains': args.chains, 'domains': len(structure.PFAM_DOMAINS), 'seconds': disk_time},
+        {'case': f'collect memory {len(structure.PFAM_DOMAINS)}', 'chains': args.chains, 'domains': len(structure.PFAM_DOMAINS), 'seconds': memory_time},
+        {'case': f'residue lookup {len(queries)}', 'queries': len(queries), 'seconds': lookup_time, 'lookups_per_second': len(queries) / lookup_time}
+    ]
+
+
+# Pomiar agregacji wyników pojedynczych struktur (Statistics_accumulator) - wyniki przygotowywane są przed pomiarem.
+def benchmark_aggregation(directory : str, args) -> list[dict]:
+    residues_number = max(args.atoms[0] // (args.chains * args.atoms_per_residue), 1)
+    (pdb_files_paths, xml_directory) = generate_workload(os.path.join(directory, 'aggregation'), args.structures, args.chains, residues_number, args.ligand_copies, args.atoms_per_residue)
+    pfam_cache = Pfam_cache(xml_directory, OFFLINE_PFAM_URL)
+    results = [analyze_structure(pdb_file_path, [LIGAND_NAME], pfam_cache, args.cutoff) for pdb_file_path in pdb_files_paths]
+    contacts_number = sum(len(result.ENVIRONMENT) for result in results)
+
+    def aggregate():
+        statistics = Statistics_accumulator()
+        for result in results:
+            statistics.add_result(result)
+        statistics.get_where_ligand_statistics()
+
+    aggregation_time = measure(aggregate, args.repeat)
+    log_time = measure(lambda: [format_log_block(result, True) for result in results], args.repeat)
+
+    return [
+        {'case': f'statistics {contacts_number}', 'structures': len(results), 'contacts': contacts_number, 'seconds': aggregation_time},
+        {'case': f'log blocks {contacts_number}', 'structures': len(results), 'contacts': contacts_number, 'seconds': log_time}
+    ]
+
+
+# Pomiar czasu wyszukiwania kontaktów, deduplikacji domen wiążących oraz agregacji danych do pliku where.txt.
+def benchmark_deduplication(sizes : list[int]) -> list[tuple[int, int, float]]:
+    results : list[tuple[int, int, float]] = []
+
+    for ligands_number in sizes:
+        structure = build_synthetic_structure(ligands_number)
+        structure.build_atom_index()
+
+        start = time.perf_counter()
+        (ligands_environment, _, _) = structure.get_ligands_analysis()
+        where_ligand = [
+            (pfam_domain.pfam_id, ligand.residue_name, ligand.residue_sequence_number, residue.residue_name, residue.residue_sequence_number, chain_name)
+            for (ligand, residue, chain_name, pfam_domain) in ligands_environment
+            if pfam_domain != None
+        ]
+        aggregate_where_ligand(where_ligand)
+        elapsed = time.perf_counter() - start
+
+        results.append( (ligands_number, len(ligands_environment), elapsed) )
+
+    return results
+
+
+# Pomiar całego przebiegu analizy (wczytanie, architektury domenowe, kontakty, statystyki, plik log) dla zestawu syntetycznych struktur:
+# pierwszy przebieg bez plików pamięci podręcznej rekordów i indeksów JSON, drugi - z plikami zapisanymi w pierwszym przebiegu.
+def benchmark_pipeline(directory : str, args) -> list[dict]:
+    residues_number = max(args.atoms[0] // (args.chains * args.atoms_per_residue), 1)
+    (pdb_files_paths, xml_directory) = generate_workload(os.path.join(directory, 'pipeline'), args.structures, args.chains, residues_number, args.ligand_copies, args.atoms_per_residue)
+
+    def pipeline():
+        pfam_cache = Pfam_cache(xml_directory, OFFLINE_PFAM_URL)
+        statistics = Statistics_accumulator()
+        for pdb_file_path in pdb_files_paths:
+            result = analyze_structure(pdb_file_path, [LIGAND_NAME], pfam_cache, args.cutoff)
+            statistics.add_result(result)
+            format_log_block(result, True)
+        statistics.get_where_ligand_statistics()
+
+    cold_time = measure(pipeline, 1)
+    warm_time = measure(pipeline, args.repeat)
+
+    return [
+        {'case': f'cold {len(pdb_files_paths)}', 'structures': len(pdb_files_paths), 'seconds': cold_time, 'structures_per_second': len(pdb_files_paths) / cold_time},
+        {'case': f'warm {len(pdb_files_paths)}', 'structures': len(pdb_files_paths), 'seconds': warm_time, 'structures_per_second': len(pdb_files_paths) / warm_time}
+    ]
+
+
+# -------------------------------------------------------------------------------------------------------------
+
+
+# Funkcja pomocnicza - identyfikator bieżącego commita (None poza repozytorium git).
+def get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except:
+        return None
+
+
+# Porównanie czasów z wynikami zapisanymi wcześniej (--compare). Zwraca listę przypadków wolniejszych niż max_regression razy.
+def compare_results(report : dict, baseline : dict, max_regression : float) -> list[str]:
+    regressions = []
+    print('{: <16} {: <24} {: <12} {: <12} {: <8}'.format('Benchmark', 'Case', 'Base [s]', 'New [s]', 'Ratio'))
+
+    for (benchmark, results) in report['results'].items():
+        baseline_results = {result['case']: result for result in baseline.get('results', {}).get(benchmark, [])}
+        for result in results:
+            baseline_result = baseline_results.get(result['case'])
+            if baseline_result == None or 'seconds' not in result or 'seconds' not in baseline_result:
+                continue
+
+            ratio = result['seconds'] / baseline_result['seconds'] if baseline_result['seconds'] > 0.0 else math.inf
+            print('{: <16} {: <24} {: <12.4f} {: <12.4f} {: <8.2f}'.format(benchmark, result['case'], baseline_result['seconds'], result['seconds'], ratio))
+            if ratio > max_regression:
+                regressions.append(f'{benchmark} / {result["case"]}')
+
+    return regressions
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--benchmarks', type=str, nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    arg_parser.add_argument('--atoms', type=int, nargs='+', default=[5000, 20000, 50000])
+    arg_parser.add_argument('--chains', type=int, default=4)
+    arg_parser.add_argument('--atoms_per_residue', type=int, default=8)
+    arg_parser.add_argument('--ligand_copies', type=int, default=10)
+    arg_parser.add_argument('--structures', type=int, default=20)
+    arg_parser.add_argument('--cutoff', type=float, default=5.0)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1000, 2000, 4000])
+    arg_parser.add_argument('--max_exponent', type=float, default=1.3)
+    arg_parser.add_argument('--output', type=str)
+    arg_parser.add_argument('--compare', type=str)
+    arg_parser.add_argument('--max_regression', type=float, default=1.25)
+    arg_parser.add_argument('--workdir', type=str)
+    args = arg_parser.parse_args()
+
+    # Pliki syntetycznych struktur zapisywane są w katalogu tymczasowym (usuwanym po zakończeniu), chyba że wskazano --workdir.
+    directory = args.workdir if args.workdir != None else tempfile.mkdtemp(prefix='pdb_utility_benchmark_')
+    os.makedirs(directory, exist_ok=True)
+
+    report = {
+        'commit': get_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for (key, value) in vars(args).items() if key not in ('output', 'compare', 'workdir')},
+        'results': {}
+    }
+    failed = False
+
+    try:
+        for benchmark in [benchmark for benchmark in BENCHMARKS if benchmark in args.benchmarks]:
+            if benchmark == 'deduplication':
+                deduplication_results = benchmark_deduplication(args.sizes)
+                exponent = get_scaling_exponent([contacts for (_, contacts, _) in deduplication_results], [elapsed for (_, _, elapsed) in deduplication_results])
+                report['results'][benchmark] = [
+                    {'case': f'ligands {ligands_number}', 'contacts': contacts_number, 'seconds': elapsed, 'us_per_contact': 1e6 * elapsed / contacts_number}
+                    for (ligands_number, contacts_number, elapsed) in deduplication_results
+                ] + [{'case': 'scaling exponent', 'exponent': exponent}]
+
+                if exponent != None and exponent > args.max_exponent:
+                    print(Colors.RED + f'Scaling exponent above {args.max_exponent} - deduplication is no longer linear :O' + Colors.END)
+                    failed = True
+            else:
+                report['results'][benchmark] = globals()[f'benchmark_{benchmark}'](directory, args)
+
+            print(Colors.GREEN + f'Benchmark: {benchmark}' + Colors.END)
+            for result in report['results'][benchmark]:
+                print('    ' + '  '.join(f'{key}: {value:.4f}' if type(value) == float else f'{key}: {value}' for (key, value) in result.items()))
+
+    finally:
+        if args.workdir == None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output != None:
+        save_text_file(args.output, json.dumps(report, indent=2))
+
+    if args.compare != None:
+        baseline_file = open(args.compare, 'r')
+        baseline = json.load(baseline_file)
+        baseline_file.close()
+
+        regressions = compare_results(report, baseline, args.max_regression)
+        if regressions:
+            print(Colors.RED + f'Slower than {args.max_regression}x baseline ({baseline.get("commit")}): {", ".join(regressions)} :O' + Colors.END)
+            failed = True
+
+    if failed:
+        sys.exit(1)
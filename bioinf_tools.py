@@ -2,11 +2,44 @@
 
 try:
     import platform
-    import xml.dom.minidom as mnd
+    import math
+    import os
+    import re
+    import sys
+    import time
+    import glob
+    import json
+    import gzip
+    import io
+    import mmap
+    import struct
+    from array import array
+    from bisect import bisect_right
+    from collections import OrderedDict, Counter
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import groupby
+    import xml.parsers.expat as expat
     import urllib3
 except:
     print('Necessary libraries not found :/')
 
+try:
+    import zstandard                                            # Opcjonalnie - zapis plików wynikowych *.zst
+except ImportError:
+    zstandard = None
+
+try:
+    import numpy                                                # Opcjonalnie - wektorowe wyszukiwanie kontaktów (find_contacts_vectorized)
+except ImportError:
+    numpy = None
+
+PFAM_URL = 'http://pfam.xfam.org'
+PDB_RECORDS_HEADER = struct.Struct('<8sqq5q')                  # Znacznik formatu, st_mtime_ns i st_size pliku PDB, liczby rekordów, serii, atomów, odniesień UNP, rozmiar tablicy napisów
+PDB_RECORDS_MAGIC = b'PDBREC02'
+PRUNING_MARGIN = 1e-6                                           # Zapas [A] dodawany do odległości kontaktu przy wstępnej selekcji reszt (błędy zaokrągleń)
+HETATM_RESIDUE_NAME = re.compile(rb'^HETATM.{11}(.{3})', re.MULTILINE)           # Nazwa reszty rekordu HETATM (kolumny 18 - 20) - wstępny przegląd pliku PDB
+CONTACT_BLOCK_SIZE = 2 ** 20                                    # Maksymalna liczba par atomów w bloku obliczeń wektorowych (ogranicza szczytowe zużycie pamięci)
+
 if platform.system() == 'Linux':
     class Colors:
         RED = '\33[31m'
@@ -100,14 +133,133 @@ class Termination_symbol:
 # ------------------------------------------------------------------------------------------------------
 
 
-class Residue:
+class Atom_table:
+    """Kolumnowa reprezentacja atomów struktury: współrzędne w ciągłej tablicy array('d') (x, y, z kolejnych atomów), nazwy i symbole w listach współdzielonych napisów.
+    Maska HEAVY_ATOMS (1 - atom ciężki, 0 - wodór) wyznaczana jest jednorazowo przy wczytywaniu atomów."""
+
+    def __init__(self):
+        self.COORDINATES : array = array('d')
+        self.ATOM_NAMES : list[str] = []
+        self.ELEMENT_SYMBOLS : list[str] = []
+        self.HEAVY_ATOMS : bytearray = bytearray()
+
+    def __len__(self):
+        return len(self.ATOM_NAMES)
+
+    def push_atom(self, atom_name, element_symbol, x_coordinate, y_coordinate, z_coordinate) -> int:
+        """Funkcja dopisująca atom do tablicy. Zwraca indeks dopisanego atomu."""
+
+        try:
+            coordinates = (float(x_coordinate), float(y_coordinate), float(z_coordinate))
+        except:
+            print(Colors.RED + 'Atom: ValueError!' + Colors.END)
+            raise ValueError
+
+        if type(self.COORDINATES) != array:
+            # Współrzędne odwzorowane z pliku pamięci podręcznej (memoryview) są kopiowane przy pierwszej modyfikacji.
+            self.COORDINATES = array('d', self.COORDINATES.tobytes())
+
+        self.COORDINATES.extend(coordinates)
+        self.ATOM_NAMES.append(sys.intern(str(atom_name).strip()))
+        self.ELEMENT_SYMBOLS.append(sys.intern(str(element_symbol).strip()))
+        self.HEAVY_ATOMS.append(self.ATOM_NAMES[-1][: 1] != 'H')
+
+        return len(self.ATOM_NAMES) - 1
+
+    def set_atom_names(self, atom_names : list[str]):
+        """Funkcja ustawiająca nazwy wszystkich atomów tablicy wraz z maską atomów ciężkich (nazwy atomów wodoru rozpoczynają się od 'H')."""
+
+        heavy_names = {atom_name: atom_name[: 1] != 'H' for atom_name in set(atom_names)}
+        self.ATOM_NAMES = atom_names
+        self.HEAVY_ATOMS = bytearray(map(heavy_names.__getitem__, atom_names))
+
+    def get_coordinates(self, index : int) -> tuple[float, float, float]:
+        return (self.COORDINATES[3 * index], self.COORDINATES[3 * index + 1], self.COORDINATES[3 * index + 2])
+
+    def get_atom(self, index : int) -> Atom:
+        """Funkcja zwracająca atom o podanym indeksie w postaci obiektu klasy Atom (tworzonego na żądanie)."""
+
+        return Atom(self.ATOM_NAMES[index], self.ELEMENT_SYMBOLS[index], *self.get_coordinates(index))
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Atom_group:
+    """Widok na grupę atomów przechowywanych w tablicy Atom_table (wspólna część klas Residue i Ligand)."""
+
+    def __init__(self, atom_table : Atom_table = None):
+        self.atom_table : Atom_table = atom_table if atom_table != None else Atom_table()
+        self.ATOM_INDICES : range = range(0)
+        self.bounding_sphere : tuple[float, float, float, float] = None        # Sfera otaczająca atomy grupy (x, y, z, promień), unieważniana przy dołączeniu atomu
+
+    @property
+    def ATOMS(self) -> list[Atom]:
+        return [self.atom_table.get_atom(index) for index in self.ATOM_INDICES]
+
+    def push_atom(self, next_atom : Atom):
+        self.add_atom_index(self.atom_table.push_atom(
+            next_atom.atom_name,
+            next_atom.element_symbol,
+            next_atom.x_coordinate,
+            next_atom.y_coordinate,
+            next_atom.z_coordinate))
+
+    def add_atom_index(self, index : int):
+        """Funkcja dołączająca do grupy atom o podanym indeksie. Grupa ciągła pamiętana jest jako zakres (range), niespójna - jako tablica indeksów."""
+
+        indices = self.ATOM_INDICES
+        self.bounding_sphere = None
+        if type(indices) == range:
+            if len(indices) == 0:
+                self.ATOM_INDICES = range(index, index + 1)
+                return
+            if indices.stop == index:
+                self.ATOM_INDICES = range(indices.start, index + 1)
+                return
+            self.ATOM_INDICES = array('l', indices)
+
+        self.ATOM_INDICES.append(index)
+
+    def add_atom_range(self, start : int, stop : int):
+        """Funkcja dołączająca do grupy atomy o indeksach z przedziału [start, stop)."""
+
+        indices = self.ATOM_INDICES
+        self.bounding_sphere = None
+        if type(indices) == range and len(indices) == 0:
+            self.ATOM_INDICES = range(start, stop)
+        elif type(indices) == range and indices.stop == start:
+            self.ATOM_INDICES = range(indices.start, stop)
+        else:
+            for index in range(start, stop):
+                self.add_atom_index(index)
+
+    def move_to(self, atom_table : Atom_table):
+        """Funkcja przenosząca atomy grupy do wskazanej tablicy atomów (np. wspólnej tablicy całej struktury)."""
+
+        if self.atom_table is not atom_table:
+            source_table = self.atom_table
+            indices = self.ATOM_INDICES
+            self.atom_table = atom_table
+            self.ATOM_INDICES = range(0)
+            for index in indices:
+                self.add_atom_index(atom_table.push_atom(
+                    source_table.ATOM_NAMES[index],
+                    source_table.ELEMENT_SYMBOLS[index],
+                    *source_table.get_coordinates(index)))
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Residue(Atom_group):
     """Klasa zawierająca grupę wczytanych atomów (klasa: Atom), stanowiąca reprezentację reszty aminokwasowej."""
 
-    def __init__(self, residue_name, residue_sequence_number):
+    def __init__(self, residue_name, residue_sequence_number, atom_table : Atom_table = None):
         try:
+            super().__init__(atom_table)
             self.residue_name : str = str(residue_name).strip()
             self.residue_sequence_number : int = int(residue_sequence_number)
-            self.ATOMS : list[Atom] = []
         except:
             print(Colors.RED + 'Residue: ValueError!' + Colors.END)
             raise ValueError
@@ -115,21 +267,18 @@ class Residue:
     def __repr__(self):
         return 'Residue -> {} {: <4}'.format(self.residue_name, self.residue_sequence_number)
 
-    def push_atom(self, next_atom : Atom):
-        self.ATOMS.append(next_atom)
-
 
 # ------------------------------------------------------------------------------------------------------
 
 
-class Ligand:
+class Ligand(Atom_group):
     """Klasa zawierająca grupę wczytanych atomów (klasa: Atom), stanowiąca reprezentację cząsteczki liganda."""
 
-    def __init__(self, residue_name, residue_sequence_number):
+    def __init__(self, residue_name, residue_sequence_number, atom_table : Atom_table = None):
         try:
+            super().__init__(atom_table)
             self.residue_name : str = str(residue_name).strip()
             self.residue_sequence_number : int = int(residue_sequence_number)
-            self.ATOMS : list[Atom] = []
         except:
             print(Colors.RED + 'Ligand: ValueError!' + Colors.END)
             raise ValueError
@@ -137,9 +286,6 @@ class Ligand:
     def __repr__(self):
         return 'Ligand -> {} {: <8}'.format(self.residue_name, self.residue_sequence_number)
 
-    def push_atom(self, next_atom : Atom):
-        self.ATOMS.append(next_atom)
-
 
 # ------------------------------------------------------------------------------------------------------
 
@@ -176,6 +322,461 @@ class Chain:
 # ------------------------------------------------------------------------------------------------------
 
 
+def set_group_index(group_index : array, atom_indices, value : int):
+    """Funkcja wpisująca wartość value do tablicy group_index na pozycjach atom_indices (przedział ciągły wpisywany jest jednym przypisaniem)."""
+
+    if type(atom_indices) == range:
+        group_index[atom_indices.start : atom_indices.stop] = array('i', [value]) * len(atom_indices)
+    else:
+        for atom_index in atom_indices:
+            group_index[atom_index] = value
+
+
+def squared_cutoff(cutoff : float) -> float:
+    """Funkcja zwracająca największy kwadrat odległości d2 spełniający warunek sqrt(d2) < cutoff (porównanie kwadratów odległości bez pierwiastkowania, zgodne co do bitu z porównaniem odległości)."""
+
+    threshold = float(cutoff) * float(cutoff)
+    while threshold > 0.0 and threshold ** 0.5 >= cutoff:
+        threshold = math.nextafter(threshold, 0.0)
+    while math.nextafter(threshold, math.inf) ** 0.5 < cutoff:
+        threshold = math.nextafter(threshold, math.inf)
+
+    return threshold
+
+
+def get_bounding_box(coordinates, atom_indices) -> tuple[float, float, float, float, float, float]:
+    """Funkcja zwracająca prostopadłościan otaczający atomy o podanych indeksach: (min x, min y, min z, max x, max y, max z). Dla pustej grupy zwraca None."""
+
+    if len(atom_indices) == 0:
+        return None
+
+    if type(atom_indices) == range and atom_indices.step == 1:
+        # Zakres ciągły - współrzędne wybierane wycinkami tablicy (bez pętli po atomach).
+        (start, stop) = (3 * atom_indices.start, 3 * atom_indices.stop)
+        (X, Y, Z) = (coordinates[start : stop : 3], coordinates[start + 1 : stop : 3], coordinates[start + 2 : stop : 3])
+    else:
+        X = [coordinates[3 * atom_index] for atom_index in atom_indices]
+        Y = [coordinates[3 * atom_index + 1] for atom_index in atom_indices]
+        Z = [coordinates[3 * atom_index + 2] for atom_index in atom_indices]
+
+    return (min(X), min(Y), min(Z), max(X), max(Y), max(Z))
+
+
+def get_bounding_sphere(bounding_box : tuple[float, float, float, float, float, float]) -> tuple[float, float, float, float]:
+    """Funkcja zwracająca sferę opisaną na prostopadłościanie otaczającym: (x, y, z, promień)."""
+
+    (min_x, min_y, min_z, max_x, max_y, max_z) = bounding_box
+    return (
+        (min_x + max_x) / 2,
+        (min_y + max_y) / 2,
+        (min_z + max_z) / 2,
+        math.sqrt((max_x - min_x) ** 2 + (max_y - min_y) ** 2 + (max_z - min_z) ** 2) / 2
+    )
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Neighbor_search:
+    """Siatka komórkowa (cell list) ciężkich atomów białka, budowana jednorazowo dla struktury i przeszukiwana w zadanym promieniu."""
+
+    def __init__(self, atom_table : Atom_table, atom_residue_index : array, cell_size : float, atom_indices = None):
+        if not float(cell_size) > 0.0:
+            print(Colors.RED + 'Neighbor_search: ValueError!' + Colors.END)
+            raise ValueError
+
+        self.cell_size : float = float(cell_size)
+        self.CELLS : dict[tuple[int, int, int], list[tuple[float, float, float, int, int]]] = {}    # x, y, z, indeks reszty, indeks atomu
+
+        coordinates = atom_table.COORDINATES
+        heavy_atoms = atom_table.HEAVY_ATOMS
+        if atom_indices == None:
+            atom_indices = range(len(atom_residue_index))
+
+        for atom_index in atom_indices:
+            residue_index = atom_residue_index[atom_index]
+            if residue_index >= 0 and heavy_atoms[atom_index]:
+                x, y, z = coordinates[3 * atom_index], coordinates[3 * atom_index + 1], coordinates[3 * atom_index + 2]
+                cell = self.get_cell(x, y, z)
+                if cell in self.CELLS:
+                    self.CELLS[cell].append( (x, y, z, residue_index, atom_index) )
+                else:
+                    self.CELLS[cell] = [(x, y, z, residue_index, atom_index)]
+
+    def get_cell(self, x : float, y : float, z : float) -> tuple[int, int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size), math.floor(z / self.cell_size))
+
+    def search(self, atom_table : Atom_table, atom_indices, radius : float) -> set[int]:
+        """Funkcja zwracająca zbiór indeksów reszt (Structure.RESIDUES) posiadających ciężki atom w odległości mniejszej niż radius od któregokolwiek z podanych atomów."""
+
+        max_squared_distance = squared_cutoff(radius)
+        reach = math.ceil(radius / self.cell_size)
+        offsets = range(-reach, reach + 1)
+        found : set[int] = set()
+
+        for atom_index in atom_indices:
+            (x, y, z) = atom_table.get_coordinates(atom_index)
+            (cell_x, cell_y, cell_z) = self.get_cell(x, y, z)
+            for dx in offsets:
+                for dy in offsets:
+                    for dz in offsets:
+                        cell = self.CELLS.get( (cell_x + dx, cell_y + dy, cell_z + dz) )
+                        if cell != None:
+                            for (other_x, other_y, other_z, residue_index, _) in cell:
+                                if residue_index in found:
+                                    continue
+                                delta_x = other_x - x
+                                delta_y = other_y - y
+                                delta_z = other_z - z
+                                if delta_x * delta_x + delta_y * delta_y + delta_z * delta_z <= max_squared_distance:
+                                    found.add(residue_index)
+
+        return found
+
+    def search_closest(self, atom_table : Atom_table, atom_indices, radius : float) -> dict[int, tuple[float, int, int]]:
+        """Funkcja zwracająca dla reszt posiadających ciężki atom w odległości mniejszej niż radius od podanych atomów najbliższą parę atomów:
+        indeks reszty -> (kwadrat odległości, indeks atomu z atom_indices, indeks atomu reszty). Przy równych odległościach wybierana jest para o najmniejszych indeksach."""
+
+        max_squared_distance = squared_cutoff(radius)
+        reach = math.ceil(radius / self.cell_size)
+        offsets = range(-reach, reach + 1)
+        closest : dict[int, tuple[float, int, int]] = {}
+
+        for atom_index in atom_indices:
+            (x, y, z) = atom_table.get_coordinates(atom_index)
+            (cell_x, cell_y, cell_z) = self.get_cell(x, y, z)
+            for dx in offsets:
+                for dy in offsets:
+                    for dz in offsets:
+                        cell = self.CELLS.get( (cell_x + dx, cell_y + dy, cell_z + dz) )
+                        if cell != None:
+                            for (other_x, other_y, other_z, residue_index, other_index) in cell:
+                                delta_x = other_x - x
+                                delta_y = other_y - y
+                                delta_z = other_z - z
+                                squared_distance = delta_x * delta_x + delta_y * delta_y + delta_z * delta_z
+                                if squared_distance <= max_squared_distance:
+                                    contact = (squared_distance, atom_index, other_index)
+                                    if residue_index not in closest or contact < closest[residue_index]:
+                                        closest[residue_index] = contact
+
+        return closest
+
+
+def find_contacts_vectorized(atom_table : Atom_table, atom_residue_index : array, LIGAND_ATOMS : list[list[int]], protein_atoms : list[int], cutoff : float,
+        block_size : int = CONTACT_BLOCK_SIZE, closest : bool = False) -> list:
+    """Funkcja zwracająca kontakty kolejnych ligandów (jak Neighbor_search.search lub, przy closest=True, search_closest) wyznaczone przy użyciu modułu numpy."""
+
+    LIGAND_CONTACTS : list = [{} if closest else set() for _ in LIGAND_ATOMS]
+    max_squared_distance = squared_cutoff(cutoff)
+    coordinates = numpy.frombuffer(atom_table.COORDINATES, dtype=numpy.float64).reshape(-1, 3)
+
+    protein_atoms = numpy.asarray(protein_atoms, dtype=numpy.int64)
+    protein_atoms = protein_atoms[numpy.frombuffer(atom_table.HEAVY_ATOMS, dtype=numpy.uint8)[protein_atoms] != 0]
+    ligand_atoms = numpy.fromiter((atom_index for ligand_atoms in LIGAND_ATOMS for atom_index in ligand_atoms), dtype=numpy.int64)
+    if len(protein_atoms) == 0 or len(ligand_atoms) == 0:
+        return LIGAND_CONTACTS
+
+    # Atomy białka porządkowane są według współrzędnej x, a ciężkie atomy wszystkich ligandów zestawiane w jedną tablicę.
+    protein_atoms = protein_atoms[numpy.argsort(coordinates[protein_atoms, 0], kind='stable')]
+    protein_coordinates = coordinates[protein_atoms]
+    protein_x = numpy.ascontiguousarray(protein_coordinates[:, 0])
+    protein_residues = numpy.frombuffer(atom_residue_index, dtype=numpy.int32)[protein_atoms]
+    ligand_coordinates = coordinates[ligand_atoms]
+    reach = float(cutoff) + PRUNING_MARGIN
+
+    row_stop = 0
+    for (ligand_index, atoms) in enumerate(LIGAND_ATOMS):
+        (row_start, row_stop) = (row_stop, row_stop + len(atoms))
+        if row_start == row_stop:
+            continue
+
+        # Atomy białka z prostopadłościanu otaczającego ligand: przedział współrzędnych x (wyszukiwanie binarne), a następnie y i z.
+        block = ligand_coordinates[row_start: row_stop]
+        (lower, upper) = (block.min(axis=0) - reach, block.max(axis=0) + reach)
+        (first, last) = (numpy.searchsorted(protein_x, lower[0], 'left'), numpy.searchsorted(protein_x, upper[0], 'right'))
+        inside = numpy.all((protein_coordinates[first: last, 1:] >= lower[1:]) & (protein_coordinates[first: last, 1:] <= upper[1:]), axis=1)
+        candidates = numpy.nonzero(inside)[0] + first
+        if len(candidates) == 0:
+            continue
+
+        # Odległości obliczane są blokami nie większymi niż block_size par atomów, w tej samej kolejności działań co w Neighbor_search (identyczny wynik).
+        columns_number = max(1, block_size // len(block))
+        for column_start in range(0, len(candidates), columns_number):
+            columns = candidates[column_start: column_start + columns_number]
+            other = protein_coordinates[columns]
+            delta = other[None, :, 0] - block[:, None, 0]
+            squared_distances = delta * delta
+            delta = other[None, :, 1] - block[:, None, 1]
+            squared_distances += delta * delta
+            delta = other[None, :, 2] - block[:, None, 2]
+            squared_distances += delta * delta
+
+            if not closest:
+                LIGAND_CONTACTS[ligand_index].update(protein_residues[columns[numpy.any(squared_distances <= max_squared_distance, axis=0)]].tolist())
+                continue
+
+            # Najbliższy atom liganda dla każdego atomu białka w zasięgu (argmin wskazuje pierwszy, czyli o najmniejszym indeksie), następnie minimum w obrębie reszty.
+            column_minimum = squared_distances.min(axis=0)
+            hits = numpy.nonzero(column_minimum <= max_squared_distance)[0]
+            ligand_closest = LIGAND_CONTACTS[ligand_index]
+            for (squared_distance, row, protein_atom, residue_index) in zip(column_minimum[hits].tolist(), squared_distances[:, hits].argmin(axis=0).tolist(),
+                    protein_atoms[columns[hits]].tolist(), protein_residues[columns[hits]].tolist()):
+                contact = (squared_distance, atoms[row], protein_atom)
+                if residue_index not in ligand_closest or contact < ligand_closest[residue_index]:
+                    ligand_closest[residue_index] = contact
+
+    return LIGAND_CONTACTS
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Pfam_cache:
+    """Pamięć podręczna architektur domenowych Pfam indeksowana numerem dostępu UniProt: pliki {accession}.xml w katalogu backup_folder (wspólne dla wszystkich struktur i łańcuchów) oraz pamięć LRU przetworzonych list domen."""
+
+    def __init__(self, backup_folder, pfam_url : str = PFAM_URL, max_entries : int = 4096, max_size : int = None, max_age : float = None):
+        self.backup_folder : str = str(backup_folder)
+        self.pfam_url : str = pfam_url
+        self.max_entries : int = max_entries                        # Maksymalna liczba przetworzonych architektur w pamięci (LRU)
+        self.max_size : int = max_size                              # Maksymalny rozmiar plików XML na dysku [B] (None - bez ograniczeń)
+        self.max_age : float = max_age                              # Czas ważności pliku XML [s] (None - bez ograniczeń)
+        self.ENTRIES : OrderedDict[str, list[tuple[str, str, int, int]]] = OrderedDict()
+        self.memory_hits : int = 0
+        self.disk_hits : int = 0
+        self.network_fetches : int = 0
+        self.http = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['http'] = None
+        return state
+
+    def get_xml_path(self, unp_accession : str) -> str:
+        return f'{self.backup_folder}/{unp_accession}.xml'
+
+    def is_cached(self, unp_accession : str) -> bool:
+        """Funkcja sprawdzająca, czy na dysku znajduje się aktualny (nieprzeterminowany) plik XML dla wskazanego numeru dostępu."""
+
+        xml_file_path = self.get_xml_path(unp_accession)
+        if not os.path.isfile(xml_file_path):
+            return False
+
+        return self.max_age == None or time.time() - os.path.getmtime(xml_file_path) <= self.max_age
+
+    def get_index_path(self, unp_accession : str) -> str:
+        return f'{self.backup_folder}/{unp_accession}.json'
+
+    def store(self, unp_accession : str, decoded_content : str):
+        save_text_file(self.get_xml_path(unp_accession), decoded_content)
+        if os.path.isfile(self.get_index_path(unp_accession)):
+            os.remove(self.get_index_path(unp_accession))
+        self.ENTRIES.pop(unp_accession, None)
+
+    def read_domains(self, unp_accession : str) -> list[tuple[str, str, int, int]]:
+        """Funkcja wczytująca architekturę domenową z dysku: z pliku indeksu {accession}.json, jeżeli odpowiada on aktualnemu plikowi XML, w przeciwnym razie z pliku XML (zapisując nowy indeks)."""
+
+        xml_file_path = self.get_xml_path(unp_accession)
+        xml_status = os.stat(xml_file_path)
+
+        try:
+            index_file = open(self.get_index_path(unp_accession), 'r')
+            index = json.load(index_file)
+            index_file.close()
+            if index['xml_mtime_ns'] == xml_status.st_mtime_ns and index['xml_size'] == xml_status.st_size:
+                return [tuple(domain) for domain in index['domains']]
+        except:
+            pass
+
+        xml_file = open(xml_file_path, 'r')
+        domains = parse_Pfam_xml(xml_file.read())
+        xml_file.close()
+
+        try:
+            save_text_file(self.get_index_path(unp_accession), json.dumps({
+                'xml_mtime_ns': xml_status.st_mtime_ns,
+                'xml_size': xml_status.st_size,
+                'domains': domains
+            }))
+        except:
+            print(Colors.YELLOW + f'Could not save domain index for: {unp_accession}' + Colors.END)
+
+        return domains
+
+    def get_domains(self, unp_accession : str) -> list[tuple[str, str, int, int]]:
+        """Funkcja zwracająca architekturę domenową białka jako listę krotek (pfam_accession, pfam_id, start, end): z pamięci LRU, z dysku lub - w ostateczności - z bazy danych Pfam."""
+
+        if unp_accession in self.ENTRIES:
+            self.ENTRIES.move_to_end(unp_accession)
+            self.memory_hits += 1
+            return self.ENTRIES[unp_accession]
+
+        if self.is_cached(unp_accession):
+            domains = self.read_domains(unp_accession)
+            self.disk_hits += 1
+        else:
+            try:
+                if self.http == None:
+                    self.http = urllib3.PoolManager()
+                decoded_content = fetch_Pfam_xml(self.http, unp_accession, self.pfam_url)
+                self.network_fetches += 1
+                self.store(unp_accession, decoded_content)
+                self.enforce_size_limit()
+            except:
+                # Przeterminowany plik jest używany, jeżeli nie udało się go odświeżyć.
+                if not os.path.isfile(self.get_xml_path(unp_accession)):
+                    raise
+                print(Colors.YELLOW + f'Using stale domain information for: {unp_accession}' + Colors.END)
+            domains = self.read_domains(unp_accession)
+
+        self.ENTRIES[unp_accession] = domains
+        if len(self.ENTRIES) > self.max_entries:
+            self.ENTRIES.popitem(last=False)
+
+        return domains
+
+    def enforce_size_limit(self):
+        """Funkcja usuwająca najdawniej używane pliki XML, jeżeli ich łączny rozmiar przekracza max_size."""
+
+        if self.max_size == None:
+            return
+
+        xml_files = [(os.path.getatime(path), os.path.getsize(path), path) for path in glob.glob(f'{self.backup_folder}/*.xml')]
+        total_size = sum(size for (_, size, _) in xml_files)
+        for (_, size, path) in sorted(xml_files):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            if os.path.isfile(path[: -4] + '.json'):
+                os.remove(path[: -4] + '.json')
+            total_size -= size
+
+    def import_legacy_files(self) -> int:
+        """Funkcja przenosząca pliki zapisane w dawnym formacie ({PDB_ID}_{chain}_{accession}.xml) do plików {accession}.xml (zachowywana jest najnowsza kopia, pozostałe są usuwane). Zwraca liczbę przeniesionych numerów dostępu."""
+
+        legacy_files : dict[str, list[tuple[float, str]]] = {}
+        for path in glob.glob(f'{self.backup_folder}/*_*_*.xml'):
+            matched = re.fullmatch(r'[0-9A-Za-z]{4}_[^_]*_([^_]+)\.xml', os.path.basename(path))
+            if matched:
+                legacy_files.setdefault(matched.group(1), []).append( (os.path.getmtime(path), path) )
+
+        imported = 0
+        for (unp_accession, paths) in legacy_files.items():
+            paths.sort()
+            if not os.path.isfile(self.get_xml_path(unp_accession)):
+                os.replace(paths.pop()[1], self.get_xml_path(unp_accession))
+                imported += 1
+            for (_, path) in paths:
+                os.remove(path)
+
+        return imported
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+PFAM_CACHES : dict[tuple[str, str], Pfam_cache] = {}
+
+
+def get_Pfam_cache(backup_folder, pfam_url : str = PFAM_URL, max_size : int = None, max_age : float = None) -> Pfam_cache:
+    """Funkcja zwracająca pamięć podręczną Pfam wspólną dla wszystkich struktur przetwarzanych w danym procesie."""
+
+    # Limity max_size i max_age uwzględniane są przy utworzeniu pamięci podręcznej (np. w inicjalizacji procesu roboczego).
+    if (str(backup_folder), pfam_url) not in PFAM_CACHES:
+        PFAM_CACHES[(str(backup_folder), pfam_url)] = Pfam_cache(backup_folder, pfam_url, max_size=max_size, max_age=max_age)
+
+    return PFAM_CACHES[(str(backup_folder), pfam_url)]
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Domain_index:
+    """Indeks przedziałowy domen Pfam. Dla każdego łańcucha przechowuje posortowane granice przedziałów elementarnych (początki domen i pozycje następujące po ich końcach) oraz domeny pokrywające każdy z przedziałów, co pozwala wyznaczyć domeny zawierające resztę w czasie logarytmicznym."""
+
+    def __init__(self, pfam_domains : list[Pfam_domain], chain_entities : dict[str, str] = None):
+        """chain_entities - łańcuch -> łańcuch reprezentatywny encji (Structure.get_chain_entities); łańcuchy tej samej encji o jednakowej architekturze
+        domenowej współdzielą granice przedziałów, a ich przedziały wyznaczane są przez podstawienie domen łańcucha reprezentatywnego."""
+
+        self.BOUNDARIES : dict[str, list[int]] = {}
+        self.SEGMENTS : dict[str, list[tuple[Pfam_domain, ...]]] = {}
+
+        chains_domains : dict[str, list[Pfam_domain]] = {}
+        for pfam_domain in pfam_domains:
+            chains_domains.setdefault(pfam_domain.chain_name, []).append(pfam_domain)
+
+        domains_signature = lambda chain_domains: tuple((domain.pfam_accession, domain.pfam_id, domain.start, domain.end) for domain in chain_domains)
+
+        for (chain_name, chain_domains) in chains_domains.items():
+            representative = chain_entities.get(chain_name, chain_name) if chain_entities != None else chain_name
+            if representative != chain_name and representative in self.SEGMENTS and domains_signature(chains_domains[representative]) == domains_signature(chain_domains):
+                substitution = {id(domain): chain_domain for (domain, chain_domain) in zip(chains_domains[representative], chain_domains)}
+                self.BOUNDARIES[chain_name] = self.BOUNDARIES[representative]
+                self.SEGMENTS[chain_name] = [tuple(substitution[id(domain)] for domain in segment) for segment in self.SEGMENTS[representative]]
+                continue
+
+            boundaries = sorted({domain.start for domain in chain_domains} | {domain.end + 1 for domain in chain_domains})
+            self.BOUNDARIES[chain_name] = boundaries
+            # Domeny pokrywające przedział zachowują kolejność z listy wejściowej.
+            self.SEGMENTS[chain_name] = [
+                tuple(domain for domain in chain_domains if domain.start <= boundary and domain.end >= boundary)
+                for boundary in boundaries
+            ]
+
+    def get_domains(self, chain_name : str, residue_sequence_number : int) -> tuple[Pfam_domain, ...]:
+        """Funkcja zwracająca domeny łańcucha chain_name zawierające resztę o podanym numerze."""
+
+        boundaries = self.BOUNDARIES.get(chain_name)
+        if boundaries == None:
+            return ()
+
+        segment = bisect_right(boundaries, residue_sequence_number) - 1
+        if segment < 0:
+            return ()
+
+        return self.SEGMENTS[chain_name][segment]
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+class Pdb_records:
+    """Kolumnowy zapis rekordów ATOM, HETATM i TER pliku PDB oraz odniesień DBREF do bazy UniProt. Kolejne rekordy tego samego typu o jednakowych kolumnach 18 - 26
+    (nazwa reszty, łańcuch, numer reszty) tworzą serię - nazwy, łańcuchy i numery reszt zapisywane są raz na serię, atomy w tablicy Atom_table. Zapis nie zależy od listy analizowanych ligandów.
+    Kolumny liczbowe są tablicami array lub - po wczytaniu z pliku pamięci podręcznej - widokami memoryview odwzorowanego pliku (tylko do odczytu)."""
+
+    ATOM = 0
+    HETATM = 1
+    TER = 2
+
+    def __init__(self):
+        self.LINE_NUMBERS : array = array('i')                        # Numer wiersza kolejnych rekordów (liczony od 0)
+        self.RUN_STARTS : array = array('i')                          # Indeks pierwszego rekordu serii
+        self.RUN_KINDS : bytearray = bytearray()                      # ATOM, HETATM lub TER (rekord TER stanowi zawsze osobną serię)
+        self.RESIDUE_NAMES : list[str] = []
+        self.CHAIN_NAMES : list[str] = []
+        self.SEQUENCE_NUMBERS : array = array('i')
+        self.ATOM_TABLE : Atom_table = Atom_table()                   # Atomy rekordów ATOM i HETATM
+        self.RUN_SPHERES : array = array('d')                         # Sfery otaczające atomy serii (x, y, z, promień; puste dla rekordów z błędem)
+        self.UNP_RECORDS : list[Unp_record] = []
+        self.UNP_LINE_NUMBERS : array = array('i')
+        self.error_run : int = None                                   # Indeks serii zawierającej pierwszą niepoprawną wartość liczbową
+        self.error_record : int = None                                # Indeks rekordu z pierwszą niepoprawną wartością liczbową
+        self.coordinates_error : bool = False                         # Czy błąd dotyczy współrzędnych (w przeciwnym razie numeru reszty)
+
+    def get_run_length(self, run_index : int) -> int:
+        stop = self.RUN_STARTS[run_index + 1] if run_index + 1 < len(self.RUN_STARTS) else len(self.LINE_NUMBERS)
+        return stop - self.RUN_STARTS[run_index]
+
+    def get_run_sphere(self, run_index : int) -> tuple[float, float, float, float]:
+        if len(self.RUN_SPHERES) == 0:
+            return None
+        return tuple(self.RUN_SPHERES[4 * run_index : 4 * run_index + 4])
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
 class Structure:
     """Klasa zawierająca grupę wczytanych łańcuchów aminokwasowych (klasa: Chain), stanowiąca reprezentację całego białka."""
 
@@ -185,55 +786,329 @@ class Structure:
             self.data_correctnes_flag : bool = True
             self.CHAINS : list[Chain] = []
             self.LIGANDS : list[Ligand] = []   
+            self.HETERO_NAMES : frozenset[str] = frozenset()              # Nazwy reszt wszystkich rekordów HETATM (także spoza listy ligandów)
             self.UNP_RECORDS : list[Unp_record] = []
             self.PFAM_DOMAINS : list[Pfam_domain] = []
+            self.ATOM_TABLE : Atom_table = Atom_table()
+            self.RESIDUES : list[Residue] = []
+            self.RESIDUE_CHAIN_INDEX : array = array('i')
+            self.CHAIN_RESIDUES : list[range] = []
+            self.CHAIN_BOXES : list[tuple[float, float, float, float, float, float]] = None
+            self.ATOM_RESIDUE_INDEX : array = array('i')
+            self.ATOM_LIGAND_INDEX : array = array('i')
+            self.atom_index_key : tuple = None
+            self.neighbor_search : Neighbor_search = None
+            self.ligands_environment_cache : tuple = None
+            self.ligands_contacts_cache : tuple = None
+            self.domain_index : Domain_index = None
+            self.domain_index_key : tuple = None
+            self.CHAIN_ENTITIES : dict[str, str] = None                   # Łańcuch -> łańcuch reprezentatywny encji (collect_data_from_Pfam z entities=True)
+            self.pruning_statistics : Counter = Counter()
         except:
             print(Colors.RED + 'Structure: ValueError!' + Colors.END)
             raise ValueError
 
-    def collect_data_from_Pfam(self, backup_folder):
-        """Funkcja pobierająca informacje o architekturach domenowych z bazy danych Pfam (pod warunkiem, że danych tych w postaci plików *.xml nie ma w lokalnym repozytorium)."""
+    def get_chain_entities(self) -> dict[str, str]:
+        """Funkcja wyznaczająca encje łańcuchów (np. podjednostki homo-oligomerów): łańcuchy o jednakowych numerach dostępu UniProt (rekordy DBREF)
+        i identycznej sekwencji reszt (nazwy i numery) należą do tej samej encji. Zwraca słownik łańcuch -> łańcuch reprezentatywny (pierwszy łańcuch encji)."""
+
+        CHAIN_ACCESSIONS : dict[str, list[str]] = {}
+        for unp_record in self.UNP_RECORDS:
+            CHAIN_ACCESSIONS.setdefault(unp_record.chain_name, []).append(unp_record.unp_accession)
+
+        CHAIN_SEQUENCES : dict[str, list[tuple[str, int]]] = {}
+        for chain in self.CHAINS:
+            CHAIN_SEQUENCES.setdefault(chain.chain_name, []).extend(
+                (residue.residue_name, residue.residue_sequence_number) for residue in chain.RESIDUES if isinstance(residue, Residue))
+
+        chain_entities : dict[str, str] = {}
+        representatives : dict[tuple, str] = {}
+        for (chain_name, chain_sequence) in CHAIN_SEQUENCES.items():
+            entity_key = (tuple(CHAIN_ACCESSIONS.get(chain_name, ())), tuple(chain_sequence))
+            chain_entities[chain_name] = representatives.setdefault(entity_key, chain_name)
+
+        return chain_entities
+
+    def collect_data_from_Pfam(self, backup_folder, pfam_url : str = PFAM_URL, pfam_cache : Pfam_cache = None, entities : bool = False):
+        """Funkcja pobierająca informacje o architekturach domenowych z bazy danych Pfam (pod warunkiem, że danych tych w postaci plików *.xml nie ma w lokalnym repozytorium).
+        Przy entities=True architektura domenowa wyznaczana jest raz dla każdej encji łańcuchów (get_chain_entities) i powielana dla pozostałych łańcuchów encji."""
 
         try:
             if self.data_correctnes_flag == True:
-                http = urllib3.PoolManager()
+                if pfam_cache == None:
+                    pfam_cache = get_Pfam_cache(backup_folder, pfam_url)
+
+                self.CHAIN_ENTITIES = self.get_chain_entities() if entities else None
+
+                # Architektury łańcuchów reprezentatywnych (kolejne rekordy DBREF łańcucha) - łańcuchy tej samej encji mają te same numery dostępu w tej samej kolejności.
+                ENTITY_DOMAINS : dict[str, list[list[tuple[str, str, int, int]]]] = {}
+                CHAIN_RECORD_COUNTERS : dict[str, int] = {}
+
                 for unp_record in self.UNP_RECORDS:
-                    try:
-                        xml_file = open(f'{backup_folder}/{self.structure_PDB_ID}_{unp_record.chain_name}_{unp_record.unp_accession}.xml', 'r')
-                        decoded_content = xml_file.read()
-                        xml_file.close()
-                    except:
-                        resource = http.request('GET', f'http://pfam.xfam.org/protein?output=xml&acc={unp_record.unp_accession}')
-                        decoded_content = resource.data.decode('utf-8')
-                        xml_file = open(f'{backup_folder}/{self.structure_PDB_ID}_{unp_record.chain_name}_{unp_record.unp_accession}.xml', 'w')
-                        xml_file.write(decoded_content)
-                        xml_file.close()
-
-                    parser = mnd.parseString(decoded_content)
-                    matches = parser.getElementsByTagName('match')
-                    for match in matches:
-                        for child in match.childNodes:
-                            if child.nodeType == child.ELEMENT_NODE and child.tagName == 'location':
-                                pfam_record = Pfam_domain(
-                                    unp_record.chain_name,
-                                    match.getAttribute('accession'), 
-                                    match.getAttribute('id'),
-                                    child.getAttribute('start'),
-                                    child.getAttribute('end'))
-                                self.PFAM_DOMAINS.append(pfam_record)
+                    record_position = CHAIN_RECORD_COUNTERS.get(unp_record.chain_name, 0)
+                    CHAIN_RECORD_COUNTERS[unp_record.chain_name] = record_position + 1
+
+                    representative = self.CHAIN_ENTITIES.get(unp_record.chain_name) if self.CHAIN_ENTITIES != None else None
+                    if representative != None and representative != unp_record.chain_name and representative in ENTITY_DOMAINS:
+                        domains = ENTITY_DOMAINS[representative][record_position]
+                    else:
+                        domains = pfam_cache.get_domains(unp_record.unp_accession)
+                        if representative == unp_record.chain_name:
+                            ENTITY_DOMAINS.setdefault(representative, []).append(domains)
+
+                    for (pfam_accession, pfam_id, start, end) in domains:
+                        self.PFAM_DOMAINS.append(Pfam_domain(unp_record.chain_name, pfam_accession, pfam_id, start, end))
 
         except:
             self.data_correctnes_flag = False
             print(Colors.RED + f'Could not get domain information for structure: {self.structure_PDB_ID}' + Colors.END)
-    
-    def get_ligands_environment(self) -> list[tuple[Ligand, Residue, str, Pfam_domain]]:
-        """Funkcja zwracająca listę znalezionych miejsc kontaktu ligand - białko."""
 
-        distance = lambda atom_a, atom_b: (
-            (atom_a.x_coordinate - atom_b.x_coordinate) ** 2 
-            + (atom_a.y_coordinate - atom_b.y_coordinate) ** 2 
-            + (atom_a.z_coordinate - atom_b.z_coordinate) ** 2
-        ) ** 0.5
+    def build_atom_index(self):
+        """Funkcja budująca tablice indeksów atom -> reszta -> łańcuch oraz atom -> ligand (atomy utworzone poza strukturą są przenoszone do jej tablicy atomów)."""
+
+        self.RESIDUES = []
+        self.RESIDUE_CHAIN_INDEX = array('i')
+        self.CHAIN_RESIDUES = []
+        for (chain_index, chain) in enumerate(self.CHAINS):
+            first_residue_index = len(self.RESIDUES)
+            for residue in chain.RESIDUES:
+                if isinstance(residue, Residue):
+                    residue.move_to(self.ATOM_TABLE)
+                    self.RESIDUES.append(residue)
+                    self.RESIDUE_CHAIN_INDEX.append(chain_index)
+            self.CHAIN_RESIDUES.append(range(first_residue_index, len(self.RESIDUES)))
+
+        for ligand in self.LIGANDS:
+            ligand.move_to(self.ATOM_TABLE)
+
+        self.ATOM_RESIDUE_INDEX = array('i', [-1]) * len(self.ATOM_TABLE)
+        for (residue_index, residue) in enumerate(self.RESIDUES):
+            set_group_index(self.ATOM_RESIDUE_INDEX, residue.ATOM_INDICES, residue_index)
+
+        self.ATOM_LIGAND_INDEX = array('i', [-1]) * len(self.ATOM_TABLE)
+        for (ligand_index, ligand) in enumerate(self.LIGANDS):
+            set_group_index(self.ATOM_LIGAND_INDEX, ligand.ATOM_INDICES, ligand_index)
+
+        self.atom_index_key = self.get_atom_index_key()
+        self.neighbor_search = None
+        self.CHAIN_BOXES = None
+
+    def get_atom_index_key(self) -> tuple:
+        """Funkcja zwracająca klucz opisujący aktualny skład łańcuchów i ligandów (zmiana klucza unieważnia indeksy atomów oraz zapamiętane wyniki)."""
+
+        return (
+            tuple((id(chain), len(chain.RESIDUES)) for chain in self.CHAINS),
+            tuple((id(ligand), len(ligand.ATOM_INDICES)) for ligand in self.LIGANDS)
+        )
+
+    def get_neighbor_search(self, cutoff : float = 5.0) -> Neighbor_search:
+        """Funkcja zwracająca siatkę wyszukiwania sąsiadów dla łańcuchów struktury (siatka budowana jest jednorazowo)."""
+
+        if self.atom_index_key != self.get_atom_index_key():
+            self.build_atom_index()
+
+        if self.neighbor_search == None:
+            self.neighbor_search = Neighbor_search(self.ATOM_TABLE, self.ATOM_RESIDUE_INDEX, cutoff)
+
+        return self.neighbor_search
+
+    def get_residue_spheres(self, chain_index : int) -> list[tuple[float, float, float, float]]:
+        """Funkcja zwracająca sfery otaczające reszty łańcucha o podanym indeksie (None dla reszty bez atomów)."""
+
+        # Sfery wyznaczane są przy wczytywaniu pliku PDB, a dla reszt zmienionych później - przy pierwszym użyciu.
+        spheres = []
+        for residue_index in self.CHAIN_RESIDUES[chain_index]:
+            residue = self.RESIDUES[residue_index]
+            if residue.bounding_sphere == None and len(residue.ATOM_INDICES) > 0:
+                residue.bounding_sphere = get_bounding_sphere(get_bounding_box(self.ATOM_TABLE.COORDINATES, residue.ATOM_INDICES))
+            spheres.append(residue.bounding_sphere)
+
+        return spheres
+
+    def get_chain_boxes(self) -> list[tuple[float, float, float, float, float, float]]:
+        """Funkcja zwracająca prostopadłościany otaczające sfery reszt kolejnych łańcuchów (None dla łańcucha bez atomów)."""
+
+        if self.atom_index_key != self.get_atom_index_key():
+            self.build_atom_index()
+
+        if self.CHAIN_BOXES == None:
+            self.CHAIN_BOXES = []
+            for chain_index in range(len(self.CHAIN_RESIDUES)):
+                spheres = [sphere for sphere in self.get_residue_spheres(chain_index) if sphere != None]
+                if spheres:
+                    self.CHAIN_BOXES.append( (
+                        min(x - radius for (x, _, _, radius) in spheres),
+                        min(y - radius for (_, y, _, radius) in spheres),
+                        min(z - radius for (_, _, z, radius) in spheres),
+                        max(x + radius for (x, _, _, radius) in spheres),
+                        max(y + radius for (_, y, _, radius) in spheres),
+                        max(z + radius for (_, _, z, radius) in spheres)
+                    ) )
+                else:
+                    self.CHAIN_BOXES.append(None)
+
+        return self.CHAIN_BOXES
+
+    def get_pruning_candidates(self, LIGAND_BOXES : list[tuple[float, float, float, float, float, float]]) -> tuple[list[int], set[int]]:
+        """Funkcja zwracająca indeksy reszt sięgających prostopadłościanów ligandów (LIGAND_BOXES) oraz indeksy ligandów z co najmniej jednym łańcuchem w pobliżu."""
+
+        candidate_residues : list[int] = []
+        active_ligands : set[int] = set()
+        statistics = Counter(ligands=len(LIGAND_BOXES), chains=len(self.CHAIN_RESIDUES), residues=len(self.RESIDUES))
+        ligand_boxes = [(ligand_index, ligand_box) for (ligand_index, ligand_box) in enumerate(LIGAND_BOXES) if ligand_box != None]
+
+        # Łańcuchy, których prostopadłościan nie przecina żadnego z prostopadłościanów ligandów, odrzucane są w całości, w pozostałych - reszty,
+        # których sfera otaczająca ich nie sięga. Statystyki selekcji zapisywane są w pruning_statistics.
+        for (chain_index, chain_box) in enumerate(self.get_chain_boxes()):
+            near_boxes = []
+            if chain_box != None:
+                (min_x, min_y, min_z, max_x, max_y, max_z) = chain_box
+                for (ligand_index, ligand_box) in ligand_boxes:
+                    if min_x <= ligand_box[3] and max_x >= ligand_box[0] and min_y <= ligand_box[4] and max_y >= ligand_box[1] and min_z <= ligand_box[5] and max_z >= ligand_box[2]:
+                        active_ligands.add(ligand_index)
+                        near_boxes.append(ligand_box)
+
+            if not near_boxes:
+                statistics['chains_rejected'] += 1
+                statistics['residues_rejected'] += len(self.CHAIN_RESIDUES[chain_index])
+                continue
+
+            for (residue_index, sphere) in zip(self.CHAIN_RESIDUES[chain_index], self.get_residue_spheres(chain_index)):
+                if sphere != None:
+                    (x, y, z, radius) = sphere
+                    for (box_index, (min_x, min_y, min_z, max_x, max_y, max_z)) in enumerate(near_boxes):
+                        if x + radius < min_x or x - radius > max_x or y + radius < min_y or y - radius > max_y or z + radius < min_z or z - radius > max_z:
+                            continue
+
+                        # Kwadrat odległości środka sfery od prostopadłościanu liganda.
+                        delta_x = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+                        delta_y = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+                        delta_z = min_z - z if z < min_z else (z - max_z if z > max_z else 0.0)
+                        if delta_x * delta_x + delta_y * delta_y + delta_z * delta_z <= radius * radius:
+                            candidate_residues.append(residue_index)
+                            if box_index > 0:
+                                # Kolejne reszty łańcucha leżą zwykle w pobliżu tego samego liganda - jego prostopadłościan sprawdzany jest jako pierwszy.
+                                near_boxes.insert(0, near_boxes.pop(box_index))
+                            break
+                    else:
+                        statistics['residues_rejected'] += 1
+                else:
+                    statistics['residues_rejected'] += 1
+
+        statistics['ligands_rejected'] = len(LIGAND_BOXES) - len(active_ligands)
+        self.pruning_statistics = statistics
+
+        return (candidate_residues, active_ligands)
+
+    def get_domain_index(self) -> Domain_index:
+        """Funkcja zwracająca indeks przedziałowy domen struktury (budowany ponownie tylko po zmianie listy PFAM_DOMAINS)."""
+
+        domain_index_key = tuple(map(id, self.PFAM_DOMAINS))
+        if self.domain_index == None or self.domain_index_key != domain_index_key:
+            self.domain_index = Domain_index(self.PFAM_DOMAINS, self.CHAIN_ENTITIES)
+            self.domain_index_key = domain_index_key
+
+        return self.domain_index
+
+    def get_residue_domains(self, chain_name : str, residue_sequence_number : int) -> tuple[Pfam_domain, ...]:
+        """Funkcja zwracająca domeny Pfam zawierające resztę o podanym numerze w łańcuchu chain_name."""
+
+        return self.get_domain_index().get_domains(chain_name, residue_sequence_number)
+
+    def reset_ligands_environment(self):
+        """Funkcja unieważniająca zapamiętane wyniki wyszukiwania kontaktów (np. po zmianie atrybutów istniejących domen lub reszt)."""
+
+        self.atom_index_key = None
+        self.neighbor_search = None
+        self.CHAIN_BOXES = None
+        self.ligands_environment_cache = None
+        self.ligands_contacts_cache = None
+        self.domain_index = None
+
+        for residue in self.RESIDUES:
+            residue.bounding_sphere = None
+
+    def get_ligands_environment(self, cutoff : float = 5.0) -> list[tuple[Ligand, Residue, str, Pfam_domain]]:
+        """Funkcja zwracająca listę znalezionych miejsc kontaktu ligand - białko (ciężkie atomy w odległości mniejszej niż cutoff [A]). Wynik jest zapamiętywany do czasu zmiany list LIGANDS, CHAINS lub PFAM_DOMAINS."""
+
+        cache_key = (float(cutoff), self.get_atom_index_key(), tuple(map(id, self.PFAM_DOMAINS)))
+        if self.ligands_environment_cache == None or self.ligands_environment_cache[0] != cache_key:
+            self.ligands_environment_cache = (cache_key, self.find_ligands_environment(cutoff))
+
+        return list(self.ligands_environment_cache[1])
+
+    def get_ligands_analysis(self, cutoff : float = 5.0) -> tuple[list[tuple[Ligand, Residue, str, Pfam_domain]], list[tuple[Ligand, Pfam_domain]], list[tuple[Ligand, Pfam_domain]]]:
+        """Funkcja zwracająca w jednym przebiegu: listę miejsc kontaktu ligand - białko, domeny wiążące ligandy oraz domeny wiążące ligandy z uwzględnieniem wielokrotnych miejsc wiązania."""
+
+        ligands_environment = self.get_ligands_environment(cutoff)
+        return (ligands_environment, get_binding_domains(ligands_environment), get_binding_domains(ligands_environment, detailed=True))
+
+    def get_ligands_analyses(self, cutoffs : list[float]) -> tuple[dict[float, tuple], list[dict[int, tuple[float, int, int]]]]:
+        """Funkcja zwracająca słownik cutoff -> wynik get_ligands_analysis oraz najbliższe pary atomów kolejnych ligandów (find_ligands_contacts z closest=True)."""
+
+        # Jedno wyszukiwanie dla największej odległości - kontakty mniejszych odległości wybierane są według kwadratu odległości najbliższej pary atomów.
+        LIGAND_CONTACTS = self.find_ligands_contacts(max(cutoffs), closest=True)
+        ANALYSES : dict[float, tuple] = {}
+
+        for cutoff in sorted(set(cutoffs)):
+            max_squared_distance = squared_cutoff(cutoff)
+            ligands_environment = self.build_ligands_environment([
+                [residue_index for (residue_index, contact) in ligand_contacts.items() if contact[0] <= max_squared_distance]
+                for ligand_contacts in LIGAND_CONTACTS
+            ])
+            ANALYSES[cutoff] = (ligands_environment, get_binding_domains(ligands_environment), get_binding_domains(ligands_environment, detailed=True))
+
+        return (ANALYSES, LIGAND_CONTACTS)
+
+    def find_ligands_contacts(self, cutoff : float = 5.0, closest : bool = False) -> list:
+        """Funkcja zwracająca zbiory indeksów reszt w kontakcie z kolejnymi ligandami lub, przy closest=True, słowniki indeks reszty -> najbliższa para atomów."""
+
+        # Wynik zapamiętywany jest do czasu zmiany list LIGANDS lub CHAINS - wyszukiwanie przed wczytaniem domen Pfam (--prescan) nie jest powtarzane.
+        if self.atom_index_key != self.get_atom_index_key():
+            self.build_atom_index()
+
+        cache_key = (float(cutoff), closest, self.atom_index_key)
+        if self.ligands_contacts_cache == None or self.ligands_contacts_cache[0] != cache_key:
+            self.ligands_contacts_cache = (cache_key, self.search_ligands_contacts(cutoff, closest))
+
+        return self.ligands_contacts_cache[1]
+
+    def search_ligands_contacts(self, cutoff : float, closest : bool) -> list:
+        """Funkcja wyszukująca reszty w kontakcie z kolejnymi ligandami (bez zapamiętywania wyniku, por. find_ligands_contacts)."""
+
+        # Wstępna selekcja: siatka wyszukiwania sąsiadów budowana jest wyłącznie z reszt, które mogą znaleźć się w zasięgu któregokolwiek liganda.
+        heavy_atoms = self.ATOM_TABLE.HEAVY_ATOMS
+        LIGAND_ATOMS = [[atom_index for atom_index in ligand.ATOM_INDICES if heavy_atoms[atom_index]] for ligand in self.LIGANDS]
+        LIGAND_BOXES = []
+        reach = float(cutoff) + PRUNING_MARGIN
+        for ligand_atoms in LIGAND_ATOMS:
+            ligand_box = get_bounding_box(self.ATOM_TABLE.COORDINATES, ligand_atoms)
+            if ligand_box != None:
+                ligand_box = tuple(value - reach for value in ligand_box[: 3]) + tuple(value + reach for value in ligand_box[3 :])
+            LIGAND_BOXES.append(ligand_box)
+
+        (candidate_residues, active_ligands) = self.get_pruning_candidates(LIGAND_BOXES)
+        candidate_atoms = [atom_index for residue_index in candidate_residues for atom_index in self.RESIDUES[residue_index].ATOM_INDICES]
+
+        # Z modułem numpy kontakty wszystkich ligandów wyznaczane są jednocześnie (find_contacts_vectorized), bez niego - siatką komórkową (Neighbor_search).
+        if numpy != None:
+            return find_contacts_vectorized(self.ATOM_TABLE, self.ATOM_RESIDUE_INDEX,
+                [ligand_atoms if ligand_index in active_ligands else [] for (ligand_index, ligand_atoms) in enumerate(LIGAND_ATOMS)], candidate_atoms, cutoff, closest=closest)
+
+        neighbor_search = Neighbor_search(self.ATOM_TABLE, self.ATOM_RESIDUE_INDEX, cutoff, candidate_atoms)
+        search = neighbor_search.search_closest if closest else neighbor_search.search
+        return [
+            search(ligand.atom_table, ligand_atoms, cutoff) if ligand_index in active_ligands else ({} if closest else set())
+            for (ligand_index, (ligand, ligand_atoms)) in enumerate(zip(self.LIGANDS, LIGAND_ATOMS))
+        ]
+
+    def find_ligands_environment(self, cutoff : float = 5.0) -> list[tuple[Ligand, Residue, str, Pfam_domain]]:
+        """Funkcja wyszukująca miejsca kontaktu ligand - białko (bez zapamiętywania listy kontaktów)."""
+
+        return self.build_ligands_environment(self.find_ligands_contacts(cutoff))
+
+    def build_ligands_environment(self, LIGAND_CONTACTS : list) -> list[tuple[Ligand, Residue, str, Pfam_domain]]:
+        """Funkcja zestawiająca miejsca kontaktu ligand - białko z indeksów reszt w kontakcie z kolejnymi ligandami (wynik find_ligands_contacts)."""
 
         comparison_tuple = lambda ligand, residue, chain: (
             ligand.residue_name,
@@ -243,172 +1118,872 @@ class Structure:
             chain.chain_name
         )
 
-        fits = lambda domain, residue: domain.start <= residue.residue_sequence_number and domain.end >= residue.residue_sequence_number
-
         ligands_environment : list[tuple[Ligand, Residue, str, Pfam_domain]] = []
-        ligands_environment_quick_compare = []
+        ligands_environment_quick_compare : set[tuple[str, int, str, int, str]] = set()
+        domain_index = self.get_domain_index()
 
-        for ligand in self.LIGANDS:
-            for chain in self.CHAINS:
-                for residue in chain.RESIDUES:
-                    for atom_a in [atom for atom in residue.ATOMS if atom.atom_name[0] != 'H']:
-                        for atom_b in [atom for atom in ligand.ATOMS if atom.atom_name[0] != 'H']:
-                            if distance(atom_a, atom_b) < 5.0:
-                                comp_tuple = comparison_tuple(ligand, residue, chain)
-                                if comp_tuple not in ligands_environment_quick_compare:
-                                    ligands_environment_quick_compare.append(comp_tuple)
-
-                                    found_domain = False
-                                    for pfam_domain in self.PFAM_DOMAINS:
-                                        if pfam_domain.chain_name == chain.chain_name and fits(pfam_domain, residue):
-                                            ligands_environment.append( (ligand, residue, chain.chain_name, pfam_domain) )
-                                            found_domain = True
-
-                                    if found_domain == False:
-                                        ligands_environment.append( (ligand, residue, chain.chain_name, None) )
+        for (ligand, ligand_contacts) in zip(self.LIGANDS, LIGAND_CONTACTS):
+            # Posortowanie trafień odtwarza kolejność przeglądania łańcuchów i reszt.
+            for residue_index in sorted(ligand_contacts):
+                chain = self.CHAINS[self.RESIDUE_CHAIN_INDEX[residue_index]]
+                residue = self.RESIDUES[residue_index]
+
+                comp_tuple = comparison_tuple(ligand, residue, chain)
+                if comp_tuple not in ligands_environment_quick_compare:
+                    ligands_environment_quick_compare.add(comp_tuple)
+
+                    residue_domains = domain_index.get_domains(chain.chain_name, residue.residue_sequence_number)
+                    for pfam_domain in residue_domains:
+                        ligands_environment.append( (ligand, residue, chain.chain_name, pfam_domain) )
+
+                    if not residue_domains:
+                        ligands_environment.append( (ligand, residue, chain.chain_name, None) )
 
+        matched_ligands = {(m_ligand.residue_name, m_ligand.residue_sequence_number) for (m_ligand, _, _, _) in ligands_environment}
         for ligand in self.LIGANDS:
-            if (ligand.residue_name, ligand.residue_sequence_number) not in [(m_ligand.residue_name, m_ligand.residue_sequence_number) for (m_ligand, _, _, _) in ligands_environment]:
+            if (ligand.residue_name, ligand.residue_sequence_number) not in matched_ligands:
+                matched_ligands.add( (ligand.residue_name, ligand.residue_sequence_number) )
                 ligands_environment.append( (ligand, None, None, None) )
 
         return ligands_environment
 
-    def get_ligands_binding_domains(self) -> list[tuple[Ligand, Pfam_domain]]:
+    def get_ligands_binding_domains(self, cutoff : float = 5.0) -> list[tuple[Ligand, Pfam_domain]]:
         """Funkcja zwracająca domeny białkowe wiążące wskazane ligandy (nie uwzględniono wielokrotnych miejsc wiązania dla tego samego liganda w obrębie tej samej domeny)."""
 
-        ligands_environment = self.get_ligands_environment()
-        matched_domains : list[tuple[Ligand, Pfam_domain]] = []
-        matched_domains_quick_compare = []
-
-        for (ligand, _, _, pfam_domain) in ligands_environment:
-            if pfam_domain != None:
-                domain = (
-                    ligand.residue_name,
-                    pfam_domain.chain_name, 
-                    pfam_domain.pfam_accession, 
-                    pfam_domain.pfam_id, 
-                    pfam_domain.start, 
-                    pfam_domain.end
-                )
-                if domain not in matched_domains_quick_compare:
-                    matched_domains_quick_compare.append(domain)
-                    matched_domains.append( (ligand, pfam_domain) )
-
-        return matched_domains
-
-    def get_ligands_binding_domains_detailed(self) -> list[tuple[Ligand, Pfam_domain]]:
+        return get_binding_domains(self.get_ligands_environment(cutoff))
+
+    def get_ligands_binding_domains_detailed(self, cutoff : float = 5.0) -> list[tuple[Ligand, Pfam_domain]]:
         """Funkcja zwracająca domeny białkowe wiążące wskazane ligandy (uwzględniono wielokrotne miejsca wiązania dla tego samego liganda w obrębie tej samej domeny)."""
 
-        ligands_environment = self.get_ligands_environment()
-        matched_domains : list[tuple[Ligand, Pfam_domain]] = []
-        matched_domains_quick_compare = []
+        return get_binding_domains(self.get_ligands_environment(cutoff), detailed=True)
+
 
-        for (ligand, _, _, pfam_domain) in ligands_environment:
-            if pfam_domain != None:
-                domain = (
-                    ligand.residue_name,
-                    ligand.residue_sequence_number,
-                    pfam_domain.chain_name, 
-                    pfam_domain.pfam_accession, 
-                    pfam_domain.pfam_id, 
-                    pfam_domain.start, 
-                    pfam_domain.end
-                )
-                if domain not in matched_domains_quick_compare:
-                    matched_domains_quick_compare.append(domain)
-                    matched_domains.append( (ligand, pfam_domain) )
+# ------------------------------------------------------------------------------------------------------   
 
-        return matched_domains
 
+def get_binding_domains(ligands_environment : list[tuple[Ligand, Residue, str, Pfam_domain]], detailed : bool = False) -> list[tuple[Ligand, Pfam_domain]]:
+    """Funkcja zwracająca domeny białkowe wiążące ligandy z listy miejsc kontaktu ligand - białko (przy detailed=True z uwzględnieniem wielokrotnych miejsc wiązania)."""
 
-# ------------------------------------------------------------------------------------------------------   
+    matched_domains : list[tuple[Ligand, Pfam_domain]] = []
+    matched_domains_quick_compare : set[tuple] = set()
+
+    for (ligand, _, _, pfam_domain) in ligands_environment:
+        if pfam_domain != None:
+            domain = (
+                ligand.residue_name,
+                ligand.residue_sequence_number if detailed else None,
+                pfam_domain.chain_name, 
+                pfam_domain.pfam_accession, 
+                pfam_domain.pfam_id, 
+                pfam_domain.start, 
+                pfam_domain.end
+            )
+            if domain not in matched_domains_quick_compare:
+                matched_domains_quick_compare.add(domain)
+                matched_domains.append( (ligand, pfam_domain) )
+
+    return matched_domains
+
+
+def save_text_file(file_path : str, content : str):
+    """Funkcja zapisująca plik tekstowy w sposób atomowy (zapis do pliku tymczasowego i podmiana), bezpieczna przy pracy wielu procesów."""
+
+    temporary_path = f'{file_path}.{os.getpid()}.tmp'
+    output_file = open(temporary_path, 'w')
+    output_file.write(content)
+    output_file.close()
+    os.replace(temporary_path, file_path)
+
+
+def save_binary_file(file_path : str, content : bytes):
+    """Funkcja zapisująca plik binarny w sposób atomowy (analogicznie do save_text_file)."""
+
+    temporary_path = f'{file_path}.{os.getpid()}.tmp'
+    output_file = open(temporary_path, 'wb')
+    output_file.write(content)
+    output_file.close()
+    os.replace(temporary_path, file_path)
+
+
+def fetch_Pfam_xml(http, unp_accession : str, pfam_url : str = PFAM_URL) -> str:
+    """Funkcja pobierająca z bazy danych Pfam plik XML z architekturą domenową białka o wskazanym numerze dostępu UniProt."""
+
+    resource = http.request('GET', f'{pfam_url}/protein?output=xml&acc={unp_accession}')
+    if resource.status != 200:
+        raise IOError(f'Pfam request for {unp_accession} failed with status {resource.status}')
+
+    return resource.data.decode('utf-8')
 
 
-def parse_PDB_file(pdb_file_path, ligands : list[str] = []) -> Structure:
-    """Funkcja parsująca pliki PDB. Zwraca wczytaną cząsteczkę w postaci obiektu klasy Structure."""
+def parse_Pfam_xml(decoded_content : str) -> list[tuple[str, str, int, int]]:
+    """Funkcja zwracająca listę domen (pfam_accession, pfam_id, start, end) zapisanych w pliku XML bazy danych Pfam. Plik przetwarzany jest strumieniowo (expat), bez budowania drzewa DOM - odczytywane są wyłącznie atrybuty elementów match i bezpośrednio zagnieżdżonych w nich elementów location."""
 
+    domains : list[tuple[str, str, int, int]] = []
+    open_elements : list[tuple[str, dict]] = []
+
+    def start_element(name, attributes):
+        if name == 'location' and open_elements and open_elements[-1][0] == 'match':
+            match_attributes = open_elements[-1][1]
+            domains.append( (
+                match_attributes.get('accession', '').strip(),
+                match_attributes.get('id', '').strip(),
+                int(attributes.get('start', '')),
+                int(attributes.get('end', ''))
+            ) )
+        open_elements.append( (name, attributes if name == 'match' else None) )
+
+    def end_element(name):
+        open_elements.pop()
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.Parse(decoded_content, True)
+
+    return domains
+
+
+def read_UNP_records(pdb_file_path) -> list[Unp_record]:
+    """Funkcja wczytująca z pliku PDB lub mmCIF wyłącznie odniesienia do bazy danych UniProt (rekordy DBREF oraz kategorie struct_ref znajdują się w nagłówku, przed współrzędnymi atomów)."""
+
+    unp_records : list[Unp_record] = []
+    pdb_file = open_text_file(pdb_file_path)
+
+    if is_mmCIF_file(pdb_file_path):
+        header_lines : list[str] = []
+        for DATA in pdb_file:
+            if DATA.startswith('_atom_site.'):
+                break
+            header_lines.append(DATA.rstrip('\n'))
+        pdb_file.close()
+        (VALUES, ROW_LINES) = read_mmCIF_categories(header_lines, {'struct_ref', 'struct_ref_seq'})
+        return get_mmCIF_UNP_records(VALUES, ROW_LINES)[0]
+
+    for DATA in pdb_file:
+        RECORD_TYPE = DATA[0 : 6]
+        if RECORD_TYPE == 'ATOM  ' or RECORD_TYPE == 'HETATM':
+            break
+        if RECORD_TYPE == 'DBREF ' and DATA[26 : 32] == 'UNP   ':
+            unp_records.append(Unp_record(DATA[12 : 13], DATA[33 : 41], DATA[42 : 54]))
+
+    pdb_file.close()
+    return unp_records
+
+
+def prefetch_Pfam_data(pdb_files_paths : list[str], pfam_cache : Pfam_cache, concurrency : int = 8, retries : int = 3, backoff : float = 0.5, timeout : float = 30.0) -> tuple[int, int]:
+    """Funkcja pobierająca współbieżnie (co najwyżej concurrency zapytań naraz, wspólna pula połączeń) brakujące pliki XML z architekturami domenowymi dla wszystkich wskazanych plików PDB. Każdy numer dostępu UniProt pobierany jest jednokrotnie. Zwraca liczbę pobranych i niepobranych numerów dostępu."""
+
+    missing_accessions : dict[str, None] = {}
+    for pdb_file_path in pdb_files_paths:
+        try:
+            unp_records = read_UNP_records(pdb_file_path)
+        except:
+            continue
+
+        for unp_record in unp_records:
+            if unp_record.unp_accession not in missing_accessions and not pfam_cache.is_cached(unp_record.unp_accession):
+                missing_accessions[unp_record.unp_accession] = None
+
+    if not missing_accessions:
+        return (0, 0)
+
+    # Bez modułu urllib3 pobieranie wstępne jest pomijane - struktury bez architektur domenowych zostaną pominięte przy analizie.
+    if 'urllib3' not in globals():
+        print(Colors.YELLOW + 'urllib3 not found - domain information prefetch skipped' + Colors.END)
+        return (0, len(missing_accessions))
+
+    http = urllib3.PoolManager(
+        maxsize=concurrency,
+        retries=urllib3.Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False),
+        timeout=urllib3.Timeout(total=timeout))
+
+    def fetch(unp_accession : str) -> bool:
+        try:
+            pfam_cache.store(unp_accession, fetch_Pfam_xml(http, unp_accession, pfam_cache.pfam_url))
+            return True
+        except Exception as error:
+            print(Colors.RED + f'Could not fetch domain information for: {unp_accession} ({error})' + Colors.END)
+            return False
+
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    fetched = list(executor.map(fetch, missing_accessions))
+    executor.shutdown()
+
+    pfam_cache.network_fetches += fetched.count(True)
+    pfam_cache.enforce_size_limit()
+
+    return (fetched.count(True), fetched.count(False))
+
+
+# ------------------------------------------------------------------------------------------------------
+
+
+def build_PDB_records(line_numbers : list[int], record_kinds : list[int], residue_keys : list, residue_fields, atom_names : list[str], element_symbols : list[str],
+                      x_coordinates : list[str], y_coordinates : list[str], z_coordinates : list[str]) -> Pdb_records:
+    """Funkcja budująca zapis kolumnowy (klasa: Pdb_records) z wartości tekstowych kolejnych rekordów ATOM, HETATM i TER. Kolejne rekordy o jednakowym typie i kluczu reszty
+    (residue_keys) tworzą serię, a funkcja residue_fields wyznacza z klucza nazwę reszty, łańcuch i numer reszty. Kolumny atomów obejmują wyłącznie rekordy ATOM i HETATM.
+    Współrzędne i numery reszt konwertowane są zbiorczo."""
+
+    records = Pdb_records()
+    records.LINE_NUMBERS = array('i', line_numbers)
+
+    # Podział rekordów na serie (groupby porównuje kolejne klucze bez udziału interpretera).
+    sequence_numbers : list[str] = []
+    record_index = 0
+    for ((record_kind, residue_key), run) in groupby(zip(record_kinds, residue_keys)):
+        run_length = len(list(run))
+        (residue_name, chain_name, sequence_number) = residue_fields(residue_key)
+        for run_start in (range(record_index, record_index + run_length) if record_kind == Pdb_records.TER else (record_index, )):
+            records.RUN_STARTS.append(run_start)
+            records.RUN_KINDS.append(record_kind)
+            records.RESIDUE_NAMES.append(sys.intern(residue_name.strip()))
+            records.CHAIN_NAMES.append(sys.intern(chain_name.strip()))
+            sequence_numbers.append(sequence_number)
+        record_index += run_length
+
+    # Kolumny atomów - każda różna nazwa przycinana jest i współdzielona (sys.intern) tylko raz.
+    def text_column(values : list[str]) -> list[str]:
+        stripped_values = {value: sys.intern(value.strip()) for value in set(values)}
+        return list(map(stripped_values.__getitem__, values))
+
+    records.ATOM_TABLE.set_atom_names(text_column(atom_names))
+    records.ATOM_TABLE.ELEMENT_SYMBOLS = text_column(element_symbols)
+
+    # Konwersja zbiorcza. W razie błędu wyznaczany jest pierwszy rekord z niepoprawną wartością (numer reszty lub współrzędna),
+    # a tablice zawierają wartości poprzedzających go rekordów.
     try:
-        structure = Structure(pdb_file_path[-8 : -4].upper())
-        pdb_file = open(pdb_file_path, 'r')
-        line_counter = -1
+        records.SEQUENCE_NUMBERS = array('i', map(int, sequence_numbers))
+    except ValueError:
+        for (run_index, sequence_number) in enumerate(sequence_numbers):
+            try:
+                records.SEQUENCE_NUMBERS.append(int(sequence_number))
+            except ValueError:
+                records.error_run = run_index
+                records.error_record = records.RUN_STARTS[run_index]
+                break
 
+    coordinates = records.ATOM_TABLE.COORDINATES
+    try:
+        coordinates.frombytes(bytes(24 * len(atom_names)))
+        coordinates[0 : : 3] = array('d', map(float, x_coordinates))
+        coordinates[1 : : 3] = array('d', map(float, y_coordinates))
+        coordinates[2 : : 3] = array('d', map(float, z_coordinates))
+
+    except ValueError:
+        del coordinates[:]
+        atom_records = [record_index for (record_index, record_kind) in enumerate(record_kinds) if record_kind != Pdb_records.TER]
+        for (atom_index, (x_coordinate, y_coordinate, z_coordinate)) in enumerate(zip(x_coordinates, y_coordinates, z_coordinates)):
+            try:
+                coordinates.extend( (float(x_coordinate), float(y_coordinate), float(z_coordinate)) )
+            except ValueError:
+                record_index = atom_records[atom_index]
+                if records.error_record == None or record_index <= records.error_record:
+                    records.error_run = bisect_right(records.RUN_STARTS, record_index) - 1
+                    records.error_record = record_index
+                    records.coordinates_error = True
+                break
+
+    # Sfery otaczające atomy serii - wykorzystywane przy wstępnej selekcji reszt w wyszukiwaniu kontaktów (zapisywane w pliku pamięci podręcznej).
+    if records.error_run == None:
+        atom_index = 0
+        for run_index in range(len(records.RUN_STARTS)):
+            if records.RUN_KINDS[run_index] == Pdb_records.TER:
+                records.RUN_SPHERES.extend( (0.0, 0.0, 0.0, 0.0) )
+            else:
+                run_length = records.get_run_length(run_index)
+                records.RUN_SPHERES.extend(get_bounding_sphere(get_bounding_box(coordinates, range(atom_index, atom_index + run_length))))
+                atom_index += run_length
+
+    return records
+
+
+def read_PDB_records(pdb_file_path) -> Pdb_records:
+    """Funkcja wczytująca plik PDB (także skompresowany .gz) do postaci kolumnowej (klasa: Pdb_records). Typ rekordu rozpoznawany jest jednokrotnie, a kolumny wycinane są zbiorczo."""
+
+    RECORD_KINDS = {'ATOM  ': Pdb_records.ATOM, 'HETATM': Pdb_records.HETATM, 'TER   ': Pdb_records.TER, 'DBREF ': None}
+
+    LINES = read_lines(pdb_file_path)
+
+    selected_lines = [line_number for (line_number, DATA) in enumerate(LINES) if DATA[0 : 6] in RECORD_KINDS]
+    line_numbers = [line_number for line_number in selected_lines if LINES[line_number][0 : 6] != 'DBREF ']
+    record_lines = [LINES[line_number] for line_number in line_numbers]
+    atom_lines = [DATA for DATA in record_lines if DATA[0 : 6] != 'TER   ']
+
+    records = build_PDB_records(
+        line_numbers,
+        [RECORD_KINDS[DATA[0 : 6]] for DATA in record_lines],
+        [DATA[17 : 26] for DATA in record_lines],
+        lambda residue_key: (residue_key[0 : 3], residue_key[4 : 5], residue_key[5 : 9]),
+        [DATA[12 : 16] for DATA in atom_lines],
+        [DATA[76 : 78] for DATA in atom_lines],
+        [DATA[30 : 38] for DATA in atom_lines],
+        [DATA[38 : 46] for DATA in atom_lines],
+        [DATA[46 : 54] for DATA in atom_lines])
+
+    for line_number in selected_lines:
+        DATA = LINES[line_number]
+        if DATA[0 : 6] == 'DBREF ' and DATA[26 : 32] == 'UNP   ':
+            records.UNP_RECORDS.append(Unp_record(DATA[12 : 13], DATA[33 : 41], DATA[42 : 54]))
+            records.UNP_LINE_NUMBERS.append(line_number)
+
+    return records
+
+
+def open_text_file(file_path):
+    """Funkcja otwierająca plik tekstowy do odczytu - pliki *.gz (także bgzip) dekompresowane są strumieniowo."""
+
+    if str(file_path).endswith('.gz'):
+        return gzip.open(file_path, 'rt')
+
+    return open(file_path, 'r')
+
+
+def open_output_file(file_path, buffer_size : int = 2 ** 20):
+    """Funkcja otwierająca plik tekstowy do zapisu z buforem o rozmiarze buffer_size - pliki *.gz kompresowane są strumieniowo (gzip),
+    a pliki *.zst w formacie zstd (wymaga modułu zstandard)."""
+
+    file_path = str(file_path)
+
+    if file_path.endswith('.gz'):
+        return io.TextIOWrapper(io.BufferedWriter(gzip.GzipFile(file_path, 'wb', compresslevel=6), buffer_size))
+
+    if file_path.endswith('.zst'):
+        if zstandard == None:
+            print(Colors.RED + f'Module zstandard not found, cannot write: {file_path}' + Colors.END)
+            raise ValueError
+        return io.TextIOWrapper(io.BufferedWriter(zstandard.ZstdCompressor().stream_writer(open(file_path, 'wb')), buffer_size))
+
+    return open(file_path, 'w', buffering=buffer_size)
+
+
+def read_lines(file_path) -> list[str]:
+    text_file = open_text_file(file_path)
+    LINES = text_file.read().split('\n')
+    text_file.close()
+
+    return LINES
+
+
+def is_mmCIF_file(file_path) -> bool:
+    return str(file_path).endswith(('.cif', '.cif.gz'))
+
+
+def get_structure_ID(file_path) -> str:
+    """Funkcja wyznaczająca identyfikator struktury z nazwy pliku (cztery znaki poprzedzające rozszerzenie .pdb, .cif lub .ent, także skompresowane .gz)."""
+
+    file_path = str(file_path)
+    if file_path.endswith('.gz'):
+        file_path = file_path[: -3]
+
+    return file_path[-8 : -4].upper()
+
+
+def split_mmCIF_line(line : str) -> list[str]:
+    """Funkcja dzieląca wiersz pliku mmCIF na wartości (wartości w apostrofach lub cudzysłowach, komentarze #)."""
+
+    if '\'' not in line and '"' not in line and '#' not in line:
+        return line.split()
+
+    values : list[str] = []
+    position = 0
+    while position < len(line):
+        if line[position] in ' \t':
+            position += 1
+        elif line[position] == '#':
+            break
+        elif line[position] in '\'"':
+            # Cudzysłów zamyka wartość wyłącznie wtedy, gdy następuje po nim biały znak lub koniec wiersza.
+            end = line.find(line[position], position + 1)
+            while end != -1 and end + 1 < len(line) and line[end + 1] not in ' \t':
+                end = line.find(line[position], end + 1)
+            if end == -1:
+                end = len(line)
+            values.append(line[position + 1 : end])
+            position = end + 1
+        else:
+            end = position
+            while end < len(line) and line[end] not in ' \t':
+                end += 1
+            values.append(line[position : end])
+            position = end
+
+    return values
+
+
+def read_mmCIF_categories(lines : list[str], categories : set[str]) -> tuple[dict[str, dict[str, list[str]]], dict[str, list[int]]]:
+    """Funkcja wczytująca z pliku mmCIF (lista wierszy) wskazane kategorie, np. atom_site. Zwraca słownik {kategoria: {pole: wartości}}
+    oraz {kategoria: numery wierszy kolejnych wierszy tabeli}. Wiersze pozostałych kategorii są pomijane bez dzielenia na wartości."""
+
+    VALUES : dict[str, dict[str, list[str]]] = {}
+    ROW_LINES : dict[str, list[int]] = {}
+
+    loop_category : str = None
+    loop_items : list[str] = None                   # Pola bieżącej pętli loop_ (None - poza pętlą)
+    loop_header : bool = False                      # Czy wczytywany jest nagłówek pętli
+    loop_values : list[str] = None                  # Wartości bieżącej pętli (None - pętla pomijana)
+    loop_lines : list[tuple[int, int]] = []         # Numer wiersza i liczba wartości w wierszu
+    pending_item : tuple[str, str] = None           # Pole poza pętlą oczekujące na wartość w kolejnym wierszu
+    text_field : list[str] = None                   # Wartość wielowierszowa ograniczona wierszami rozpoczynającymi się od ';'
+    text_field_line = 0
+
+    def finish_loop():
+        if loop_values != None:
+            items_number = len(loop_items)
+            if len(loop_values) % items_number != 0:
+                raise ValueError(f'Incomplete rows in mmCIF category: {loop_category}')
+            category_values = VALUES.setdefault(loop_category, {})
+            for (item_index, item) in enumerate(loop_items):
+                category_values[item] = loop_values[item_index : : items_number]
+            if all(values_number == items_number for (_, values_number) in loop_lines):
+                ROW_LINES[loop_category] = [line_number for (line_number, _) in loop_lines]
+            else:
+                value_lines = [line_number for (line_number, values_number) in loop_lines for _ in range(values_number)]
+                ROW_LINES[loop_category] = value_lines[0 : : items_number]
+
+    def add_values(values : list[str], line_number : int):
+        nonlocal pending_item
+        if pending_item != None:
+            (category, item) = pending_item
+            VALUES.setdefault(category, {})[item] = [values[0]]
+            ROW_LINES.setdefault(category, [line_number])
+            pending_item = None
+        elif loop_values != None and values:
+            loop_values.extend(values)
+            loop_lines.append( (line_number, len(values)) )
+
+    for (line_number, line) in enumerate(lines):
+        if text_field != None:
+            if line.startswith(';'):
+                add_values(['\n'.join(text_field)], text_field_line)
+                text_field = None
+            else:
+                text_field.append(line)
+            continue
+
+        first_character = line[0 : 1]
+
+        if first_character == '_':
+            (name, _, rest) = line.partition(' ')
+            (category, _, item) = name[1 :].partition('.')
+
+            if loop_header:
+                if not loop_items:
+                    loop_category = category
+                    loop_values = [] if category in categories else None
+                loop_items.append(item)
+                continue
+
+            finish_loop()
+            (loop_items, loop_values, loop_lines) = (None, None, [])
+            if category in categories:
+                values = split_mmCIF_line(rest)
+                if values:
+                    VALUES.setdefault(category, {})[item] = [values[0]]
+                    ROW_LINES.setdefault(category, [line_number])
+                else:
+                    pending_item = (category, item)
+
+        elif first_character == ';':
+            loop_header = False
+            text_field = [line[1 :]]
+            text_field_line = line_number
+
+        elif first_character == '#' or not line.strip():
+            continue
+
+        elif line.startswith(('loop_', 'data_', 'save_')):
+            finish_loop()
+            (loop_items, loop_values, loop_lines) = ([] if line.startswith('loop_') else None, None, [])
+            loop_header = loop_items != None
+
+        else:
+            loop_header = False
+            if pending_item != None or loop_values != None:
+                add_values(split_mmCIF_line(line), line_number)
+
+    finish_loop()
+
+    return (VALUES, ROW_LINES)
+
+
+def read_mmCIF_records(cif_file_path) -> Pdb_records:
+    """Funkcja wczytująca plik mmCIF do postaci kolumnowej (klasa: Pdb_records) zgodnej z plikiem PDB: rekordy ATOM i HETATM z kategorii atom_site
+    (pola auth_*), rekordy TER dodawane po każdym łańcuchu polimeru (label_asym_id encji z kategorii entity_poly) oraz odniesienia UNP
+    z kategorii struct_ref i struct_ref_seq."""
+
+    (VALUES, ROW_LINES) = read_mmCIF_categories(read_lines(cif_file_path), {'atom_site', 'entity', 'entity_poly', 'struct_ref', 'struct_ref_seq'})
+    ATOM_SITE = VALUES.get('atom_site', {})
+
+    def column(category_values : dict[str, list[str]], *items : str) -> list[str]:
+        for item in items:
+            if item in category_values:
+                return category_values[item]
+        raise ValueError(f'Missing mmCIF item: {items[0]}')
+
+    GROUPS = column(ATOM_SITE, 'group_PDB')
+    RECORD_KINDS = {'ATOM': Pdb_records.ATOM, 'HETATM': Pdb_records.HETATM}
+    rows = [row_index for (row_index, group) in enumerate(GROUPS) if group in RECORD_KINDS]
+
+    def rows_column(*items : str) -> list[str]:
+        values = column(ATOM_SITE, *items)
+        return [values[row_index] for row_index in rows]
+
+    RESIDUE_NAMES = rows_column('auth_comp_id', 'label_comp_id')
+    CHAIN_NAMES = rows_column('auth_asym_id', 'label_asym_id')
+    SEQUENCE_NUMBERS = rows_column('auth_seq_id', 'label_seq_id')
+    ASYM_IDS = rows_column('label_asym_id', 'auth_asym_id')
+    ENTITY_IDS = rows_column('label_entity_id') if 'label_entity_id' in ATOM_SITE else [None] * len(rows)
+    MODELS = rows_column('pdbx_PDB_model_num') if 'pdbx_PDB_model_num' in ATOM_SITE else ['1'] * len(rows)
+    ROW_KINDS = [RECORD_KINDS[GROUPS[row_index]] for row_index in rows]
+    LINE_NUMBERS = [ROW_LINES['atom_site'][row_index] for row_index in rows] if rows else []
+
+    if 'entity_poly' in VALUES:
+        POLYMER_ENTITIES = set(column(VALUES['entity_poly'], 'entity_id'))
+    elif 'entity' in VALUES and 'type' in VALUES['entity']:
+        POLYMER_ENTITIES = {entity_id for (entity_id, entity_type) in zip(column(VALUES['entity'], 'id'), VALUES['entity']['type']) if entity_type == 'polymer'}
+    else:
+        POLYMER_ENTITIES = None
+
+    # Rekordy w kolejności pliku PDB: po ostatnim atomie każdego łańcucha polimeru (ciągły blok atomów jednego label_asym_id w obrębie modelu)
+    # dodawany jest rekord TER z nazwą i numerem ostatniej reszty łańcucha.
+    record_rows : list[int] = []
+    record_kinds : list[int] = []
+    row_index = 0
+    for ((model, asym_id, entity_id), block) in groupby(zip(MODELS, ASYM_IDS, ENTITY_IDS)):
+        block_length = len(list(block))
+        record_rows.extend(range(row_index, row_index + block_length))
+        record_kinds.extend(ROW_KINDS[row_index : row_index + block_length])
+
+        if POLYMER_ENTITIES != None and entity_id != None:
+            is_polymer = entity_id in POLYMER_ENTITIES
+        else:
+            is_polymer = ROW_KINDS[row_index] == Pdb_records.ATOM
+
+        row_index += block_length
+        if is_polymer:
+            record_rows.append(row_index - 1)
+            record_kinds.append(Pdb_records.TER)
+
+    records = build_PDB_records(
+        [LINE_NUMBERS[row_index] for row_index in record_rows],
+        record_kinds,
+        [(RESIDUE_NAMES[row_index], CHAIN_NAMES[row_index], SEQUENCE_NUMBERS[row_index]) for row_index in record_rows],
+        lambda residue_key: residue_key,
+        rows_column('auth_atom_id', 'label_atom_id'),
+        rows_column('type_symbol') if 'type_symbol' in ATOM_SITE else [''] * len(rows),
+        rows_column('Cartn_x'),
+        rows_column('Cartn_y'),
+        rows_column('Cartn_z'))
+
+    (records.UNP_RECORDS, records.UNP_LINE_NUMBERS) = get_mmCIF_UNP_records(VALUES, ROW_LINES)
+
+    return records
+
+
+def get_mmCIF_UNP_records(VALUES : dict[str, dict[str, list[str]]], ROW_LINES : dict[str, list[int]]) -> tuple[list[Unp_record], array]:
+    """Funkcja zwracająca odniesienia do bazy UniProt (odpowiedniki rekordów DBREF) z kategorii struct_ref i struct_ref_seq oraz numery wierszy, w których się znajdują."""
+
+    unp_records : list[Unp_record] = []
+    unp_line_numbers : array = array('i')
+    if 'struct_ref' not in VALUES or 'struct_ref_seq' not in VALUES:
+        return (unp_records, unp_line_numbers)
+
+    STRUCT_REF = VALUES['struct_ref']
+    UNP_REFERENCES = {
+        reference_id: (accession, code)
+        for (reference_id, database, accession, code)
+        in zip(STRUCT_REF['id'], STRUCT_REF['db_name'], STRUCT_REF['pdbx_db_accession'], STRUCT_REF['db_code'])
+        if database == 'UNP'
+    }
+
+    STRUCT_REF_SEQ = VALUES['struct_ref_seq']
+    for (row_index, (reference_id, chain_name)) in enumerate(zip(STRUCT_REF_SEQ['ref_id'], STRUCT_REF_SEQ['pdbx_strand_id'])):
+        if reference_id in UNP_REFERENCES:
+            (accession, code) = UNP_REFERENCES[reference_id]
+            unp_records.append(Unp_record(chain_name, accession, code))
+            unp_line_numbers.append(ROW_LINES['struct_ref_seq'][row_index])
+
+    return (unp_records, unp_line_numbers)
+
+
+def get_records_cache_path(pdb_file_path) -> str:
+    return f'{pdb_file_path}.records'
+
+
+def save_PDB_records(records : Pdb_records, records_file_path : str, pdb_file_status : os.stat_result):
+    """Funkcja zapisująca rekordy pliku PDB w postaci binarnej: nagłówek (PDB_RECORDS_HEADER), kolumny liczbowe wyrównane do 8 bajtów oraz tablica napisów
+    (nazwy reszt, łańcuchów, atomów, symbole pierwiastków i pola odniesień UNP zapisywane są jako indeksy tej tablicy)."""
+
+    UNP_FIELDS = [field for unp_record in records.UNP_RECORDS for field in (unp_record.chain_name, unp_record.unp_accession, unp_record.unp_id)]
+    TEXT_COLUMNS = (records.RESIDUE_NAMES, records.CHAIN_NAMES, records.ATOM_TABLE.ATOM_NAMES, records.ATOM_TABLE.ELEMENT_SYMBOLS, UNP_FIELDS)
+
+    string_ids : dict[str, int] = {}
+    for column in TEXT_COLUMNS:
+        for value in set(column):
+            string_ids.setdefault(value, len(string_ids))
+    strings = '\n'.join(string_ids).encode('utf-8')
+
+    SECTIONS = [
+        array('i', records.LINE_NUMBERS),
+        array('i', records.RUN_STARTS),
+        array('B', records.RUN_KINDS),
+        array('i', records.SEQUENCE_NUMBERS),
+        *[array('i', map(string_ids.__getitem__, column)) for column in TEXT_COLUMNS],
+        array('i', records.UNP_LINE_NUMBERS),
+        array('d', records.ATOM_TABLE.COORDINATES),
+        array('d', records.RUN_SPHERES),
+        strings
+    ]
+
+    content = bytearray(PDB_RECORDS_HEADER.pack(
+        PDB_RECORDS_MAGIC,
+        pdb_file_status.st_mtime_ns,
+        pdb_file_status.st_size,
+        len(records.LINE_NUMBERS),
+        len(records.RUN_STARTS),
+        len(records.ATOM_TABLE.ATOM_NAMES),
+        len(records.UNP_RECORDS),
+        len(strings)))
+
+    for section in SECTIONS:
+        content += section
+        content += bytes(-len(content) % 8)
+
+    save_binary_file(records_file_path, content)
+
+
+def load_PDB_records(records_file_path : str, pdb_file_status : os.stat_result) -> Pdb_records:
+    """Funkcja wczytująca rekordy zapisane funkcją save_PDB_records. Plik odwzorowywany jest w pamięci (mmap), a kolumny liczbowe są widokami memoryview
+    bez kopiowania danych. Zwraca None, jeżeli plik nie odpowiada aktualnemu plikowi PDB (st_mtime_ns, st_size)."""
+
+    records_file = open(records_file_path, 'rb')
+    buffer = mmap.mmap(records_file.fileno(), 0, access=mmap.ACCESS_READ)
+    records_file.close()
+
+    (magic, pdb_mtime_ns, pdb_size, records_number, runs_number, atoms_number, unp_number, strings_size) = PDB_RECORDS_HEADER.unpack_from(buffer)
+    if magic != PDB_RECORDS_MAGIC or pdb_mtime_ns != pdb_file_status.st_mtime_ns or pdb_size != pdb_file_status.st_size:
+        buffer.close()
+        return None
+
+    view = memoryview(buffer)
+    offset = PDB_RECORDS_HEADER.size
+
+    def section(length : int, typecode : str) -> memoryview:
+        nonlocal offset
+        size = length * struct.calcsize(typecode)
+        values = view[offset : offset + size].cast(typecode)
+        offset += size + (-size % 8)
+        return values
+
+    records = Pdb_records()
+    records.LINE_NUMBERS = section(records_number, 'i')
+    records.RUN_STARTS = section(runs_number, 'i')
+    records.RUN_KINDS = section(runs_number, 'B')
+    records.SEQUENCE_NUMBERS = section(runs_number, 'i')
+    RESIDUE_NAME_IDS = section(runs_number, 'i')
+    CHAIN_NAME_IDS = section(runs_number, 'i')
+    ATOM_NAME_IDS = section(atoms_number, 'i')
+    ELEMENT_SYMBOL_IDS = section(atoms_number, 'i')
+    UNP_FIELD_IDS = section(3 * unp_number, 'i')
+    records.UNP_LINE_NUMBERS = section(unp_number, 'i')
+    records.ATOM_TABLE.COORDINATES = section(3 * atoms_number, 'd')
+    records.RUN_SPHERES = section(4 * runs_number, 'd')
+    strings = [sys.intern(value) for value in section(strings_size, 'B').tobytes().decode('utf-8').split('\n')]
+
+    records.RESIDUE_NAMES = list(map(strings.__getitem__, RESIDUE_NAME_IDS))
+    records.CHAIN_NAMES = list(map(strings.__getitem__, CHAIN_NAME_IDS))
+    records.ATOM_TABLE.set_atom_names(list(map(strings.__getitem__, ATOM_NAME_IDS)))
+    records.ATOM_TABLE.ELEMENT_SYMBOLS = list(map(strings.__getitem__, ELEMENT_SYMBOL_IDS))
+    records.UNP_RECORDS = [
+        Unp_record(strings[UNP_FIELD_IDS[3 * index]], strings[UNP_FIELD_IDS[3 * index + 1]], strings[UNP_FIELD_IDS[3 * index + 2]])
+        for index in range(unp_number)
+    ]
+
+    return records
+
+
+def get_PDB_records(pdb_file_path, records_cache : bool = True) -> Pdb_records:
+    """Funkcja zwracająca rekordy pliku PDB: z pliku pamięci podręcznej {plik PDB}.records, jeżeli odpowiada on aktualnemu plikowi PDB,
+    w przeciwnym razie z pliku tekstowego (zapisując nowy plik pamięci podręcznej). Pliki z błędami nie są zapisywane."""
+
+    pdb_file_status = os.stat(pdb_file_path)
+    records_file_path = get_records_cache_path(pdb_file_path)
+
+    if records_cache and os.path.isfile(records_file_path):
         try:
-            for DATA in pdb_file:
-                line_counter += 1
-                RECORD_TYPE = DATA[0 : 6]
-                LIGAND_TYPE = DATA[17 : 20]
-                DATABASE = DATA[26 : 32]
-
-                if RECORD_TYPE == 'HETATM' and LIGAND_TYPE.strip() in ligands:
-                    ATOM_NAME = DATA[12 : 16]
-                    ELEM_SYMBOL = DATA[76 : 78]
-                    X_COORD = DATA[30 : 38]
-                    Y_COORD = DATA[38 : 46]
-                    Z_COORD = DATA[46 : 54]
-
-                    RES_NAME = DATA[17 : 20]
-                    RES_SEQ_NUM = DATA[22 : 26]
-                    
-                    next_atom = Atom(ATOM_NAME, ELEM_SYMBOL, X_COORD, Y_COORD, Z_COORD)
-
-                    if structure.LIGANDS:
-                        if structure.LIGANDS[-1].residue_sequence_number == int(RES_SEQ_NUM):
-                            structure.LIGANDS[-1].push_atom(next_atom)
-                        else:
-                            next_ligand = Ligand(RES_NAME, RES_SEQ_NUM)
-                            structure.LIGANDS.append(next_ligand)
-                            structure.LIGANDS[-1].push_atom(next_atom)
-                    else:
-                        next_ligand = Ligand(RES_NAME, RES_SEQ_NUM)
-                        structure.LIGANDS.append(next_ligand)
-                        structure.LIGANDS[-1].push_atom(next_atom)
-
-                elif RECORD_TYPE == 'ATOM  ' or RECORD_TYPE == 'HETATM':
-                    ATOM_NAME = DATA[12 : 16]
-                    ELEM_SYMBOL = DATA[76 : 78]
-                    X_COORD = DATA[30 : 38]
-                    Y_COORD = DATA[38 : 46]
-                    Z_COORD = DATA[46 : 54]
-
-                    CHAIN_IDENT = DATA[21 : 22]
-                    RES_NAME = DATA[17 : 20]
-                    RES_SEQ_NUM = DATA[22 : 26]
-
-                    next_atom = Atom(ATOM_NAME, ELEM_SYMBOL, X_COORD, Y_COORD, Z_COORD)
-                    if structure.CHAINS:
-                        if structure.CHAINS[-1].chain_name == str(CHAIN_IDENT).strip():
-                            if structure.CHAINS[-1].RESIDUES[-1].residue_sequence_number == int(RES_SEQ_NUM):
-                                structure.CHAINS[-1].RESIDUES[-1].push_atom(next_atom)
-                            else:
-                                next_residue = Residue(RES_NAME, RES_SEQ_NUM)
-                                structure.CHAINS[-1].push_residue(next_residue)
-                                structure.CHAINS[-1].RESIDUES[-1].push_atom(next_atom)
-                        else:
-                            next_chain = Chain(CHAIN_IDENT)
-                            next_residue = Residue(RES_NAME, RES_SEQ_NUM)
-                            structure.CHAINS.append(next_chain)
-                            structure.CHAINS[-1].push_residue(next_residue)
-                            structure.CHAINS[-1].RESIDUES[-1].push_atom(next_atom)
-                    else:
-                        next_chain = Chain(CHAIN_IDENT)
-                        next_residue = Residue(RES_NAME, RES_SEQ_NUM)
-                        structure.CHAINS.append(next_chain)
-                        structure.CHAINS[-1].push_residue(next_residue)
-                        structure.CHAINS[-1].RESIDUES[-1].push_atom(next_atom)
+            records = load_PDB_records(records_file_path, pdb_file_status)
+            if records != None:
+                return records
+        except:
+            pass
 
-                elif RECORD_TYPE == 'TER   ':
-                    RES_NAME = DATA[17 : 20]
-                    RES_SEQ_NUM = DATA[22 : 26]
+    records = read_mmCIF_records(pdb_file_path) if is_mmCIF_file(pdb_file_path) else read_PDB_records(pdb_file_path)
 
-                    structure.CHAINS[-1].push_residue(Termination_symbol(RES_NAME, RES_SEQ_NUM))
+    if records_cache and records.error_run == None:
+        try:
+            save_PDB_records(records, records_file_path, pdb_file_status)
+        except:
+            # Brak możliwości zapisu (np. katalog tylko do odczytu) - pliki wczytywane są bez pamięci podręcznej.
+            pass
+
+    return records
+
+
+def get_hetero_names(pdb_file_path, records_cache : bool = True) -> frozenset[str]:
+    """Funkcja wstępnie przeglądająca plik struktury: zwraca nazwy reszt rekordów HETATM bez wczytywania atomów. W plikach PDB przeglądane są wyłącznie
+    kolumny 18 - 20 rekordów HETATM, pliki mmCIF wczytywane są funkcją get_PDB_records (z pliku pamięci podręcznej, jeżeli jest aktualny)."""
+
+    if is_mmCIF_file(pdb_file_path):
+        records = get_PDB_records(pdb_file_path, records_cache)
+        return frozenset(residue_name for (residue_name, record_kind) in zip(records.RESIDUE_NAMES, records.RUN_KINDS) if record_kind == Pdb_records.HETATM)
+
+    pdb_file = gzip.open(pdb_file_path, 'rb') if str(pdb_file_path).endswith('.gz') else open(pdb_file_path, 'rb')
+    content = pdb_file.read()
+    pdb_file.close()
+
+    return frozenset(residue_name.decode('utf-8', 'replace').strip() for residue_name in set(HETATM_RESIDUE_NAME.findall(content)))
+
+
+def get_distant_chain_runs(records : Pdb_records, ligands : frozenset[str], reach : float) -> bytearray:
+    """Funkcja wyznaczająca serie rekordów łańcuchów leżących w całości poza zasięgiem ligandów (reach - odległość kontaktu): 1 - seria pomijana przy wczytywaniu.
+    Odcinek łańcucha (kolejne serie o tej samej nazwie łańcucha wraz z rekordami TER) pomijany jest, jeżeli sfera otaczająca żadnej z jego serii
+    nie sięga prostopadłościanu otaczającego serię liganda powiększonego o reach. Sfery obejmują również atomy wodoru, więc wynik jest zachowawczy."""
+
+    runs_number = len(records.RUN_STARTS)
+    distant_runs = bytearray(runs_number)
+    if len(records.RUN_SPHERES) == 0 or records.error_run != None:
+        return distant_runs
+
+    reach = float(reach) + PRUNING_MARGIN
+    LIGAND_BOXES = []
+    SEGMENTS : list[list[int]] = []
+    chain_name = None
+
+    for run_index in range(runs_number):
+        record_kind = records.RUN_KINDS[run_index]
+        if record_kind == Pdb_records.HETATM and records.RESIDUE_NAMES[run_index] in ligands:
+            (x, y, z, radius) = records.get_run_sphere(run_index)
+            LIGAND_BOXES.append( (x - radius - reach, y - radius - reach, z - radius - reach, x + radius + reach, y + radius + reach, z + radius + reach) )
+        elif record_kind == Pdb_records.TER:
+            if SEGMENTS:
+                SEGMENTS[-1].append(run_index)
+        else:
+            if not SEGMENTS or records.CHAIN_NAMES[run_index] != chain_name:
+                SEGMENTS.append([])
+                chain_name = records.CHAIN_NAMES[run_index]
+            SEGMENTS[-1].append(run_index)
+
+    for segment in SEGMENTS:
+        near = False
+        for run_index in segment:
+            if records.RUN_KINDS[run_index] == Pdb_records.TER:
+                continue
+            (x, y, z, radius) = records.get_run_sphere(run_index)
+            for (min_x, min_y, min_z, max_x, max_y, max_z) in LIGAND_BOXES:
+                delta_x = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+                delta_y = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+                delta_z = min_z - z if z < min_z else (z - max_z if z > max_z else 0.0)
+                if delta_x * delta_x + delta_y * delta_y + delta_z * delta_z <= radius * radius:
+                    near = True
+                    break
+            if near:
+                break
+
+        if not near:
+            for run_index in segment:
+                distant_runs[run_index] = 1
+
+    return distant_runs
+
+
+def parse_PDB_file(pdb_file_path, ligands : list[str] = [], records_cache : bool = True, reach : float = None) -> Structure:
+    """Funkcja parsująca pliki PDB. Zwraca wczytaną cząsteczkę w postaci obiektu klasy Structure. Przy podaniu reach (odległość kontaktu) łańcuchy leżące
+    w całości poza zasięgiem ligandów nie są wczytywane (get_distant_chain_runs) - wyniki wyszukiwania kontaktów nie ulegają zmianie."""
 
-                elif RECORD_TYPE == 'DBREF ' and DATABASE == 'UNP   ':
-                    CHAIN_IDENT = DATA[12 : 13]
-                    DB_ACCESSION = DATA[33 : 41]
-                    ID_CODE = DATA[42 : 54]
-                    structure.UNP_RECORDS.append(Unp_record(CHAIN_IDENT, DB_ACCESSION, ID_CODE))
+    try:
+        structure = Structure(get_structure_ID(pdb_file_path))
+        ligands = frozenset(ligands)
+        records = Pdb_records()
+        line_counter = -1
 
-            pdb_file.close()
+        try:
+            records = get_PDB_records(pdb_file_path, records_cache)
+
+            # Tablica atomów struktury jest tablicą atomów rekordów - reszty i ligandy otrzymują wyłącznie przedziały indeksów atomów.
+            # O przynależności serii rekordów decyduje jej pierwszy rekord.
+            structure.ATOM_TABLE = records.ATOM_TABLE
+            structure.UNP_RECORDS = list(records.UNP_RECORDS)
+            atom_table = structure.ATOM_TABLE
+            CHAINS = structure.CHAINS
+            LIGANDS = structure.LIGANDS
+            RESIDUE_NAMES = records.RESIDUE_NAMES
+            CHAIN_NAMES = records.CHAIN_NAMES
+            runs_number = len(records.RUN_STARTS)
+            if records.error_run != None:
+                # Seria z błędnym rekordem przetwarzana jest do rekordu poprzedzającego błąd.
+                runs_number = records.error_run + (1 if records.error_record > records.RUN_STARTS[records.error_run] else 0)
+            atom_index = 0
+            structure.HETERO_NAMES = frozenset(RESIDUE_NAMES[run_index] for run_index in range(runs_number) if records.RUN_KINDS[run_index] == Pdb_records.HETATM)
+            distant_runs = get_distant_chain_runs(records, ligands, reach) if reach != None else bytearray(runs_number)
+            chain_break = False
+
+            for run_index in range(runs_number):
+                line_counter = records.LINE_NUMBERS[records.RUN_STARTS[run_index]]
+                record_kind = records.RUN_KINDS[run_index]
+                residue_sequence_number = records.SEQUENCE_NUMBERS[run_index]
+
+                # Pominięty odcinek łańcucha - kolejna seria łańcucha rozpoczyna nowy łańcuch, tak jak przy wczytaniu wszystkich serii.
+                if distant_runs[run_index]:
+                    if record_kind != Pdb_records.TER:
+                        atom_index += records.get_run_length(run_index)
+                    chain_break = True
+                    continue
+
+                if record_kind == Pdb_records.TER:
+                    CHAINS[-1].push_residue(Termination_symbol(RESIDUE_NAMES[run_index], residue_sequence_number))
+                    continue
+
+                if record_kind == Pdb_records.HETATM and RESIDUE_NAMES[run_index] in ligands:
+                    if not LIGANDS or LIGANDS[-1].residue_sequence_number != residue_sequence_number:
+                        LIGANDS.append(Ligand(RESIDUE_NAMES[run_index], residue_sequence_number, atom_table))
+                    atom_group = LIGANDS[-1]
+
+                else:
+                    chain_name = CHAIN_NAMES[run_index]
+                    if not CHAINS or CHAINS[-1].chain_name != chain_name or chain_break:
+                        chain_break = False
+                        CHAINS.append(Chain(chain_name))
+                        CHAINS[-1].push_residue(Residue(RESIDUE_NAMES[run_index], residue_sequence_number, atom_table))
+                    elif CHAINS[-1].RESIDUES[-1].residue_sequence_number != residue_sequence_number:
+                        CHAINS[-1].push_residue(Residue(RESIDUE_NAMES[run_index], residue_sequence_number, atom_table))
+                    atom_group = CHAINS[-1].RESIDUES[-1]
+
+                run_length = records.get_run_length(run_index)
+                if run_index == records.error_run:
+                    run_length = records.error_record - records.RUN_STARTS[run_index]
+                atom_group.add_atom_range(atom_index, atom_index + run_length)
+                if len(atom_group.ATOM_INDICES) == run_length:
+                    atom_group.bounding_sphere = records.get_run_sphere(run_index)
+                atom_index += run_length
+
+            # Rekord z niepoprawną wartością liczbową - komunikaty zgodne z obiektem, którego utworzenie by się nie powiodło.
+            if records.error_run != None:
+                run_index = records.error_run
+                record_kind = records.RUN_KINDS[run_index]
+                line_counter = records.LINE_NUMBERS[records.error_record]
+
+                if records.coordinates_error:
+                    print(Colors.RED + 'Atom: ValueError!' + Colors.END)
+                elif record_kind == Pdb_records.TER:
+                    if CHAINS:
+                        print(Colors.RED + 'Termination_symbol: ValueError!' + Colors.END)
+                elif record_kind == Pdb_records.HETATM and RESIDUE_NAMES[run_index] in ligands:
+                    if not LIGANDS:
+                        print(Colors.RED + 'Ligand: ValueError!' + Colors.END)
+                elif not CHAINS or CHAINS[-1].chain_name != CHAIN_NAMES[run_index]:
+                    print(Colors.RED + 'Residue: ValueError!' + Colors.END)
+
+                raise ValueError
 
             try:
                 chains_to_remove = []
@@ -422,11 +1997,18 @@ def parse_PDB_file(pdb_file_path, ligands : list[str] = []) -> Structure:
                 for index in chains_to_remove:
                     structure.CHAINS.pop(index)
 
+                structure.build_atom_index()
+
             except:
                 structure.data_correctnes_flag = False
                 print(Colors.RED + f'The file: \'{pdb_file_path}\' contains an error in the marking of amino acid chains :O' + Colors.END)
 
+        except FileNotFoundError:
+            raise
+
         except:
+            # Odniesienia do bazy UniProt - wyłącznie z wierszy poprzedzających błąd.
+            structure.UNP_RECORDS = [unp_record for (unp_record, line_number) in zip(records.UNP_RECORDS, records.UNP_LINE_NUMBERS) if line_number < line_counter]
             structure.data_correctnes_flag = False
             print(Colors.RED + f'The file \'{pdb_file_path}\' has an error in line: {line_counter} :O' + Colors.END)
 
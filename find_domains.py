@@ -4,9 +4,33 @@ import re
 import argparse
 import os
 import glob
+import multiprocessing
+import time
+import json
+import csv
+import io
+import pickle
+import hashlib
+import struct
+import sqlite3
+import cProfile
+import tracemalloc
+from array import array
+from functools import partial
 from collections import Counter
+from contextlib import contextmanager
 from bioinf_tools import *
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
 
 # Funkcja pomocnicza - formatująca
 def format_output(ligand : Ligand, residue : Residue, chain_name : str, pfam_domain : Pfam_domain) -> str:
@@ -24,6 +48,964 @@ def format_output(ligand : Ligand, residue : Residue, chain_name : str, pfam_dom
     return output
 
 
+# Funkcja pomocnicza - formatująca statystyki wstępnej selekcji reszt (odrzucone / rozważane).
+def format_pruning_statistics(statistics : Counter) -> str:
+    return 'Pruning: rejected {}/{} chains, {}/{} residues, {}/{} ligands'.format(
+        statistics['chains_rejected'], statistics['chains'],
+        statistics['residues_rejected'], statistics['residues'],
+        statistics['ligands_rejected'], statistics['ligands'])
+
+
+# -------------------------------------------------------------------------------------------------------------
+
+
+class Stage_profiler:
+    """Pomiar etapów analizy pojedynczej struktury (--profile): czas rzeczywisty, czas procesora i szczytowe zużycie pamięci procesu (RSS) po zakończeniu etapu,
+    a także liczniki (atomy, ligandy, kontakty, trafienia pamięci podręcznej Pfam, pobrania z sieci). Opcjonalnie zapisuje profile cProfile wskazanych etapów
+    do plików {struktura}_{etap}.prof oraz szczytową ilość pamięci zaalokowanej w trakcie etapu (tracemalloc). Wyłączony profiler nie wykonuje pomiarów."""
+
+    def __init__(self, enabled : bool = False, cprofile_directory : str = None, trace_memory : bool = False):
+        self.enabled : bool = enabled
+        self.cprofile_directory : str = cprofile_directory
+        self.trace_memory : bool = trace_memory
+        self.STAGES : dict[str, dict[str, float]] = {}                                  #stage -> wall, cpu, peak_rss_kb, traced_peak_kb
+        self.COUNTS : Counter = Counter()                                               #atoms, ligands, contacts, pfam_memory_hits, pfam_disk_hits, network_fetches
+
+    def new(self) -> 'Stage_profiler':
+        """Funkcja zwracająca profiler o tych samych ustawieniach, bez pomiarów (jeden profiler na strukturę)."""
+
+        return Stage_profiler(self.enabled, self.cprofile_directory, self.trace_memory)
+
+    @contextmanager
+    def stage(self, name : str, cprofile_name : str = None):
+        if not self.enabled:
+            yield
+            return
+
+        profile = None
+        if self.cprofile_directory != None and cprofile_name != None:
+            profile = cProfile.Profile()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        (wall_start, cpu_start) = (time.perf_counter(), time.process_time())
+        if profile != None:
+            profile.enable()
+
+        try:
+            yield
+        finally:
+            if profile != None:
+                profile.disable()
+            (wall, cpu) = (time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+            record = self.STAGES.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_rss_kb': 0})
+            record['wall'] += wall
+            record['cpu'] += cpu
+            record['peak_rss_kb'] = max(record['peak_rss_kb'], get_peak_memory())
+            if self.trace_memory:
+                record['traced_peak_kb'] = max(record.get('traced_peak_kb', 0), tracemalloc.get_traced_memory()[1] // 1024)
+            if profile != None:
+                os.makedirs(self.cprofile_directory, exist_ok=True)
+                profile.dump_stats(os.path.join(self.cprofile_directory, f'{cprofile_name}_{name}.prof'))
+
+    def get_total_wall(self) -> float:
+        return sum(record['wall'] for record in self.STAGES.values())
+
+
+# Funkcja pomocnicza - szczytowe zużycie pamięci bieżącego procesu [kB] (0, jeżeli moduł resource jest niedostępny).
+def get_peak_memory() -> int:
+    if resource == None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Structure_result:
+    """Wyniki analizy pojedynczej struktury w postaci prostych krotek (przekazywane z procesów roboczych do procesu głównego)."""
+
+    def __init__(self, pdb_file_path : str, structure_PDB_ID : str, data_correctnes_flag : bool):
+        self.pdb_file_path : str = pdb_file_path
+        self.structure_PDB_ID : str = structure_PDB_ID
+        self.data_correctnes_flag : bool = data_correctnes_flag
+        self.DOMAINS : list[tuple[str, str, str, int, int]] = []                        #chain_name, pfam_accession, pfam_id, start, end
+        self.ENVIRONMENT : list[tuple[str, int, str, int, str, int]] = []               #ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index
+        self.BINDING_DOMAINS : list[tuple[str, int, int]] = []                          #ligand_name, ligand_seq_number, domain_index
+        self.BINDING_DOMAINS_DETAILED : list[tuple[str, int, int]] = []                 #ligand_name, ligand_seq_number, domain_index
+        self.PRUNING_STATISTICS : Counter = Counter()                                   #chains, chains_rejected, residues, residues_rejected, ligands, ligands_rejected
+        self.CUTOFF_RESULTS : dict[float, tuple[list, list, list]] = {}                #cutoff -> (ENVIRONMENT, BINDING_DOMAINS, BINDING_DOMAINS_DETAILED), config: cutoffs
+        self.CONTACT_DISTANCES : dict[tuple[str, int, str, int, str], tuple[float, str, str]] = {}   #(ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name) -> (distance, ligand_atom_name, res_atom_name)
+        self.HETERO_NAMES : tuple[str] = ()                                             #nazwy reszt rekordów HETATM (indeks wyników, --result_index)
+        self.UNP_ACCESSIONS : tuple[str] = ()                                           #numery dostępu UniProt (indeks wyników, --result_index)
+        self.relevant : bool = True                                                     #False - struktura bez kontaktów ligand - białko (wstępny przegląd, --prescan)
+        self.PROFILE : Stage_profiler = None
+
+    def get_domains_statistics(self) -> list[tuple[str, str]]:
+        return [(pfam_accession, pfam_id) for (_, pfam_accession, pfam_id, _, _) in self.DOMAINS]
+
+    def get_matched_statistics(self, detailed : bool = False) -> list[tuple[str, str, str]]:
+        binding_domains = self.BINDING_DOMAINS_DETAILED if detailed else self.BINDING_DOMAINS
+        return [(self.DOMAINS[domain_index][1], self.DOMAINS[domain_index][2], ligand_name) for (ligand_name, _, domain_index) in binding_domains]
+
+    def get_where_ligand(self) -> list[tuple[str, str, int, str, int, str]]:
+        return [
+            (self.DOMAINS[domain_index][2], ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name)
+            for (ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index) in self.ENVIRONMENT
+            if domain_index != None
+        ]
+
+    def get_cutoff_result(self, cutoff : float) -> 'Structure_result':
+        """Funkcja zwracająca wyniki struktury dla jednej z dodatkowych odległości kontaktu (config: cutoffs)."""
+
+        result = Structure_result(self.pdb_file_path, self.structure_PDB_ID, self.data_correctnes_flag)
+        result.DOMAINS = self.DOMAINS
+        (result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED) = self.CUTOFF_RESULTS.get(cutoff, ([], [], []))
+        return result
+
+    def to_record(self) -> tuple:
+        """Funkcja zwracająca wyniki w postaci krotki prostych typów (zapis w pliku punktów kontrolnych)."""
+
+        return (self.pdb_file_path, self.structure_PDB_ID, self.data_correctnes_flag, self.DOMAINS, self.ENVIRONMENT,
+            self.BINDING_DOMAINS, self.BINDING_DOMAINS_DETAILED, dict(self.PRUNING_STATISTICS), self.CUTOFF_RESULTS, self.CONTACT_DISTANCES, self.HETERO_NAMES, self.UNP_ACCESSIONS, self.relevant)
+
+    @staticmethod
+    def from_record(record : tuple) -> 'Structure_result':
+        (pdb_file_path, structure_PDB_ID, data_correctnes_flag, DOMAINS, ENVIRONMENT, BINDING_DOMAINS, BINDING_DOMAINS_DETAILED, PRUNING_STATISTICS, CUTOFF_RESULTS, CONTACT_DISTANCES, HETERO_NAMES, UNP_ACCESSIONS, relevant) = record
+        result = Structure_result(pdb_file_path, structure_PDB_ID, data_correctnes_flag)
+        result.DOMAINS = DOMAINS
+        result.ENVIRONMENT = ENVIRONMENT
+        result.BINDING_DOMAINS = BINDING_DOMAINS
+        result.BINDING_DOMAINS_DETAILED = BINDING_DOMAINS_DETAILED
+        result.PRUNING_STATISTICS = Counter(PRUNING_STATISTICS)
+        result.CUTOFF_RESULTS = CUTOFF_RESULTS
+        result.CONTACT_DISTANCES = CONTACT_DISTANCES
+        result.HETERO_NAMES = HETERO_NAMES
+        result.UNP_ACCESSIONS = UNP_ACCESSIONS
+        result.relevant = relevant
+        return result
+
+
+# Funkcja pomocnicza - zamiana wyniku Structure.get_ligands_analysis na krotki prostych typów (domeny wskazywane indeksem listy DOMAINS).
+def convert_ligands_analysis(ligands_analysis : tuple, domain_indices : dict[int, int]) -> tuple[list, list, list]:
+    (ligands_environment, ligands_binding_domains, ligands_binding_domains_detailed) = ligands_analysis
+
+    ENVIRONMENT = [
+        (
+            ligand.residue_name,
+            ligand.residue_sequence_number,
+            residue.residue_name if residue != None else None,
+            residue.residue_sequence_number if residue != None else None,
+            chain_name,
+            domain_indices[id(pfam_domain)] if pfam_domain != None else None
+        )
+        for (ligand, residue, chain_name, pfam_domain) in ligands_environment
+    ]
+    BINDING_DOMAINS = [(ligand.residue_name, ligand.residue_sequence_number, domain_indices[id(pfam_domain)]) for (ligand, pfam_domain) in ligands_binding_domains]
+    BINDING_DOMAINS_DETAILED = [(ligand.residue_name, ligand.residue_sequence_number, domain_indices[id(pfam_domain)]) for (ligand, pfam_domain) in ligands_binding_domains_detailed]
+
+    return (ENVIRONMENT, BINDING_DOMAINS, BINDING_DOMAINS_DETAILED)
+
+
+# Analiza pojedynczej struktury - wykonywana w procesie głównym lub w procesach roboczych (--workers).
+# Przy podaniu dodatkowych odległości kontaktu (cutoffs) lub zapisie odległości (contact_distances) wykonywane jest jedno wyszukiwanie dla największej odległości.
+# Przy wstępnym przeglądzie (prescan) struktury bez rekordów HETATM ligandów nie są wczytywane, łańcuchy poza zasięgiem ligandów są pomijane przy parsowaniu,
+# a domeny Pfam wczytywane są wyłącznie dla struktur, w których znaleziono co najmniej jeden kontakt ligand - białko.
+# Przy entities architektura domenowa wyznaczana jest raz dla każdej encji łańcuchów (identyczne łańcuchy homo-oligomerów), kontakty - dla każdego łańcucha.
+# Przy pfam_cache = None używana jest pamięć podręczna Pfam procesu (get_Pfam_cache) - do procesów roboczych przekazywane są wyłącznie xml_directory i pfam_url.
+# Podane hetero_names (nazwy grup HETATM wyznaczone przed pobieraniem wstępnym) zastępują ponowny przegląd pliku.
+def analyze_structure(pdb_file_path : str, ligands : list[str], pfam_cache : Pfam_cache, cutoff : float, records_cache : bool = True, profiler : Stage_profiler = None,
+        cutoffs : list[float] = [], contact_distances : bool = False, prescan : bool = False, entities : bool = False, xml_directory : str = None,
+        pfam_url : str = PFAM_URL, hetero_names : frozenset[str] = None) -> Structure_result:
+    profiler = profiler.new() if profiler != None else Stage_profiler()
+    if pfam_cache == None:
+        pfam_cache = get_Pfam_cache(xml_directory, pfam_url)
+    cprofile_name = os.path.basename(pdb_file_path)
+    max_cutoff = max(list(cutoffs) + [cutoff])
+
+    if prescan:
+        if hetero_names == None:
+            with profiler.stage('prescan'):
+                hetero_names = get_hetero_names(pdb_file_path, records_cache)
+
+        if hetero_names.isdisjoint(ligands):
+            result = Structure_result(pdb_file_path, None, True)
+            result.HETERO_NAMES = tuple(sorted(hetero_names))
+            result.relevant = False
+            if profiler.enabled:
+                result.PROFILE = profiler
+            return result
+
+    with profiler.stage('parse', cprofile_name):
+        molecule = parse_PDB_file(pdb_file_path, ligands, records_cache, reach=max_cutoff if prescan else None)
+
+    # Wyszukiwanie kontaktów przed wczytaniem domen Pfam - wynik zostaje zapamiętany w obiekcie Structure i wykorzystany w dalszej analizie.
+    if prescan and molecule.data_correctnes_flag == True:
+        with profiler.stage('contacts', cprofile_name):
+            LIGAND_CONTACTS = molecule.find_ligands_contacts(max_cutoff, closest=bool(cutoffs or contact_distances))
+
+        if not any(LIGAND_CONTACTS):
+            result = Structure_result(pdb_file_path, molecule.structure_PDB_ID, True)
+            result.HETERO_NAMES = tuple(sorted(molecule.HETERO_NAMES))
+            result.relevant = False
+            if profiler.enabled:
+                profiler.COUNTS.update({'atoms': len(molecule.ATOM_TABLE), 'ligands': len(molecule.LIGANDS), 'contacts': 0})
+                result.PROFILE = profiler
+            return result
+
+    pfam_counters = (pfam_cache.memory_hits, pfam_cache.disk_hits, pfam_cache.network_fetches)
+    with profiler.stage('pfam'):
+        molecule.collect_data_from_Pfam(pfam_cache.backup_folder, pfam_cache=pfam_cache, entities=entities)
+
+    result = Structure_result(pdb_file_path, molecule.structure_PDB_ID, molecule.data_correctnes_flag)
+    result.HETERO_NAMES = tuple(sorted(molecule.HETERO_NAMES))
+    result.UNP_ACCESSIONS = tuple(dict.fromkeys(unp_record.unp_accession for unp_record in molecule.UNP_RECORDS))
+
+    # Sprawdzenie poprawności wczytanych danych, kontynuacja tylko w przypadku braku błędów.
+    if molecule.data_correctnes_flag == True:
+        domain_indices = {id(domain): index for (index, domain) in enumerate(molecule.PFAM_DOMAINS)}
+        result.DOMAINS = [(domain.chain_name, domain.pfam_accession, domain.pfam_id, domain.start, domain.end) for domain in molecule.PFAM_DOMAINS]
+
+        with profiler.stage('contacts', cprofile_name):
+            if cutoffs or contact_distances:
+                (ANALYSES, LIGAND_CONTACTS) = molecule.get_ligands_analyses(list(cutoffs) + [cutoff])
+            else:
+                (ANALYSES, LIGAND_CONTACTS) = ({cutoff: molecule.get_ligands_analysis(cutoff)}, [])
+        result.PRUNING_STATISTICS = Counter(molecule.pruning_statistics)
+
+        with profiler.stage('results'):
+            (result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED) = convert_ligands_analysis(ANALYSES[cutoff], domain_indices)
+
+            for extra_cutoff in cutoffs:
+                result.CUTOFF_RESULTS[extra_cutoff] = convert_ligands_analysis(ANALYSES[extra_cutoff], domain_indices)
+
+            # Najbliższa para atomów każdej pary ligand - reszta (ligandy o tej samej nazwie i numerze łączone są jak w ENVIRONMENT).
+            if contact_distances:
+                atom_names = molecule.ATOM_TABLE.ATOM_NAMES
+                for (ligand, ligand_contacts) in zip(molecule.LIGANDS, LIGAND_CONTACTS):
+                    for (residue_index, (squared_distance, ligand_atom, residue_atom)) in ligand_contacts.items():
+                        residue = molecule.RESIDUES[residue_index]
+                        key = (ligand.residue_name, ligand.residue_sequence_number, residue.residue_name, residue.residue_sequence_number,
+                            molecule.CHAINS[molecule.RESIDUE_CHAIN_INDEX[residue_index]].chain_name)
+                        distance = squared_distance ** 0.5
+                        if key not in result.CONTACT_DISTANCES or distance < result.CONTACT_DISTANCES[key][0]:
+                            result.CONTACT_DISTANCES[key] = (distance, atom_names[ligand_atom], atom_names[residue_atom])
+
+    if profiler.enabled:
+        profiler.COUNTS.update({
+            'atoms': len(molecule.ATOM_TABLE),
+            'ligands': len(molecule.LIGANDS),
+            'chain_entities': len(set(molecule.CHAIN_ENTITIES.values())) if molecule.CHAIN_ENTITIES != None else len({chain.chain_name for chain in molecule.CHAINS}),
+            'contacts': sum(1 for environment in result.ENVIRONMENT if environment[2] != None),
+            'pfam_memory_hits': pfam_cache.memory_hits - pfam_counters[0],
+            'pfam_disk_hits': pfam_cache.disk_hits - pfam_counters[1],
+            'network_fetches': pfam_cache.network_fetches - pfam_counters[2]
+        })
+        result.PROFILE = profiler
+
+    return result
+
+
+class Result_transport:
+    """Przesyłanie wyników struktur z procesów roboczych (--workers) w postaci spakowanej: kolumny liczb całkowitych i odległości w jednym buforze."""
+
+    NONE = -2 ** 31                                                                     # Wartość None w kolumnach liczb całkowitych
+    TABLE_KINDS = {
+        'DOMAINS': 'sssii',                                                             # s - indeks tablicy napisów (-1: None), i - liczba całkowita
+        'ENVIRONMENT': 'sisisi',
+        'BINDING_DOMAINS': 'sii',
+        'CONTACT_DISTANCES': 'sisisss'                                                  # klucz (ligand, reszta, łańcuch) oraz nazwy atomów najbliższej pary
+    }
+
+    def __init__(self, shared : bool = True, threshold : int = 2 ** 16):
+        self.shared : bool = shared and shared_memory != None
+        self.threshold : int = threshold
+
+    # Kolumny kodowane i dekodowane są funkcjami wbudowanymi (map, zip) - bez pętli interpretera dla kolejnych wartości.
+    def encode_table(self, ROWS : list[tuple], kinds : str, STRINGS : dict[str, int], INTEGERS : array):
+        COLUMNS = list(zip(*ROWS)) if ROWS else [()] * len(kinds)
+        for (COLUMN, kind) in zip(COLUMNS, kinds):
+            if kind == 's':
+                for value in dict.fromkeys(COLUMN):
+                    if value not in STRINGS:
+                        STRINGS[value] = len(STRINGS) - 1
+                INTEGERS.extend(map(STRINGS.__getitem__, COLUMN))
+            else:
+                INTEGERS.extend(map({None: self.NONE}.get, COLUMN, COLUMN))
+
+    def decode_columns(self, INTEGERS : list[int], offset : int, rows_number : int, kinds : str, STRINGS : tuple[str]) -> list:
+        COLUMNS = []
+        for (column_index, kind) in enumerate(kinds):
+            COLUMN = INTEGERS[offset + column_index * rows_number : offset + (column_index + 1) * rows_number]
+            if kind == 's':
+                COLUMN = map(STRINGS.__getitem__, COLUMN)
+            elif self.NONE in COLUMN:
+                COLUMN = map({self.NONE: None}.get, COLUMN, COLUMN)
+            COLUMNS.append(COLUMN)
+
+        return COLUMNS
+
+    def get_table_names(self, cutoffs_number : int) -> list[str]:
+        return ['DOMAINS', 'ENVIRONMENT', 'BINDING_DOMAINS', 'BINDING_DOMAINS'] + ['ENVIRONMENT', 'BINDING_DOMAINS', 'BINDING_DOMAINS'] * cutoffs_number + ['CONTACT_DISTANCES']
+
+    def pack(self, result : Structure_result) -> tuple:
+        """Funkcja zamieniająca wynik struktury na krotkę (klucze, bufor liczbowy lub nazwa i rozmiar bloku pamięci współdzielonej)."""
+
+        STRINGS : dict[str, int] = {None: -1}
+        INTEGERS = array('i')
+        ROWS_NUMBERS : list[int] = []
+
+        TABLES = [result.DOMAINS, result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED]
+        for cutoff_result in result.CUTOFF_RESULTS.values():
+            TABLES.extend(cutoff_result)
+        TABLES.append([key + (ligand_atom, residue_atom) for (key, (_, ligand_atom, residue_atom)) in result.CONTACT_DISTANCES.items()])
+
+        for (ROWS, table_name) in zip(TABLES, self.get_table_names(len(result.CUTOFF_RESULTS))):
+            self.encode_table(ROWS, self.TABLE_KINDS[table_name], STRINGS, INTEGERS)
+            ROWS_NUMBERS.append(len(ROWS))
+        DISTANCES = array('d', [distance for (distance, _, _) in result.CONTACT_DISTANCES.values()])
+
+        payload = INTEGERS.tobytes() + DISTANCES.tobytes()
+        if self.shared and len(payload) >= max(self.threshold, 1):
+            # Właścicielem bloku jest proces główny (unlink() w unpack) - blok nie jest śledzony w procesie roboczym, aby nie został usunięty przy zakończeniu jego pracy.
+            if sys.version_info >= (3, 13):
+                block = shared_memory.SharedMemory(create=True, size=len(payload), track=False)
+            else:
+                block = shared_memory.SharedMemory(create=True, size=len(payload))
+                if os.name == 'posix':
+                    resource_tracker.unregister('/' + block.name, 'shared_memory')
+            block.buf[: len(payload)] = payload
+            payload = (block.name, len(payload))
+            block.close()
+
+        del STRINGS[None]
+        return (result.pdb_file_path, result.structure_PDB_ID, result.data_correctnes_flag, result.relevant, tuple(STRINGS), tuple(result.CUTOFF_RESULTS),
+            ROWS_NUMBERS, len(INTEGERS), dict(result.PRUNING_STATISTICS), result.HETERO_NAMES, result.UNP_ACCESSIONS, result.PROFILE, payload)
+
+    def unpack(self, packed : tuple) -> Structure_result:
+        (pdb_file_path, structure_PDB_ID, data_correctnes_flag, relevant, STRINGS, CUTOFFS, ROWS_NUMBERS, integers_number, PRUNING_STATISTICS, HETERO_NAMES, UNP_ACCESSIONS,
+            PROFILE, payload) = packed
+
+        if isinstance(payload, tuple):
+            (block_name, size) = payload
+            block = shared_memory.SharedMemory(name=block_name)
+            payload = bytes(block.buf[: size])
+            block.close()
+            block.unlink()
+
+        (INTEGERS, DISTANCES) = (array('i'), array('d'))
+        INTEGERS.frombytes(payload[: integers_number * INTEGERS.itemsize])
+        DISTANCES.frombytes(payload[integers_number * INTEGERS.itemsize :])
+        INTEGERS = INTEGERS.tolist()
+
+        # Indeks -1 (None) wskazuje ostatni element tablicy napisów.
+        STRINGS = STRINGS + (None,)
+        (TABLES, offset) = ([], 0)
+        for (table_name, rows_number) in zip(self.get_table_names(len(CUTOFFS)), ROWS_NUMBERS):
+            kinds = self.TABLE_KINDS[table_name]
+            TABLES.append(self.decode_columns(INTEGERS, offset, rows_number, kinds, STRINGS))
+            offset += rows_number * len(kinds)
+        CONTACTS = TABLES.pop()
+        TABLES = [list(zip(*COLUMNS)) for COLUMNS in TABLES]
+
+        result = Structure_result(pdb_file_path, structure_PDB_ID, data_correctnes_flag)
+        result.relevant = relevant
+        (result.DOMAINS, result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED) = TABLES[: 4]
+        for (index, extra_cutoff) in enumerate(CUTOFFS):
+            result.CUTOFF_RESULTS[extra_cutoff] = tuple(TABLES[4 + 3 * index : 7 + 3 * index])
+        result.CONTACT_DISTANCES = dict(zip(zip(*CONTACTS[: 5]), zip(DISTANCES.tolist(), CONTACTS[5], CONTACTS[6])))
+        result.PRUNING_STATISTICS = Counter(PRUNING_STATISTICS)
+        result.HETERO_NAMES = HETERO_NAMES
+        result.UNP_ACCESSIONS = UNP_ACCESSIONS
+        result.PROFILE = PROFILE
+        return result
+
+
+# Analiza struktury opisanej zadaniem (ścieżka pliku, nazwy grup HETATM lub None).
+def analyze_task(task : tuple[str, frozenset[str]], analysis) -> Structure_result:
+    (pdb_file_path, hetero_names) = task
+    return analysis(pdb_file_path, hetero_names=hetero_names)
+
+
+# Analiza struktury w procesie roboczym - wynik przekazywany jest do procesu głównego w postaci spakowanej (Result_transport).
+def analyze_and_pack(task : tuple[str, frozenset[str]], analysis, transport : Result_transport) -> tuple:
+    return transport.pack(analyze_task(task, analysis))
+
+
+class Checkpoint_store:
+    """Plik punktów kontrolnych - wyniki kolejnych struktur dopisywane są na końcu pliku zaraz po zakończeniu ich analizy (rekord: długość + pickle).
+    Pierwszy rekord opisuje parametry przebiegu (ligandy, odległości kontaktu); przy wznowieniu (--resume) wczytywane są wyniki struktur,
+    których pliki nie zmieniły się od zapisu, a niekompletny ostatni rekord (przerwany zapis) zostaje odcięty."""
+
+    RECORD_HEADER = struct.Struct('<Q')
+    MAGIC = 'find_domains checkpoint 4'
+
+    def __init__(self, file_path : str, ligands : list[str], search_parameters : tuple):
+        self.file_path : str = file_path
+        self.parameters : tuple = (self.MAGIC, sorted(ligands), search_parameters)
+        self.RESULTS : dict[str, Structure_result] = {}                                 #pdb_file_path -> wynik
+        self.output_file = None
+
+    @staticmethod
+    def get_file_signature(pdb_file_path : str) -> tuple[int, int]:
+        file_stat = os.stat(pdb_file_path)
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def load(self) -> bool:
+        """Funkcja wczytująca zapisane wyniki. Zwraca False, jeżeli plik został utworzony dla innych ligandów lub innej odległości kontaktu."""
+
+        if not os.path.isfile(self.file_path):
+            return True
+
+        checkpoint_file = open(self.file_path, 'rb')
+        content = checkpoint_file.read()
+        checkpoint_file.close()
+
+        (offset, RECORDS) = (0, [])
+        while offset + self.RECORD_HEADER.size <= len(content):
+            (length,) = self.RECORD_HEADER.unpack_from(content, offset)
+            if offset + self.RECORD_HEADER.size + length > len(content):
+                break
+            try:
+                RECORDS.append(pickle.loads(content[offset + self.RECORD_HEADER.size: offset + self.RECORD_HEADER.size + length]))
+            except Exception:
+                break
+            offset += self.RECORD_HEADER.size + length
+
+        if not RECORDS:
+            return True
+
+        if RECORDS[0] != self.parameters:
+            return False
+
+        for (signature, record) in RECORDS[1:]:
+            result = Structure_result.from_record(record)
+            if os.path.isfile(result.pdb_file_path) and self.get_file_signature(result.pdb_file_path) == signature:
+                self.RESULTS[result.pdb_file_path] = result
+
+        # Odcięcie niekompletnego rekordu - kolejne wyniki dopisywane są za ostatnim poprawnym rekordem.
+        if offset < len(content):
+            checkpoint_file = open(self.file_path, 'r+b')
+            checkpoint_file.truncate(offset)
+            checkpoint_file.close()
+
+        return True
+
+    def open(self, resume : bool):
+        """Funkcja otwierająca plik do dopisywania wyników (bez wznowienia plik jest tworzony od nowa)."""
+
+        if resume and self.RESULTS:
+            self.output_file = open(self.file_path, 'ab')
+        else:
+            self.output_file = open(self.file_path, 'wb')
+            self.write_record(self.parameters)
+
+    def write_record(self, record):
+        content = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.output_file.write(self.RECORD_HEADER.pack(len(content)) + content)
+        self.output_file.flush()
+
+    def add_result(self, result : Structure_result):
+        self.write_record( (self.get_file_signature(result.pdb_file_path), result.to_record()) )
+
+    def close(self):
+        if self.output_file != None:
+            self.output_file.close()
+
+
+class Result_index:
+    """Trwały indeks wyników pojedynczych struktur - ponownie analizowane są wyłącznie struktury, których dane wejściowe uległy zmianie."""
+
+    VERSION = 3
+
+    def __init__(self, file_path : str, pfam_cache : Pfam_cache):
+        self.file_path : str = file_path
+        self.pfam_cache : Pfam_cache = pfam_cache
+        self.ENTRIES : dict[str, tuple] = {}                                            #pdb_file_path -> (sygnatura pliku, skrót, ligandy, parametry wyszukiwania, sygnatura Pfam, wynik)
+        self.modified : bool = False
+
+        if os.path.isfile(file_path):
+            try:
+                index_file = open(file_path, 'rb')
+                (version, ENTRIES) = pickle.load(index_file)
+                index_file.close()
+                if version == self.VERSION:
+                    self.ENTRIES = ENTRIES
+            except Exception:
+                print(Colors.RED + f'Result index: {file_path} is damaged and will be rebuilt' + Colors.END)
+
+    @staticmethod
+    def get_content_hash(pdb_file_path : str) -> str:
+        content_hash = hashlib.sha1()
+        pdb_file = open(pdb_file_path, 'rb')
+        for chunk in iter(lambda: pdb_file.read(2 ** 20), b''):
+            content_hash.update(chunk)
+        pdb_file.close()
+        return content_hash.hexdigest()
+
+    def get_pfam_signature(self, unp_accessions : tuple[str]) -> tuple:
+        SIGNATURE = []
+        for unp_accession in unp_accessions:
+            xml_file_path = self.pfam_cache.get_xml_path(unp_accession)
+            SIGNATURE.append( (unp_accession, os.stat(xml_file_path).st_mtime_ns if os.path.isfile(xml_file_path) else None) )
+        return tuple(SIGNATURE)
+
+    def get_result(self, pdb_file_path : str, ligands : list[str], search_parameters : tuple) -> Structure_result:
+        """Funkcja zwracająca zapisany wynik struktury lub None, jeżeli strukturę należy przeanalizować ponownie."""
+
+        entry = self.ENTRIES.get(pdb_file_path)
+        if entry == None:
+            return None
+
+        (file_signature, content_hash, entry_ligands, entry_search_parameters, pfam_signature, record) = entry
+        result = Structure_result.from_record(record)
+        if entry_search_parameters != search_parameters or set(result.HETERO_NAMES) & (frozenset(ligands) ^ entry_ligands):
+            return None
+
+        if Checkpoint_store.get_file_signature(pdb_file_path) != file_signature:
+            # Zmieniona data modyfikacji przy niezmienionej zawartości - wynik pozostaje aktualny.
+            if self.get_content_hash(pdb_file_path) != content_hash:
+                return None
+            self.ENTRIES[pdb_file_path] = (Checkpoint_store.get_file_signature(pdb_file_path),) + entry[1 :]
+            self.modified = True
+
+        if self.get_pfam_signature(result.UNP_ACCESSIONS) != pfam_signature:
+            return None
+
+        return result
+
+    def add_result(self, result : Structure_result, ligands : list[str], search_parameters : tuple):
+        self.ENTRIES[result.pdb_file_path] = (
+            Checkpoint_store.get_file_signature(result.pdb_file_path),
+            self.get_content_hash(result.pdb_file_path),
+            frozenset(ligands),
+            search_parameters,
+            self.get_pfam_signature(result.UNP_ACCESSIONS),
+            result.to_record()
+        )
+        self.modified = True
+
+    def save(self):
+        if self.modified:
+            save_binary_file(self.file_path, pickle.dumps((self.VERSION, self.ENTRIES), protocol=pickle.HIGHEST_PROTOCOL))
+            self.modified = False
+
+
+# Funkcja pomocnicza - wyniki w kolejności plików: zapisane w punktach kontrolnych lub obliczane (results) dla pozostałych struktur.
+def merge_checkpoint_results(batch_files : list[str], stored_results : dict[str, Structure_result], results):
+    results = iter(results)
+    for pdb_file_path in batch_files:
+        if pdb_file_path in stored_results:
+            yield stored_results[pdb_file_path]
+        else:
+            yield next(results)
+
+
+class Statistics_accumulator:
+    """Przyrostowe zestawienie statystyk zbioru struktur: liczniki domen oraz zbiory reszt tworzących miejsca wiązania dla par (pfam_id, ligand).
+    Zajmowana pamięć zależy wyłącznie od liczby różnych domen i ligandów. Akumulatory można łączyć (merge) - przy łączeniu w kolejności plików wynik jest identyczny jak przy przetwarzaniu sekwencyjnym."""
+
+    def __init__(self):
+        self.ALL_DOMAINS : Counter = Counter()                                          #(pfam_accession, pfam_id) -> occurrences
+        self.MATCHED_DOMAINS : Counter = Counter()                                      #(pfam_accession, pfam_id, ligand_name) -> occurrences
+        self.MATCHED_DOMAINS_DETAILED : Counter = Counter()                             #(pfam_accession, pfam_id, ligand_name) -> occurrences
+        self.WHERE_LIGAND : dict[tuple[str, str], dict[str, None]] = {}                 #(pfam_id, ligand_name) -> res_names
+        self.PRUNING_STATISTICS : Counter = Counter()                                   #chains, chains_rejected, residues, residues_rejected, ligands, ligands_rejected
+
+    def add_where_ligand(self, where_ligand : list[tuple[str, str, int, str, int, str]]):
+            #pfam_id, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name
+        for (pfam_id, ligand_name, _, res_name, _, _) in where_ligand:
+            if (pfam_id, ligand_name) in self.WHERE_LIGAND:
+                self.WHERE_LIGAND[(pfam_id, ligand_name)][res_name] = None
+            else:
+                self.WHERE_LIGAND[(pfam_id, ligand_name)] = {res_name: None}
+
+    def add_result(self, result : Structure_result):
+        self.ALL_DOMAINS.update(result.get_domains_statistics())
+        self.MATCHED_DOMAINS.update(result.get_matched_statistics())
+        self.MATCHED_DOMAINS_DETAILED.update(result.get_matched_statistics(detailed=True))
+        self.add_where_ligand(result.get_where_ligand())
+        self.PRUNING_STATISTICS.update(result.PRUNING_STATISTICS)
+
+    def merge(self, other : 'Statistics_accumulator'):
+        self.ALL_DOMAINS.update(other.ALL_DOMAINS)
+        self.MATCHED_DOMAINS.update(other.MATCHED_DOMAINS)
+        self.MATCHED_DOMAINS_DETAILED.update(other.MATCHED_DOMAINS_DETAILED)
+        self.PRUNING_STATISTICS.update(other.PRUNING_STATISTICS)
+        for (key, res_names) in other.WHERE_LIGAND.items():
+            if key in self.WHERE_LIGAND:
+                self.WHERE_LIGAND[key].update(res_names)
+            else:
+                self.WHERE_LIGAND[key] = dict(res_names)
+
+    def get_where_ligand_statistics(self) -> list[tuple[str, str, list[str]]]:
+        """Funkcja zwracająca zestawienie (pfam_id, ligand, reszty) uporządkowane według pfam_id, a w obrębie domeny według pierwszego wystąpienia liganda."""
+
+        return [(pfam_id, ligand_name, list(res_names)) for ((pfam_id, ligand_name), res_names) in sorted(self.WHERE_LIGAND.items(), key=lambda record: record[0][0])]
+
+
+# Funkcja pomocnicza - zestawienie reszt tworzących miejsca wiązania ligandów w obrębie domen (pfam_id, ligand, reszty).
+def aggregate_where_ligand(where_ligand : list[tuple[str, str, int, str, int, str]]) -> list[tuple[str, str, list[str]]]:
+    accumulator = Statistics_accumulator()
+    accumulator.add_where_ligand(where_ligand)
+    return accumulator.get_where_ligand_statistics()
+
+
+# Funkcja pomocnicza - formatująca blok pliku log dla pojedynczej struktury. Blok składany jest z listy wierszy i zwracany jako jeden napis
+# (jeden zapis na strukturę), a opisy domen formatowane są jednokrotnie, niezależnie od liczby wierszy kontaktów. Wynik jest identyczny jak przy użyciu format_output.
+def format_log_block(result : Structure_result, verbose : bool) -> str:
+    domains = [repr(Pfam_domain(*domain)) for domain in result.DOMAINS]
+    LINES = [f'PDB_ID: {result.structure_PDB_ID}', '', 'DOMAIN ARCHITECTURE:']
+
+    if domains:
+        LINES.extend(domains)
+    else:
+        LINES.append('< no domains found >')
+
+    if verbose:
+        LINES.extend(('', 'LIGANDS ENVIRONMENT:'))
+
+        if result.ENVIRONMENT:
+            domain_suffixes = [' Pfam domain -> {: <10} {: <23} ({: <5} - {: >5})'.format(*domain[1:]) for domain in result.DOMAINS]
+            for (ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index) in result.ENVIRONMENT:
+                line = 'Ligand -> {} {: <8}'.format(ligand_name, ligand_seq_number)
+                if res_name != None:
+                    line += ' Residue -> {} {: <4}'.format(res_name, res_seq_number)
+                if chain_name != None:
+                    line += ' {: <8}'.format(chain_name)
+                if domain_index != None:
+                    line += domain_suffixes[domain_index]
+                LINES.append(line)
+        else:
+            LINES.append('< no ligands found >')
+    else:
+        LINES.extend(('', 'MATCHED DOMAINS:'))
+
+        if result.BINDING_DOMAINS:
+            for (ligand_name, ligand_seq_number, domain_index) in result.BINDING_DOMAINS:
+                LINES.append('{}    Ligand -> {} {: <8}'.format(domains[domain_index], ligand_name, ligand_seq_number))
+        else:
+            LINES.append('< no domains found >')
+
+    LINES.extend(('', '------------------------------------------------------------------------------------------------------------------------------------------------------', '', ''))
+
+    return '\n'.join(LINES)
+
+
+class Contacts_writer:
+    """Zapis kontaktów ligand - reszta w postaci strukturalnej (jeden kontakt na wiersz), wczytywanej bez parsowania pliku log.
+    Format określa rozszerzenie pliku: .jsonl lub .csv, opcjonalnie z kompresją (.gz, .zst). Wiersze struktury zapisywane są jednym wywołaniem write.
+    Każdy kontakt zawiera odległość najbliższej pary atomów [A] oraz nazwy tych atomów (Structure_result.CONTACT_DISTANCES)."""
+
+    FIELDS = ['structure_PDB_ID', 'ligand_name', 'ligand_seq_number', 'res_name', 'res_seq_number', 'chain_name', 'pfam_accession', 'pfam_id', 'domain_start', 'domain_end',
+        'distance', 'ligand_atom', 'res_atom']
+
+    def __init__(self, file_path : str, buffer_size : int = 2 ** 20):
+        self.file_path : str = file_path
+        self.csv_format : bool = re.sub(r'\.(gz|zst)$', '', file_path).endswith('.csv')
+        self.output_file = open_output_file(file_path, buffer_size)
+
+        if self.csv_format:
+            self.output_file.write(','.join(self.FIELDS) + '\n')
+
+    def get_rows(self, result : Structure_result) -> list[tuple]:
+        ROWS = []
+        for (ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index) in result.ENVIRONMENT:
+            if res_name != None:
+                (_, pfam_accession, pfam_id, start, end) = result.DOMAINS[domain_index] if domain_index != None else (None, None, None, None, None)
+                (distance, ligand_atom, res_atom) = result.CONTACT_DISTANCES.get((ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name), (None, None, None))
+                ROWS.append( (result.structure_PDB_ID, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, pfam_accession, pfam_id, start, end,
+                    round(distance, 3) if distance != None else None, ligand_atom, res_atom) )
+
+        return ROWS
+
+    def write_result(self, result : Structure_result):
+        ROWS = self.get_rows(result)
+        if not ROWS:
+            return
+
+        if self.csv_format:
+            block = io.StringIO()
+            csv.writer(block, lineterminator='\n').writerows(ROWS)
+            self.output_file.write(block.getvalue())
+        else:
+            self.output_file.write(''.join(json.dumps(dict(zip(self.FIELDS, row))) + '\n' for row in ROWS))
+
+    def close(self):
+        self.output_file.close()
+
+
+class Contacts_database:
+    """Baza SQLite wyników analizy (config: contacts_database) - wyszukiwanie kontaktów i odtwarzanie plików wynikowych bez ponownej analizy (query_contacts.py)."""
+
+    SCHEMA = [
+        'CREATE TABLE parameters (name TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE structures (structure_id INTEGER PRIMARY KEY, pdb_file_path TEXT, pdb_id TEXT, status TEXT)',
+        'CREATE TABLE domains (structure_id INTEGER, domain_index INTEGER, chain TEXT, pfam_accession TEXT, pfam_id TEXT, domain_start INTEGER, domain_end INTEGER)',
+        'CREATE TABLE contacts (structure_id INTEGER, cutoff REAL, row_index INTEGER, ligand TEXT, ligand_seq INTEGER, res_name TEXT, res_seq INTEGER, chain TEXT, '
+            'domain_index INTEGER, distance REAL, ligand_atom TEXT, res_atom TEXT)',
+        'CREATE TABLE binding_domains (structure_id INTEGER, cutoff REAL, detailed INTEGER, row_index INTEGER, ligand TEXT, ligand_seq INTEGER, domain_index INTEGER)',
+        'CREATE VIEW contact_domains AS SELECT structures.pdb_id AS pdb_id, contacts.cutoff AS cutoff, contacts.ligand AS ligand, contacts.ligand_seq AS ligand_seq, '
+            'contacts.res_name AS res_name, contacts.res_seq AS res_seq, contacts.chain AS chain, domains.pfam_accession AS pfam_accession, domains.pfam_id AS pfam_id, '
+            'domains.domain_start AS domain_start, domains.domain_end AS domain_end, contacts.distance AS distance, contacts.ligand_atom AS ligand_atom, contacts.res_atom AS res_atom '
+            'FROM contacts JOIN structures ON structures.structure_id = contacts.structure_id '
+            'LEFT JOIN domains ON domains.structure_id = contacts.structure_id AND domains.domain_index = contacts.domain_index WHERE contacts.res_name IS NOT NULL'
+    ]
+    INDICES = [
+        'CREATE INDEX structures_pdb_id ON structures (pdb_id)',
+        'CREATE UNIQUE INDEX domains_structure ON domains (structure_id, domain_index)',
+        'CREATE INDEX domains_pfam_accession ON domains (pfam_accession)',
+        'CREATE INDEX domains_pfam_id ON domains (pfam_id)',
+        'CREATE INDEX contacts_structure ON contacts (structure_id, domain_index)',
+        'CREATE INDEX contacts_ligand ON contacts (ligand)',
+        'CREATE INDEX contacts_residue ON contacts (res_name, res_seq)',
+        'CREATE INDEX contacts_chain ON contacts (chain)',
+        'CREATE INDEX binding_domains_structure ON binding_domains (structure_id)'
+    ]
+    QUERY_FIELDS = ['pdb_id', 'cutoff', 'ligand', 'ligand_seq', 'res_name', 'res_seq', 'chain', 'pfam_accession', 'pfam_id', 'domain_start', 'domain_end', 'distance',
+        'ligand_atom', 'res_atom']
+
+    def __init__(self, file_path : str, create : bool = False):
+        self.file_path : str = file_path
+        self.structures_number : int = 0
+
+        if create:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+        elif not os.path.isfile(file_path):
+            print(Colors.RED + f'Contacts database: {file_path} not found' + Colors.END)
+            raise ValueError
+
+        self.connection = sqlite3.connect(file_path)
+        if create:
+            self.connection.execute('PRAGMA journal_mode = OFF')
+            self.connection.execute('PRAGMA synchronous = OFF')
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+
+    def set_parameters(self, ligands : list[str], contact_cutoff : float, cutoffs : list[float]):
+        self.connection.executemany('INSERT INTO parameters VALUES (?, ?)', [
+            ('ligands', json.dumps(list(ligands))),
+            ('contact_cutoff', json.dumps(contact_cutoff)),
+            ('cutoffs', json.dumps(list(cutoffs)))
+        ])
+
+    def get_parameters(self) -> dict:
+        return {name: json.loads(value) for (name, value) in self.connection.execute('SELECT name, value FROM parameters')}
+
+    def add_result(self, result : Structure_result, status : str, contact_cutoff : float):
+        """Funkcja zapisująca wyniki struktury (status: done, skipped lub irrelevant). Dodatkowe odległości kontaktu równe contact_cutoff nie są powielane."""
+
+        structure_id = self.structures_number
+        self.structures_number += 1
+        self.connection.execute('INSERT INTO structures VALUES (?, ?, ?, ?)', (structure_id, result.pdb_file_path, result.structure_PDB_ID, status))
+
+        self.connection.executemany('INSERT INTO domains VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(structure_id, domain_index) + tuple(domain) for (domain_index, domain) in enumerate(result.DOMAINS)])
+
+        TABLES = [(contact_cutoff, (result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED))]
+        TABLES += [(extra_cutoff, cutoff_result) for (extra_cutoff, cutoff_result) in result.CUTOFF_RESULTS.items() if extra_cutoff != contact_cutoff]
+
+        for (cutoff, (ENVIRONMENT, BINDING_DOMAINS, BINDING_DOMAINS_DETAILED)) in TABLES:
+            self.connection.executemany('INSERT INTO contacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                (structure_id, cutoff, row_index) + tuple(row) + result.CONTACT_DISTANCES.get(row[: 5], (None, None, None))
+                for (row_index, row) in enumerate(ENVIRONMENT)
+            ])
+            self.connection.executemany('INSERT INTO binding_domains VALUES (?, ?, ?, ?, ?, ?, ?)', [
+                (structure_id, cutoff, detailed, row_index) + tuple(row)
+                for (detailed, rows) in enumerate((BINDING_DOMAINS, BINDING_DOMAINS_DETAILED)) for (row_index, row) in enumerate(rows)
+            ])
+
+    def close(self, create_indices : bool = True):
+        if create_indices:
+            for statement in self.INDICES:
+                self.connection.execute(statement)
+        self.connection.commit()
+        self.connection.close()
+
+    def get_results(self):
+        """Generator odtwarzający wyniki kolejnych struktur w kolejności zapisu: krotki (status, Structure_result). Każda tabela odczytywana jest jednym zapytaniem."""
+
+        contact_cutoff = self.get_parameters()['contact_cutoff']
+
+        DOMAINS : dict[int, list[tuple]] = {}
+        for (structure_id, chain, pfam_accession, pfam_id, start, end) in self.connection.execute(
+                'SELECT structure_id, chain, pfam_accession, pfam_id, domain_start, domain_end FROM domains ORDER BY structure_id, domain_index'):
+            DOMAINS.setdefault(structure_id, []).append( (chain, pfam_accession, pfam_id, start, end) )
+
+        ENVIRONMENTS : dict[tuple[int, float], list[tuple]] = {}
+        CONTACT_DISTANCES : dict[int, dict[tuple, tuple]] = {}
+        for (structure_id, cutoff, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index, distance, ligand_atom, res_atom) in self.connection.execute(
+                'SELECT structure_id, cutoff, ligand, ligand_seq, res_name, res_seq, chain, domain_index, distance, ligand_atom, res_atom FROM contacts ORDER BY structure_id, cutoff, row_index'):
+            row = (ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, domain_index)
+            ENVIRONMENTS.setdefault((structure_id, cutoff), []).append(row)
+            if distance != None and cutoff == contact_cutoff:
+                CONTACT_DISTANCES.setdefault(structure_id, {})[row[: 5]] = (distance, ligand_atom, res_atom)
+
+        BINDING_DOMAINS : dict[tuple[int, float, int], list[tuple]] = {}
+        for (structure_id, cutoff, detailed, ligand_name, ligand_seq_number, domain_index) in self.connection.execute(
+                'SELECT structure_id, cutoff, detailed, ligand, ligand_seq, domain_index FROM binding_domains ORDER BY structure_id, cutoff, detailed, row_index'):
+            BINDING_DOMAINS.setdefault((structure_id, cutoff, detailed), []).append( (ligand_name, ligand_seq_number, domain_index) )
+
+        cutoffs = self.get_parameters()['cutoffs']
+        for (structure_id, pdb_file_path, pdb_id, status) in self.connection.execute('SELECT structure_id, pdb_file_path, pdb_id, status FROM structures ORDER BY structure_id').fetchall():
+            result = Structure_result(pdb_file_path, pdb_id, status != 'skipped')
+            result.relevant = status != 'irrelevant'
+            result.DOMAINS = DOMAINS.get(structure_id, [])
+            result.CONTACT_DISTANCES = CONTACT_DISTANCES.get(structure_id, {})
+            (result.ENVIRONMENT, result.BINDING_DOMAINS, result.BINDING_DOMAINS_DETAILED) = (
+                ENVIRONMENTS.get((structure_id, contact_cutoff), []), BINDING_DOMAINS.get((structure_id, contact_cutoff, 0), []), BINDING_DOMAINS.get((structure_id, contact_cutoff, 1), []))
+            for extra_cutoff in cutoffs:
+                result.CUTOFF_RESULTS[extra_cutoff] = (
+                    ENVIRONMENTS.get((structure_id, extra_cutoff), []), BINDING_DOMAINS.get((structure_id, extra_cutoff, 0), []), BINDING_DOMAINS.get((structure_id, extra_cutoff, 1), []))
+            yield (status, result)
+
+    def query(self, ligand : str = None, pfam : str = None, pdb_id : str = None, chain : str = None, residue : str = None, cutoff : float = None) -> list[tuple]:
+        """Funkcja wyszukująca kontakty ligand - reszta (widok contact_domains). pfam - numer dostępu lub identyfikator domeny, residue - nazwa reszty lub nazwa i numer
+        (np. PHE 123). Bez podania cutoff zwracane są kontakty dla contact_cutoff."""
+
+        CONDITIONS = ['cutoff = ?']
+        PARAMETERS = [cutoff if cutoff != None else self.get_parameters()['contact_cutoff']]
+
+        if ligand != None:
+            CONDITIONS.append('ligand = ?')
+            PARAMETERS.append(ligand)
+        if pfam != None:
+            CONDITIONS.append('(pfam_accession = ? OR pfam_id = ?)')
+            PARAMETERS.extend((pfam, pfam))
+        if pdb_id != None:
+            CONDITIONS.append('pdb_id = ?')
+            PARAMETERS.append(pdb_id)
+        if chain != None:
+            CONDITIONS.append('chain = ?')
+            PARAMETERS.append(chain)
+        if residue != None:
+            residue_fields = residue.split()
+            CONDITIONS.append('res_name = ?')
+            PARAMETERS.append(residue_fields[0])
+            if len(residue_fields) > 1:
+                CONDITIONS.append('res_seq = ?')
+                PARAMETERS.append(int(residue_fields[1]))
+
+        return self.connection.execute(f'SELECT {", ".join(self.QUERY_FIELDS)} FROM contact_domains WHERE {" AND ".join(CONDITIONS)}', PARAMETERS).fetchall()
+
+
+# Funkcja pomocnicza - ścieżka pliku statystyk dla dodatkowej odległości kontaktu (matched_stat.txt -> matched_stat_4.5.txt).
+def get_cutoff_file_path(file_path : str, cutoff : float) -> str:
+    (root, extension) = os.path.splitext(file_path)
+    if extension in ('.gz', '.zst'):
+        (root, inner_extension) = os.path.splitext(root)
+        extension = inner_extension + extension
+    return f'{root}_{cutoff}{extension}'
+
+
+# Funkcja pomocnicza - zapis generalnej statystyki wszystkich znalezionych domen białkowych.
+def save_general_statistics(file_path : str, statistics : Statistics_accumulator, buffer_size : int):
+    general_statistics = open_output_file(file_path, buffer_size)
+    for ((pfam_accession, pfam_id), occurrences) in statistics.ALL_DOMAINS.most_common():
+        general_statistics.write('Pfam accession: {: <15} Pfam ID: {: <23} Occurrences: {: <10}\n'.format(pfam_accession, pfam_id, occurrences))
+
+    general_statistics.close()
+
+
+# Funkcja pomocnicza - zapis listy plików PDB pominiętych w analizie (koniec pliku log).
+def format_files_section(title : str, pdb_files : list[str]) -> str:
+    return f'{title}:\n' + ''.join(f'{pdb_file}\n' for pdb_file in pdb_files)
+
+
+# Funkcja pomocnicza - zapis statystyki domen, w obrębie których znaleziono wskazane ligandy.
+def save_matched_statistics(file_path : str, statistics : Statistics_accumulator, buffer_size : int):
+    alfabetic = lambda record: ' '.join([record[0][1], record[0][2]])
+
+    matched_statistics = open_output_file(file_path, buffer_size)
+    hit_number = [number for ((_, _, _), number) in sorted(statistics.MATCHED_DOMAINS_DETAILED.items(), key=alfabetic)]
+    for (((pfam_accession, pfam_id, ligand_name), occurrences), number) in zip(sorted(statistics.MATCHED_DOMAINS.items(), key=alfabetic), hit_number):
+        matched_statistics.write('Pfam accession: {: <15} Pfam ID: {: <23} Ligand name: {: <10} Occurrences: {: <10} Molecule/domain: {: <10}\n'
+            .format(pfam_accession, pfam_id, ligand_name, occurrences, round(number / occurrences, 2)))
+
+    matched_statistics.close()
+
+
+# Funkcja pomocnicza - zapis składu aminokwasowego miejsc wiązania wskazanych ligandów w kontekście domen.
+def save_where_ligand_statistics(file_path : str, statistics : Statistics_accumulator, buffer_size : int):
+    where_ligand_statistics = open_output_file(file_path, buffer_size)
+
+    for (pfam_id, ligand_name, res_list) in statistics.get_where_ligand_statistics():
+        where_ligand_statistics.write('{: <23} {: <4}    [{}]\n'.format(pfam_id, ligand_name, ' '.join(sorted(res_list))))
+
+    where_ligand_statistics.close()
+
+
+# Funkcja pomocnicza - zestawienie pomiarów etapów (--profile): suma czasów, maksymalny czas pojedynczej struktury i szczytowe zużycie pamięci.
+def get_profile_summary(profilers : list[Stage_profiler]) -> tuple[dict[str, dict[str, float]], Counter]:
+    stages : dict[str, dict[str, float]] = {}
+    counts = Counter()
+
+    for profiler in profilers:
+        counts.update(profiler.COUNTS)
+        for (name, record) in profiler.STAGES.items():
+            summary = stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'max_wall': 0.0, 'peak_rss_kb': 0})
+            summary['calls'] += 1
+            summary['wall'] += record['wall']
+            summary['cpu'] += record['cpu']
+            summary['max_wall'] = max(summary['max_wall'], record['wall'])
+            summary['peak_rss_kb'] = max(summary['peak_rss_kb'], record['peak_rss_kb'])
+            if 'traced_peak_kb' in record:
+                summary['traced_peak_kb'] = max(summary.get('traced_peak_kb', 0), record['traced_peak_kb'])
+
+    return (stages, counts)
+
+
+# Funkcja pomocnicza - tabela podsumowania pomiarów etapów oraz lista najwolniejszych struktur.
+def format_profile_summary(run_profiler : Stage_profiler, PROFILES : list[tuple[str, str, Stage_profiler]], top : int) -> str:
+    (stages, counts) = get_profile_summary([run_profiler] + [profiler for (_, _, profiler) in PROFILES])
+    output = '{: <12} {: <8} {: <12} {: <12} {: <14} {: <14}\n'.format('Stage', 'Calls', 'Wall [s]', 'CPU [s]', 'Max wall [s]', 'Peak RSS [MB]')
+
+    for (name, summary) in stages.items():
+        output += '{: <12} {: <8} {: <12.3f} {: <12.3f} {: <14.3f} {: <14.1f}\n'.format(
+            name, summary['calls'], summary['wall'], summary['cpu'], summary['max_wall'], summary['peak_rss_kb'] / 1024)
+
+    output += 'Atoms: {}, ligands: {}, contacts: {}, Pfam cache hits: {} (memory) / {} (disk), network fetches: {}\n'.format(
+        counts['atoms'], counts['ligands'], counts['contacts'], counts['pfam_memory_hits'], counts['pfam_disk_hits'], counts['network_fetches'])
+
+    output += 'Slowest structures:\n'
+    for (pdb_file_path, _, profiler) in sorted(PROFILES, key=lambda record: -record[2].get_total_wall())[: top]:
+        output += '    {: <40} {:.3f} s\n'.format(pdb_file_path, profiler.get_total_wall())
+
+    return output
+
+
+# Funkcja pomocnicza - zapis raportu pomiarów etapów w formacie JSON lub CSV (rozszerzenie .csv). Struktury uporządkowane od najwolniejszej.
+def save_profile_report(report_file_path : str, run_profiler : Stage_profiler, PROFILES : list[tuple[str, str, Stage_profiler]]):
+    PROFILES = sorted(PROFILES, key=lambda record: -record[2].get_total_wall())
+    STAGE_NAMES = list(dict.fromkeys(name for (_, _, profiler) in PROFILES for name in profiler.STAGES))
+    COUNT_NAMES = ['atoms', 'ligands', 'chain_entities', 'contacts', 'pfam_memory_hits', 'pfam_disk_hits', 'network_fetches']
+
+    if report_file_path.endswith('.csv'):
+        report_file = open(report_file_path, 'w', newline='')
+        writer = csv.writer(report_file)
+        writer.writerow(['pdb_file_path', 'structure_PDB_ID', 'wall'] + [f'{name}_{field}' for name in STAGE_NAMES for field in ('wall', 'cpu', 'peak_rss_kb')] + COUNT_NAMES)
+        for (pdb_file_path, structure_PDB_ID, profiler) in PROFILES:
+            writer.writerow(
+                [pdb_file_path, structure_PDB_ID, round(profiler.get_total_wall(), 6)]
+                + [round(profiler.STAGES[name][field], 6) if name in profiler.STAGES else '' for name in STAGE_NAMES for field in ('wall', 'cpu', 'peak_rss_kb')]
+                + [profiler.COUNTS[name] for name in COUNT_NAMES])
+        report_file.close()
+
+    else:
+        (stages, counts) = get_profile_summary([run_profiler] + [profiler for (_, _, profiler) in PROFILES])
+        save_text_file(report_file_path, json.dumps({
+            'stages': stages,
+            'counts': dict(counts),
+            'structures': [
+                {'pdb_file_path': pdb_file_path, 'structure_PDB_ID': structure_PDB_ID, 'wall': profiler.get_total_wall(), 'stages': profiler.STAGES, 'counts': dict(profiler.COUNTS)}
+                for (pdb_file_path, structure_PDB_ID, profiler) in PROFILES
+            ]
+        }, indent=2))
+
+
 # -------------------------------------------------------------------------------------------------------------
 
 
@@ -36,14 +1018,38 @@ LOG_FILE = None                                             # Plik wynikowy - ge
 GENERAL_STATISTICS_FILE = None                              # Plik wynikowy - statystyka wszystkich znalezionych domen
 MATCHED_STATISTICS_FILE = None                              # Plik wynikowy - statystyka dopasowanych domen
 WHERE_LIGAND_FILE = None                                    # Plik wynikowy - lokalizacja ligandów w domenach
+CONTACTS_FILE = None                                        # Plik wynikowy - kontakty ligand - reszta (JSONL / CSV)
+CONTACTS_DATABASE = None                                    # Baza SQLite wyników (zapytania i odtwarzanie plików wynikowych: query_contacts.py)
 
 LIGANDS = None                                              # Lista domen uwzględnianych w przeszukiwaniu
+CONTACT_CUTOFF = 5.0                                        # Maksymalna odległość kontaktu ligand - białko [A]
+CUTOFFS = []                                                # Dodatkowe odległości kontaktu [A] - statystyki z jednego wyszukiwania
+PFAM_SERVER = PFAM_URL                                      # Adres serwera Pfam (np. lokalnego serwera zastępczego)
 
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('--config', type=str)
     arg_parser.add_argument('--batch_s', type=int)
     arg_parser.add_argument('--verbose', action='store_true')
+    arg_parser.add_argument('--workers', type=int)
+    arg_parser.add_argument('--fetch_workers', type=int, default=8)
+    arg_parser.add_argument('--fetch_retries', type=int, default=3)
+    arg_parser.add_argument('--fetch_timeout', type=float, default=30.0)
+    arg_parser.add_argument('--pfam_cache_mb', type=float)
+    arg_parser.add_argument('--pfam_cache_days', type=float)
+    arg_parser.add_argument('--no_records_cache', action='store_true')
+    arg_parser.add_argument('--pruning_stats', action='store_true')
+    arg_parser.add_argument('--profile', type=str, nargs='?', const='profile.json')
+    arg_parser.add_argument('--profile_top', type=int, default=10)
+    arg_parser.add_argument('--profile_cprofile', type=str)
+    arg_parser.add_argument('--profile_tracemalloc', action='store_true')
+    arg_parser.add_argument('--write_buffer_kb', type=int, default=1024)
+    arg_parser.add_argument('--checkpoint', type=str, nargs='?', const='find_domains.checkpoint')
+    arg_parser.add_argument('--resume', action='store_true')
+    arg_parser.add_argument('--result_index', type=str, nargs='?', const='find_domains.index')
+    arg_parser.add_argument('--prescan', action='store_true')
+    arg_parser.add_argument('--entities', action='store_true')
+    arg_parser.add_argument('--result_transport', type=str, choices=['pickle', 'packed', 'shared_memory'], default='pickle')
     args = arg_parser.parse_args()
 
     CONFIG_FILE = args.config
@@ -67,6 +1073,18 @@ if __name__ == '__main__':
         if len(ligands_parsed) == 1:
             LIGANDS = ligands_parsed[0].split(':')[1].replace('{', '').replace('}', '').split()
 
+        contact_cutoff_parsed = re.findall(r'contact_cutoff:.*\n', config_file_content)
+        if len(contact_cutoff_parsed) == 1:
+            CONTACT_CUTOFF = float(contact_cutoff_parsed[0].split(':')[1].strip())
+
+        cutoffs_parsed = re.findall(r'cutoffs: *\{[0-9. \n]*\}', config_file_content)
+        if len(cutoffs_parsed) == 1:
+            CUTOFFS = sorted(set(map(float, cutoffs_parsed[0].split(':')[1].replace('{', '').replace('}', '').split())))
+
+        pfam_url_parsed = re.findall(r'pfam_url:.*\n', config_file_content)
+        if len(pfam_url_parsed) == 1:
+            PFAM_SERVER = pfam_url_parsed[0].split(':', 1)[1].strip().rstrip('/')
+
         log_file_path = re.findall(r'log_file:.*\n', config_file_content)
         if len(log_file_path) == 1:
             LOG_FILE = log_file_path[0].split(':')[1].strip()
@@ -83,6 +1101,14 @@ if __name__ == '__main__':
         if len(log_file_path) == 1:
             WHERE_LIGAND_FILE = where_ligand_file[0].split(':')[1].strip()
 
+        contacts_file = re.findall(r'contacts_file:.*\n', config_file_content)
+        if len(contacts_file) == 1:
+            CONTACTS_FILE = contacts_file[0].split(':')[1].strip()
+
+        contacts_database = re.findall(r'contacts_database:.*\n', config_file_content)
+        if len(contacts_database) == 1:
+            CONTACTS_DATABASE = contacts_database[0].split(':')[1].strip()
+
     except:
         print(f'Config file: {CONFIG_FILE} not found.')
 
@@ -95,150 +1121,238 @@ if __name__ == '__main__':
         print(f'GENERAL_STATISTICS_FILE: {GENERAL_STATISTICS_FILE}')
         print(f'MATCHED_STATISTICS_FILE: {MATCHED_STATISTICS_FILE}')
         print(f'WHERE_LIGAND_FILE: {WHERE_LIGAND_FILE}')
+        if CONTACTS_FILE != None:
+            print(f'CONTACTS_FILE: {CONTACTS_FILE}')
+        if CONTACTS_DATABASE != None:
+            print(f'CONTACTS_DATABASE: {CONTACTS_DATABASE}')
         print(f'LIGANDS: {LIGANDS}')
+        print(f'CONTACT_CUTOFF: {CONTACT_CUTOFF}')
+        if CUTOFFS:
+            print(f'CUTOFFS: {CUTOFFS}')
+        print(f'PFAM_SERVER: {PFAM_SERVER}')
         
         PDB_FILES_LIST =  glob.glob(f'{PDB_DIRECTORY_PATH}/*.pdb')
 
+        # Pliki skompresowane oraz mmCIF dołączane są po plikach PDB (struktura o tym samym PDB ID wczytywana jest tylko raz).
+        structure_IDs = set(get_structure_ID(pdb_file_path) for pdb_file_path in PDB_FILES_LIST)
+        for pattern in ('*.pdb.gz', '*.cif', '*.cif.gz'):
+            for pdb_file_path in glob.glob(f'{PDB_DIRECTORY_PATH}/{pattern}'):
+                if get_structure_ID(pdb_file_path) not in structure_IDs:
+                    structure_IDs.add(get_structure_ID(pdb_file_path))
+                    PDB_FILES_LIST.append(pdb_file_path)
+
         BATCH_SIZE = args.batch_s
         if BATCH_SIZE == None or BATCH_SIZE > len(PDB_FILES_LIST):
             BATCH_SIZE = len(PDB_FILES_LIST)
 
+        # Pliki wynikowe otwierane są z dużym buforem zapisu; rozszerzenie .gz lub .zst włącza kompresję.
+        WRITE_BUFFER_SIZE = max(args.write_buffer_kb, 4) * 1024
+
         if LOG_FILE != None:
-            result_file = open(LOG_FILE, 'w')
+            result_file = open_output_file(LOG_FILE, WRITE_BUFFER_SIZE)
+
+        contacts_writer = Contacts_writer(CONTACTS_FILE, WRITE_BUFFER_SIZE) if CONTACTS_FILE != None else None
+
+        contacts_database = None
+        if CONTACTS_DATABASE != None:
+            contacts_database = Contacts_database(CONTACTS_DATABASE, create=True)
+            contacts_database.set_parameters(LIGANDS, CONTACT_CUTOFF, CUTOFFS)
 
         skipped_pdb_files = []
+        irrelevant_pdb_files = []
+
+        statistics = Statistics_accumulator()
+        CUTOFF_STATISTICS = {extra_cutoff: Statistics_accumulator() for extra_cutoff in CUTOFFS}
 
-        all_domains_statistics : list[Pfam_domain] = []
-        matched_domains_statistics = []
-        matched_domains_statistics_detailed = []
-        where_ligand : list[tuple[str, str, int, str, int, str]] = []             #pfam_id, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name
+        # Pamięć podręczna architektur domenowych indeksowana numerem dostępu UniProt (pliki w dawnym formacie zostają do niej przeniesione).
+        # Pamięć podręczna procesu głównego jest pamięcią procesu (get_Pfam_cache) - procesy robocze tworzą własne przy inicjalizacji (--workers).
+        pfam_cache_limits = (
+            int(args.pfam_cache_mb * 2 ** 20) if args.pfam_cache_mb != None else None,
+            args.pfam_cache_days * 86400 if args.pfam_cache_days != None else None)
+        pfam_cache = get_Pfam_cache(XML_DIRECTORY_PATH, PFAM_SERVER, *pfam_cache_limits)
+
+        imported = pfam_cache.import_legacy_files()
+        if imported:
+            print(Colors.YELLOW + f'Imported {imported} UniProt accessions into the Pfam cache' + Colors.END)
+
+        # Pomiar etapów (--profile): etapy całego przebiegu (pobieranie wstępne) oraz osobne profilery kolejnych struktur.
+        run_profiler = Stage_profiler(args.profile != None, args.profile_cprofile, args.profile_tracemalloc)
+        PROFILES : list[tuple[str, str, Stage_profiler]] = []
+
+        analysis = partial(analyze_structure, ligands=LIGANDS, pfam_cache=None, cutoff=CONTACT_CUTOFF, records_cache=not args.no_records_cache, profiler=run_profiler,
+            cutoffs=CUTOFFS, contact_distances=CONTACTS_FILE != None, prescan=args.prescan, entities=args.entities, xml_directory=XML_DIRECTORY_PATH,
+            pfam_url=PFAM_SERVER)
+
+        # Parametry wyszukiwania kontaktów, od których zależą zapisane wyniki struktur (punkty kontrolne, indeks wyników).
+        search_parameters = (CONTACT_CUTOFF, tuple(CUTOFFS), CONTACTS_FILE != None, args.prescan)
+        batch_files = PDB_FILES_LIST[: max(BATCH_SIZE, 0)]
+
+        # Punkty kontrolne: wyniki zapisywane są po każdej strukturze, a przy --resume struktury przeanalizowane wcześniej są pomijane.
+        checkpoint = None
+        stored_results : dict[str, Structure_result] = {}
+        if args.checkpoint != None or args.resume:
+            checkpoint = Checkpoint_store(args.checkpoint if args.checkpoint != None else 'find_domains.checkpoint', LIGANDS, search_parameters)
+
+            if args.resume:
+                if not checkpoint.load():
+                    print(Colors.RED + f'Checkpoint file: {checkpoint.file_path} was created for different ligands or contact cutoff' + Colors.END)
+                    sys.exit(1)
+
+                stored_results = {pdb_file_path: checkpoint.RESULTS[pdb_file_path] for pdb_file_path in batch_files if pdb_file_path in checkpoint.RESULTS}
+                print(Colors.YELLOW + f'Resumed {len(stored_results)} structures from checkpoint: {checkpoint.file_path}' + Colors.END)
+
+            checkpoint.open(args.resume)
+
+        # Indeks wyników: ponownie analizowane są wyłącznie nowe lub zmienione pliki oraz struktury zawierające dodane lub usunięte ligandy.
+        result_index = None
+        indexed_files : set[str] = set()
+        if args.result_index != None:
+            result_index = Result_index(args.result_index, pfam_cache)
+            for pdb_file_path in batch_files:
+                if pdb_file_path not in stored_results:
+                    result = result_index.get_result(pdb_file_path, LIGANDS, search_parameters)
+                    if result != None:
+                        stored_results[pdb_file_path] = result
+                        indexed_files.add(pdb_file_path)
+
+            print(Colors.YELLOW + f'Reused {len(indexed_files)} structures from result index: {result_index.file_path}' + Colors.END)
+
+        pending_files = [pdb_file_path for pdb_file_path in batch_files if pdb_file_path not in stored_results]
+
+        # Współbieżne pobranie brakujących architektur domenowych (każdy numer dostępu UniProt jednokrotnie) przed rozpoczęciem analizy.
+        # Przy --prescan pobierane są wyłącznie architektury struktur zawierających rekordy HETATM ligandów - wyznaczone nazwy przekazywane są do analizy.
+        HETERO_NAMES : dict[str, frozenset[str]] = {}                                    #pdb_file_path -> nazwy grup HETATM
+        if args.fetch_workers > 0:
+            with run_profiler.stage('prefetch'):
+                prefetch_files = pending_files
+                if args.prescan:
+                    HETERO_NAMES = {pdb_file_path: get_hetero_names(pdb_file_path, not args.no_records_cache) for pdb_file_path in pending_files}
+                    prefetch_files = [pdb_file_path for pdb_file_path in pending_files if not HETERO_NAMES[pdb_file_path].isdisjoint(LIGANDS)]
+                (fetched, failed) = prefetch_Pfam_data(prefetch_files, pfam_cache, args.fetch_workers, args.fetch_retries, 0.5, args.fetch_timeout)
+            run_profiler.COUNTS['network_fetches'] += fetched
+            if fetched or failed:
+                print(Colors.YELLOW + f'Fetched domain information for {fetched} UniProt accessions ({failed} failed)' + Colors.END)
 
         # ----------------------------------------------------------------------------------------------------------------------
         # Główna pętla skryptu analizującego. Poniższe procedury zostają wykonane dla każdej struktury ze zbioru.
+        # Przy --workers N struktury analizowane są w N procesach, a wyniki scalane są w procesie głównym w kolejności plików.
         # ----------------------------------------------------------------------------------------------------------------------
-        for (counter, pdb_file_path) in enumerate(PDB_FILES_LIST):
-            if counter > BATCH_SIZE - 1:
-                break
+        tasks = [(pdb_file_path, HETERO_NAMES.get(pdb_file_path)) for pdb_file_path in pending_files]
+        pool = None
+        if args.workers != None and args.workers > 1:
+            pool = multiprocessing.Pool(args.workers, initializer=get_Pfam_cache, initargs=(XML_DIRECTORY_PATH, PFAM_SERVER) + pfam_cache_limits)
+            # Wyniki przesyłane są jako obiekty (pickle) lub - przy --result_transport packed / shared_memory - w postaci spakowanej (Result_transport).
+            if args.result_transport == 'pickle':
+                results = pool.imap(partial(analyze_task, analysis=analysis), tasks)
+            else:
+                transport = Result_transport(args.result_transport == 'shared_memory')
+                results = map(transport.unpack, pool.imap(partial(analyze_and_pack, analysis=analysis, transport=transport), tasks))
+        else:
+            results = map(partial(analyze_task, analysis=analysis), tasks)
+
+        for (counter, result) in enumerate(merge_checkpoint_results(batch_files, stored_results, results)):
+            profiler = result.PROFILE if result.PROFILE != None else run_profiler.new()
 
-            # Wywołania funkcji z modułu bioinf_tools
-            molecule = parse_PDB_file(pdb_file_path, LIGANDS)
-            molecule.collect_data_from_Pfam(XML_DIRECTORY_PATH)
-
-            # Sprawdzenie poprawności wczytanych danych, kontynuacja tylko w przypadku braku błędów.
-            if molecule.data_correctnes_flag == True:
-                all_domains = molecule.PFAM_DOMAINS
-                ligands_environment = molecule.get_ligands_environment()
-                ligands_binding_domains = molecule.get_ligands_binding_domains()
-                ligands_binding_domains_detailed = molecule.get_ligands_binding_domains_detailed()
-                
-                # Wykonanie tylko jeżeli istnieje potrzeba zapisu danych o składzie aminokwasowym miejsc wiązania wskazanych ligandów w kontekście domen.
-                if WHERE_LIGAND_FILE != None:
-                    for (ligand, residue, chain_name, pfam_domain) in ligands_environment:
-                        if pfam_domain != None:
-                            where_ligand.append( (
-                                pfam_domain.pfam_id,
-                                ligand.residue_name,
-                                ligand.residue_sequence_number,
-                                residue.residue_name,
-                                residue.residue_sequence_number,
-                                chain_name
-                            ) )
-                
-                all_domains_statistics += [(domain.pfam_accession, domain.pfam_id) for domain in all_domains]
-                matched_domains_statistics += [(domain.pfam_accession, domain.pfam_id, ligand.residue_name) for (ligand, domain) in ligands_binding_domains]
-                matched_domains_statistics_detailed += [(domain.pfam_accession, domain.pfam_id, ligand.residue_name) for (ligand, domain) in ligands_binding_domains_detailed]
+            if contacts_database != None:
+                with profiler.stage('database'):
+                    contacts_database.add_result(result, 'skipped' if result.data_correctnes_flag != True else ('done' if result.relevant else 'irrelevant'), CONTACT_CUTOFF)
+
+            if result.data_correctnes_flag == True:
+                # Wyniki struktur pominiętych (np. z powodu błędu pobierania danych Pfam) nie są zapisywane - przy wznowieniu analiza zostanie powtórzona.
+                if checkpoint != None and result.pdb_file_path not in stored_results:
+                    checkpoint.add_result(result)
+
+                if result_index != None and result.pdb_file_path not in indexed_files:
+                    result_index.add_result(result, LIGANDS, search_parameters)
+
+                # Struktury bez kontaktów ligand - białko (--prescan) wymieniane są wyłącznie na końcu pliku log.
+                if not result.relevant:
+                    irrelevant_pdb_files.append(result.pdb_file_path)
+                    print(Colors.YELLOW + 'Irrelevant: {: <32} ({})'.format(result.pdb_file_path, counter + 1) + Colors.END)
+                    if profiler.enabled:
+                        PROFILES.append( (result.pdb_file_path, result.structure_PDB_ID, profiler) )
+                    continue
+
+                # Statystyki aktualizowane są przyrostowo - wyniki pojedynczych struktur nie są przechowywane.
+                with profiler.stage('statistics'):
+                    statistics.add_result(result)
+                    for (extra_cutoff, cutoff_statistics) in CUTOFF_STATISTICS.items():
+                        cutoff_statistics.add_result(result.get_cutoff_result(extra_cutoff))
 
                 # Wykonanie jeżeli istnieje potrzeba zapisu szczegółowych danych o przetwarzanych strukturach.
                 if LOG_FILE != None:
-                    result_file.write(f'PDB_ID: {molecule.structure_PDB_ID}\n\nDOMAIN ARCHITECTURE:\n')
+                    with profiler.stage('log'):
+                        result_file.write(format_log_block(result, args.verbose))
 
-                    if all_domains:
-                        for domain in all_domains:
-                            result_file.write(f'{domain}\n')
-                    else:
-                        result_file.write(f'< no domains found >\n')
+                if contacts_writer != None:
+                    with profiler.stage('log'):
+                        contacts_writer.write_result(result)
 
-                    if args.verbose:
-                        result_file.write('\nLIGANDS ENVIRONMENT:\n')
+                print(Colors.GREEN + 'Done: {: <32} ({})'.format(result.pdb_file_path, counter + 1) + Colors.END)
 
-                        if ligands_environment:
-                            for (ligand, residue, chain_name, pfam_domain) in ligands_environment:
-                                result_file.write(f'{format_output(ligand, residue, chain_name, pfam_domain)}\n')
-                        else:
-                            result_file.write(f'< no ligands found >\n')
-                    else:
-                        result_file.write('\nMATCHED DOMAINS:\n')
+                if args.pruning_stats:
+                    print(format_pruning_statistics(result.PRUNING_STATISTICS))
 
-                        if ligands_binding_domains:
-                            for (ligand, domain) in ligands_binding_domains:
-                                result_file.write(f'{domain}    {ligand}\n')
-                        else:
-                            result_file.write(f'< no domains found >\n')
+            else:
+                skipped_pdb_files.append(result.pdb_file_path)
+                print(Colors.RED + 'Skipped: {: <32} ({})'.format(result.pdb_file_path, counter) + Colors.END)
 
-                    result_file.write('\n------------------------------------------------------------------------------------------------------------------------------------------------------\n\n')
+            if profiler.enabled:
+                PROFILES.append( (result.pdb_file_path, result.structure_PDB_ID, profiler) )
 
-                print(Colors.GREEN + 'Done: {: <32} ({})'.format(pdb_file_path, counter + 1) + Colors.END)
+        if pool != None:
+            pool.close()
+            pool.join()
 
-            else:
-                skipped_pdb_files.append(pdb_file_path)
-                print(Colors.RED + 'Skipped: {: <32} ({})'.format(pdb_file_path, counter) + Colors.END)
+        if checkpoint != None:
+            checkpoint.close()
+
+        if result_index != None:
+            result_index.save()
 
         if skipped_pdb_files and LOG_FILE != None:
-            result_file.write('SKIPPED PDB FILES:\n')
+            result_file.write(format_files_section('SKIPPED PDB FILES', skipped_pdb_files))
 
-            for skipped in skipped_pdb_files:
-                result_file.write(f'{skipped}\n')
+        if irrelevant_pdb_files and LOG_FILE != None:
+            result_file.write(format_files_section('IRRELEVANT PDB FILES', irrelevant_pdb_files))
 
         if LOG_FILE != None:
             result_file.close()
 
-        print(Colors.YELLOW + f'Processed {BATCH_SIZE} structures ({len(skipped_pdb_files)} skipped)' + Colors.END)
+        if contacts_writer != None:
+            contacts_writer.close()
+
+        if contacts_database != None:
+            contacts_database.close()
+
+        print(Colors.YELLOW + f'Processed {BATCH_SIZE} structures ({len(skipped_pdb_files)} skipped' + (f', {len(irrelevant_pdb_files)} irrelevant)' if args.prescan else ')') + Colors.END)
+
+        if args.pruning_stats:
+            print(Colors.YELLOW + format_pruning_statistics(statistics.PRUNING_STATISTICS) + Colors.END)
+
+        if run_profiler.enabled:
+            print(format_profile_summary(run_profiler, PROFILES, args.profile_top), end='')
+            save_profile_report(args.profile, run_profiler, PROFILES)
+            print(Colors.YELLOW + f'Profile report saved to: {args.profile}' + Colors.END)
 
         # -------------------------------------------------------------------------------------------------------------
 
         # Wykonanie jeżeli istnieje potrzeba zapisu generalnej statystyki dotyczącej wszystkich znalezionych domen białkowych. 
         if GENERAL_STATISTICS_FILE != None:
-            general_statistics = open(GENERAL_STATISTICS_FILE, 'w')
-            for ((pfam_accession, pfam_id), occurrences) in Counter(all_domains_statistics).most_common():
-                general_statistics.write('Pfam accession: {: <15} Pfam ID: {: <23} Occurrences: {: <10}\n'.format(pfam_accession, pfam_id, occurrences))
-
-            general_statistics.close()
+            save_general_statistics(GENERAL_STATISTICS_FILE, statistics, WRITE_BUFFER_SIZE)
 
         # Wykonanie jeżeli istnieje potrzeba zapisu statystyki dotyczącej wszystkich domen w obrębie których znaleziono wskazane ligandy. 
         if MATCHED_STATISTICS_FILE != None:
-            alfabetic = lambda record: ' '.join([record[0][1], record[0][2]])
-
-            matched_statistics = open(MATCHED_STATISTICS_FILE, 'w')
-            hit_number = [number for ((_, _, _), number) in sorted(Counter(matched_domains_statistics_detailed).items(), key=alfabetic)]
-            for (((pfam_accession, pfam_id, ligand_name), occurrences), number) in zip(sorted(Counter(matched_domains_statistics).items(), key=alfabetic), hit_number):
-                matched_statistics.write('Pfam accession: {: <15} Pfam ID: {: <23} Ligand name: {: <10} Occurrences: {: <10} Molecule/domain: {: <10}\n'
-                    .format(pfam_accession, pfam_id, ligand_name, occurrences, round(number / occurrences, 2)))
-
-            matched_statistics.close()
+            save_matched_statistics(MATCHED_STATISTICS_FILE, statistics, WRITE_BUFFER_SIZE)
         
         # Wykonanie tylko jeżeli istnieje potrzeba zapisu danych o składzie aminokwasowym miejsc wiązania wskazanych ligandów w kontekście domen.
         if WHERE_LIGAND_FILE != None:
-            def first(record):
-                return record[0]
-
-                                        #pfam_id, ligand, residues
-            residue_statistics : list[tuple[str, str, list[str]]] = []
-            residue_statistics_quick_compare : list[tuple[str, str]] = []
-            where_ligand.sort(key=first)
-                #pfam_id, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name
-            for (pfam_id, ligand_name, _, res_name, _, _) in where_ligand:
-                try:
-                    index = residue_statistics_quick_compare.index( (pfam_id, ligand_name) )
-                    if res_name not in residue_statistics[index][2]:
-                        residue_statistics[index][2].append(res_name)
-                except:
-                    residue_statistics_quick_compare.append( (pfam_id, ligand_name) )
-                    residue_statistics.append( (pfam_id, ligand_name, [res_name]) )
-
-            where_ligand_statistics = open(WHERE_LIGAND_FILE, 'w')
-
-            for (pfam_id, ligand_name, res_list) in residue_statistics:
-                where_ligand_statistics.write('{: <23} {: <4}    [{}]\n'.format(pfam_id, ligand_name, ' '.join(sorted(res_list))))
-
-            where_ligand_statistics.close()
+            save_where_ligand_statistics(WHERE_LIGAND_FILE, statistics, WRITE_BUFFER_SIZE)
+
+        # Statystyki dla dodatkowych odległości kontaktu (config: cutoffs) - pliki {nazwa}_{cutoff}{rozszerzenie}.
+        for (extra_cutoff, cutoff_statistics) in CUTOFF_STATISTICS.items():
+            if MATCHED_STATISTICS_FILE != None:
+                save_matched_statistics(get_cutoff_file_path(MATCHED_STATISTICS_FILE, extra_cutoff), cutoff_statistics, WRITE_BUFFER_SIZE)
+            if WHERE_LIGAND_FILE != None:
+                save_where_ligand_statistics(get_cutoff_file_path(WHERE_LIGAND_FILE, extra_cutoff), cutoff_statistics, WRITE_BUFFER_SIZE)
 
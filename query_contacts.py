@@ -0,0 +1,112 @@
+#!/usr/bin/python
+
+import argparse
+import csv
+import sys
+import time
+from bioinf_tools import *
+from find_domains import Contacts_database, Statistics_accumulator, format_files_section, format_log_block, get_cutoff_file_path, save_general_statistics, \
+    save_matched_statistics, save_where_ligand_statistics
+
+
+# Funkcja pomocnicza - odtworzenie plików log i statystyk z bazy wyników (bez wczytywania plików PDB). Wynik jest identyczny jak pliki zapisane przez find_domains.py.
+def regenerate_reports(database : Contacts_database, args, buffer_size : int = 2 ** 20) -> int:
+    statistics = Statistics_accumulator()
+    CUTOFF_STATISTICS = {extra_cutoff: Statistics_accumulator() for extra_cutoff in database.get_parameters()['cutoffs']}
+    PDB_FILES : dict[str, list[str]] = {'skipped': [], 'irrelevant': []}
+    structures_number = 0
+
+    result_file = open_output_file(args.log_file, buffer_size) if args.log_file != None else None
+
+    for (status, result) in database.get_results():
+        structures_number += 1
+        if status != 'done':
+            PDB_FILES[status].append(result.pdb_file_path)
+            continue
+
+        statistics.add_result(result)
+        for (extra_cutoff, cutoff_statistics) in CUTOFF_STATISTICS.items():
+            cutoff_statistics.add_result(result.get_cutoff_result(extra_cutoff))
+
+        if result_file != None:
+            result_file.write(format_log_block(result, args.verbose))
+
+    if result_file != None:
+        if PDB_FILES['skipped']:
+            result_file.write(format_files_section('SKIPPED PDB FILES', PDB_FILES['skipped']))
+        if PDB_FILES['irrelevant']:
+            result_file.write(format_files_section('IRRELEVANT PDB FILES', PDB_FILES['irrelevant']))
+        result_file.close()
+
+    if args.general_statistics_file != None:
+        save_general_statistics(args.general_statistics_file, statistics, buffer_size)
+
+    if args.matched_statistics_file != None:
+        save_matched_statistics(args.matched_statistics_file, statistics, buffer_size)
+
+    if args.where_ligand_file != None:
+        save_where_ligand_statistics(args.where_ligand_file, statistics, buffer_size)
+
+    for (extra_cutoff, cutoff_statistics) in CUTOFF_STATISTICS.items():
+        if args.matched_statistics_file != None:
+            save_matched_statistics(get_cutoff_file_path(args.matched_statistics_file, extra_cutoff), cutoff_statistics, buffer_size)
+        if args.where_ligand_file != None:
+            save_where_ligand_statistics(get_cutoff_file_path(args.where_ligand_file, extra_cutoff), cutoff_statistics, buffer_size)
+
+    return structures_number
+
+
+# Funkcja pomocnicza - wypisanie wyników zapytania: tabela o stałej szerokości kolumn, CSV (--csv) lub lista PDB ID (--structures).
+def print_query_results(ROWS : list[tuple], args):
+    if args.structures:
+        for pdb_id in dict.fromkeys(row[0] for row in ROWS):
+            print(pdb_id)
+        return
+
+    if args.csv:
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(Contacts_database.QUERY_FIELDS)
+        writer.writerows(ROWS)
+        return
+
+    for (pdb_id, _, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name, pfam_accession, pfam_id, start, end, distance, _, _) in ROWS:
+        line = '{: <6} Ligand -> {} {: <8} Residue -> {} {: <4} {: <8}'.format(pdb_id, ligand_name, ligand_seq_number, res_name, res_seq_number, chain_name)
+        if pfam_accession != None:
+            line += ' Pfam domain -> {: <10} {: <23} ({: <5} - {: >5})'.format(pfam_accession, pfam_id, start, end)
+        if distance != None:
+            line += ' {:.3f} A'.format(distance)
+        print(line)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('database', type=str)
+    arg_parser.add_argument('--ligand', type=str)
+    arg_parser.add_argument('--pfam', type=str)
+    arg_parser.add_argument('--pdb_id', type=str)
+    arg_parser.add_argument('--chain', type=str)
+    arg_parser.add_argument('--residue', type=str)
+    arg_parser.add_argument('--cutoff', type=float)
+    arg_parser.add_argument('--structures', action='store_true')
+    arg_parser.add_argument('--csv', action='store_true')
+    arg_parser.add_argument('--log_file', type=str)
+    arg_parser.add_argument('--general_statistics_file', type=str)
+    arg_parser.add_argument('--matched_statistics_file', type=str)
+    arg_parser.add_argument('--where_ligand_file', type=str)
+    arg_parser.add_argument('--verbose', action='store_true')
+    args = arg_parser.parse_args()
+
+    try:
+        database = Contacts_database(args.database)
+    except ValueError:
+        sys.exit(1)
+
+    # Odtworzenie plików wynikowych - jeżeli wskazano którykolwiek z nich; w przeciwnym razie wyszukiwanie kontaktów.
+    if any(file_path != None for file_path in (args.log_file, args.general_statistics_file, args.matched_statistics_file, args.where_ligand_file)):
+        start = time.perf_counter()
+        structures_number = regenerate_reports(database, args)
+        print(Colors.GREEN + f'Reports regenerated from {structures_number} structures in {time.perf_counter() - start:.2f} s' + Colors.END)
+    else:
+        print_query_results(database.query(args.ligand, args.pfam, args.pdb_id, args.chain, args.residue, args.cutoff), args)
+
+    database.close(create_indices=False)